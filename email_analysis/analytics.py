@@ -0,0 +1,209 @@
+import sqlite3
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+
+import doc_store
+from email_processor import parse_email_date
+
+# Kinds of aggregate kept in `agg_counts`
+AGGREGATE_KINDS = ("domain", "sender", "recipient", "day")
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Create the aggregates table (one row per kind/key) and its top-k index."""
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS agg_counts (
+               kind  TEXT NOT NULL,
+               key   TEXT NOT NULL,
+               count INTEGER NOT NULL,
+               PRIMARY KEY (kind, key)
+           ) WITHOUT ROWID"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agg_kind_count ON agg_counts (kind, count DESC)")
+
+    # address -> email rows, for exact "emails from x@y.com / gmail.com" lookups
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS email_addresses (
+               email_id TEXT NOT NULL,
+               role     TEXT NOT NULL,
+               address  TEXT NOT NULL,
+               domain   TEXT NOT NULL
+           )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_addr_address ON email_addresses (address)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_addr_domain ON email_addresses (domain)")
+
+
+def _address(value: Any) -> str:
+    text = str(value or "").strip().lower()
+    return text if "@" in text else ""
+
+
+def extract_aggregate_keys(metadata: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Return the (kind, key) pairs one email contributes to the aggregates."""
+    keys = []
+    sender = _address(metadata.get("from")) or _address(metadata.get("email"))
+    if sender:
+        keys.append(("sender", sender))
+        keys.append(("domain", sender.split("@")[-1]))
+
+    recipient = _address(metadata.get("to"))
+    if recipient:
+        keys.append(("recipient", recipient))
+
+    parsed = parse_email_date(metadata.get("date"))
+    if parsed is not None:
+        keys.append(("day", parsed.strftime("%Y-%m-%d")))
+    return keys
+
+
+def update_aggregates(conn: sqlite3.Connection, metadatas: List[Dict[str, Any]], sign: int = 1):
+    """
+    Fold `metadatas` into the aggregates using the caller's connection, so the
+    counts commit (or roll back) together with the email rows. `sign=-1` removes them.
+    """
+    counts = Counter()
+    for metadata in metadatas:
+        counts.update(extract_aggregate_keys(metadata))
+    counts[("total", "emails")] += len(metadatas)
+
+    conn.executemany(
+        """INSERT INTO agg_counts (kind, key, count) VALUES (?, ?, ?)
+           ON CONFLICT (kind, key) DO UPDATE SET count = count + excluded.count""",
+        [(kind, key, sign * n) for (kind, key), n in counts.items()],
+    )
+    if sign < 0:
+        conn.execute("DELETE FROM agg_counts WHERE count <= 0")
+
+
+def update_address_index(conn: sqlite3.Connection, ids: List[str], metadatas: List[Dict[str, Any]]):
+    """Record the sender and recipient address of each email for indexed lookups."""
+    rows = []
+    for email_id, metadata in zip(ids, metadatas):
+        sender = _address(metadata.get("from")) or _address(metadata.get("email"))
+        recipient = _address(metadata.get("to"))
+        if sender:
+            rows.append((email_id, "sender", sender, sender.split("@")[-1]))
+        if recipient:
+            rows.append((email_id, "recipient", recipient, recipient.split("@")[-1]))
+    conn.executemany(
+        "INSERT INTO email_addresses (email_id, role, address, domain) VALUES (?, ?, ?, ?)", rows
+    )
+
+
+def remove_from_address_index(conn: sqlite3.Connection, ids: List[str]):
+    conn.executemany("DELETE FROM email_addresses WHERE email_id = ?", [(email_id,) for email_id in ids])
+
+
+def clear_exact_indexes(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM agg_counts")
+    conn.execute("DELETE FROM email_addresses")
+
+
+def rebuild_exact_indexes(conn: sqlite3.Connection):
+    """Recompute aggregates and the address index from the stored metadata."""
+    clear_exact_indexes(conn)
+    ids, batch = [], []
+    for email_id, metadata_json in conn.execute("SELECT id, metadata_json FROM emails WHERE deleted = 0").fetchall():
+        ids.append(email_id)
+        batch.append(doc_store.decode_metadata(conn, metadata_json))
+        if len(batch) >= 5000:
+            update_aggregates(conn, batch)
+            update_address_index(conn, ids, batch)
+            ids, batch = [], []
+    if batch:
+        update_aggregates(conn, batch)
+        update_address_index(conn, ids, batch)
+
+
+def backfill_exact_indexes(conn: sqlite3.Connection):
+    """Build the exact indexes once for collections created before they existed."""
+    has_emails = conn.execute("SELECT 1 FROM emails WHERE deleted = 0 LIMIT 1").fetchone()
+    has_totals = conn.execute("SELECT 1 FROM agg_counts WHERE kind = 'total'").fetchone()
+    has_addresses = conn.execute("SELECT 1 FROM email_addresses LIMIT 1").fetchone()
+    if has_emails and not (has_totals and has_addresses):
+        rebuild_exact_indexes(conn)
+
+
+class AnalyticsEngine:
+    """Answer counts, distinct and top-k questions from the incrementally maintained aggregates."""
+
+    def __init__(self, vector_db):
+        self.vector_db = vector_db
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self.vector_db._conn() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def total_emails(self) -> int:
+        rows = self._query("SELECT count FROM agg_counts WHERE kind = 'total' AND key = 'emails'")
+        return rows[0][0] if rows else 0
+
+    def distinct(self, kind: str) -> int:
+        """Number of distinct keys of `kind` (e.g. unique domains)."""
+        return self._query("SELECT COUNT(*) FROM agg_counts WHERE kind = ?", (kind,))[0][0]
+
+    def count(self, kind: str, key: str) -> int:
+        """Emails counted under one key, e.g. count("domain", "gmail.com")."""
+        rows = self._query("SELECT count FROM agg_counts WHERE kind = ? AND key = ?", (kind, key.lower()))
+        return rows[0][0] if rows else 0
+
+    def top(self, kind: str, k: int = 10) -> List[Tuple[str, int]]:
+        """The `k` most frequent keys of `kind` with their counts."""
+        return self._query(
+            "SELECT key, count FROM agg_counts WHERE kind = ? ORDER BY count DESC, key LIMIT ?",
+            (kind, k),
+        )
+
+    def per_day(self, start: Optional[str] = None, end: Optional[str] = None) -> List[Tuple[str, int]]:
+        """Emails per day (YYYY-MM-DD keys), optionally bounded inclusively by `start`/`end`."""
+        sql = "SELECT key, count FROM agg_counts WHERE kind = 'day'"
+        params = []
+        if start:
+            sql += " AND key >= ?"
+            params.append(start)
+        if end:
+            sql += " AND key <= ?"
+            params.append(end)
+        return self._query(sql + " ORDER BY key", tuple(params))
+
+    def overview(self, k: int = 5) -> Dict[str, Any]:
+        """Headline numbers for the Analytics tab and dataset summaries."""
+        days = self._query("SELECT MIN(key), MAX(key) FROM agg_counts WHERE kind = 'day'")[0]
+        return {
+            "total": self.total_emails(),
+            "distinct_domains": self.distinct("domain"),
+            "distinct_senders": self.distinct("sender"),
+            "distinct_recipients": self.distinct("recipient"),
+            "top_domains": self.top("domain", k),
+            "top_senders": self.top("sender", k),
+            "first_day": days[0],
+            "last_day": days[1],
+        }
+
+    def emails_for(self, address: str = "", domain: str = "", limit: int = 10) -> List[str]:
+        """Ids of emails sent from or to `address`, or involving `domain` (indexed lookups)."""
+        if address:
+            sql, value = "SELECT DISTINCT email_id FROM email_addresses WHERE address = ? LIMIT ?", address
+        else:
+            sql, value = "SELECT DISTINCT email_id FROM email_addresses WHERE domain = ? LIMIT ?", domain
+        return [row[0] for row in self._query(sql, (value.lower(), limit))]
+
+    def count_for(self, address: str = "", domain: str = "") -> int:
+        """Number of emails sent from or to `address`, or involving `domain`."""
+        column, value = ("address", address) if address else ("domain", domain)
+        return self._query(
+            f"SELECT COUNT(DISTINCT email_id) FROM email_addresses WHERE {column} = ?", (value.lower(),)
+        )[0][0]
+
+    def sample_emails(self, n: int = 3) -> List[Dict[str, Any]]:
+        """A few stored emails (metadata plus text_content) for LLM prompts."""
+        samples = []
+        with self.vector_db._conn() as conn:
+            for document, metadata_json in conn.execute(
+                "SELECT document, metadata_json FROM emails WHERE deleted = 0 LIMIT ?", (n,)
+            ).fetchall():
+                document, sample = doc_store.decode_row(conn, document, metadata_json)
+                sample["text_content"] = document
+                samples.append(sample)
+        return samples
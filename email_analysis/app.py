@@ -4,10 +4,15 @@ import os
 from typing import List, Dict, Any
 import time
 
-from email_processor import EmailProcessor
-from vector_db_manager import VectorDBManager
+from ingest_jobs import get_job_registry, STAGES
+from analytics import AnalyticsEngine
+from corpus_summarizer import CorpusSummarizer
+from query_router import QueryRouter, PATH_VECTOR_LLM, PATH_VECTOR_CACHE
+from response_cache import ResponseCache
+from vector_db_manager import get_shared_manager
 from llm_handler import LLMHandler
 from config import PAGE_TITLE, PAGE_ICON, SUPPORTED_FORMATS, MAX_FILE_SIZE,VECTOR_DB_PATH
+from config import RESPONSE_CACHE_ENABLED
 
 # Page configuration
 st.set_page_config(
@@ -26,16 +31,29 @@ if 'emails_loaded' not in st.session_state:
     st.session_state.emails_loaded = False
 if 'email_count' not in st.session_state:
     st.session_state.email_count = 0
+if 'ingest_job_id' not in st.session_state:
+    st.session_state.ingest_job_id = None
+
+@st.cache_resource
+def get_llm_handler():
+    """One LLM handler (and HTTP client) for every session in this process."""
+    return LLMHandler()
+
+@st.cache_resource
+def get_response_cache(db_dir):
+    """Shared LLM answer cache, stored next to the collection it answers for."""
+    return ResponseCache(os.path.join(db_dir, "response_cache.sqlite"))
 
 def initialize_components():
     """Initialize vector database and LLM handler"""
     try:
         if st.session_state.vector_db is None:
-            st.session_state.vector_db = VectorDBManager()
-            
+            # process-wide: sessions share one embedding model and one FAISS index
+            st.session_state.vector_db = get_shared_manager()
+
         
         if st.session_state.llm_handler is None:
-            st.session_state.llm_handler = LLMHandler()
+            st.session_state.llm_handler = get_llm_handler()
         
         if "uploader_key" not in st.session_state:
             st.session_state.uploader_key = 0
@@ -44,46 +62,65 @@ def initialize_components():
         st.error(f"Error initializing components: {str(e)}")
         return False
 
-def process_uploaded_file(uploaded_files):
-    """Process multiple uploaded email files"""
-    all_valid_emails = []
-    total_emails = 0
-
-    for uploaded_file in uploaded_files:
-        temp_file_path = None
+def render_ingest_job(job):
+    """Show progress for a background ingestion job; polled instead of blocking the script run."""
+    registry = get_job_registry()
+    st.subheader(f"⚙️ Ingestion job `{job.job_id}` — {job.status}")
+    st.caption(", ".join(f["name"] for f in job.files))
 
-        try:
-            if uploaded_file is None or uploaded_file.name.strip() == "":
-                continue  # Skip invalid file
+    for stage in STAGES:
+        progress = job.progress[stage]
+        label = f"{stage.title()}: {progress['done']:,} / {progress['total']:,}"
+        if stage == "spool":
+            label = f"Spool: {progress['done'] / (1024 * 1024):.1f} / {progress['total'] / (1024 * 1024):.1f} MB"
+        st.progress(job.fraction(stage), text=label)
 
-            # Save uploaded file temporarily
-            temp_file_path = f"temp_{uploaded_file.name}"
-            with open(temp_file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Total Emails Found", f"{job.total_emails:,}")
+    with col2:
+        st.metric("Valid Emails", f"{job.valid_count:,}")
+    with col3:
+        st.metric("Indexed", f"{job.indexed:,}")
+    with col4:
+        st.metric("Records/sec", f"{job.records_per_sec:,.1f}")
 
-            # Determine file type
-            file_extension = os.path.splitext(uploaded_file.name)[1].lower()
-            file_type = file_extension[1:]
+    if job.is_active:
+        if st.button("⏹️ Cancel", key=f"cancel_{job.job_id}"):
+            registry.cancel(job.job_id)
+            st.rerun()
+    elif job.status in ("cancelled", "failed", "interrupted"):
+        if job.error:
+            st.error(f"❌ {job.error}")
+        if st.button("▶️ Resume", key=f"resume_{job.job_id}"):
+            registry.resume(job.job_id, st.session_state.vector_db, st.session_state.llm_handler)
+            st.rerun()
+    elif job.status == "done":
+        if st.session_state.get("finished_job_id") != job.job_id:
+            # full rerun once so the sidebar picks up the new count and polling stops
+            st.session_state.finished_job_id = job.job_id
+            st.rerun()
+        if job.indexed == 0:
+            st.error("❌ No valid emails found in the file")
+        else:
+            st.success(f"🎉 Successfully loaded {job.indexed:,} emails into vector database!")
 
-            # Process emails
-            processor = EmailProcessor()
-            emails = processor.load_emails_from_file(temp_file_path, file_type)
+        # Show sample data
+        if job.sample:
+            st.subheader("📋 Sample Data Preview")
+            sample_df = pd.DataFrame(job.sample)
+            st.dataframe(sample_df, use_container_width=True)
+        if job.summary:
+            st.subheader("📊 Dataset Summary")
+            st.markdown(job.summary)
 
-            # Validate emails
-            valid_emails = processor.validate_emails(emails)
+    if not job.is_active and st.button("Dismiss", key=f"dismiss_{job.job_id}"):
+        if job.status == "done":
+            registry.remove(job.job_id)
+        st.session_state.ingest_job_id = None
+        st.rerun()
 
-            # Add to totals
-            all_valid_emails.extend(valid_emails)
-            total_emails += len(emails)
 
-        except Exception as e:
-            print(f"❌ Error processing file {uploaded_file.name}: {e}")
-
-        finally:
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-
-    return all_valid_emails, total_emails, len(all_valid_emails)
 def get_directory_size(directory):
     total = 0
     for dirpath, _, filenames in os.walk(directory):
@@ -193,54 +230,40 @@ def main():
             # Process file button
             if st.button("🚀 Process and Load Emails", type="primary"):
                 try:
-                    with st.spinner("Processing emails..."):
-                        # Process file
-                        valid_emails, total_emails, valid_count = process_uploaded_file(uploaded_files)
-                        
-                        # Display processing results
-                        col1, col2, col3 = st.columns(3)
-                        with col1:
-                            st.metric("Total Emails Found", total_emails)
-                        with col2:
-                            st.metric("Valid Emails", valid_count)
-                        with col3:
-                            st.metric("Success Rate", f"{(valid_count/total_emails*100):.1f}%" if total_emails > 0 else "0%")
-                        
-                        if valid_count >= 10000:
-                            st.success(f"✅ Found {valid_count:,} valid emails (meets minimum requirement of 1000+)")
-                        elif valid_count > 0:
-                            st.warning(f"⚠️ Found {valid_count} valid emails (less than 1000, but will proceed)")
-                        else:
-                            st.error("❌ No valid emails found in the file")
-                            st.stop()
-                        
-                        # Add to vector database
-                        with st.spinner("Creating vector database..."):
-                            if st.session_state.vector_db.add_emails(valid_emails):
-                                st.success(f"🎉 Successfully loaded {valid_count:,} emails into vector database!")
-                                st.session_state.emails_loaded = True
-                                st.session_state.email_count = valid_count
-                                
-                                # Show sample data
-                                if valid_emails:
-                                    st.subheader("📋 Sample Data Preview")
-                                    sample_df = pd.DataFrame(valid_emails[:5])
-                                    st.dataframe(sample_df, use_container_width=True)
-                                
-                                # Generate summary
-                                with st.spinner("Generating dataset summary..."):
-                                    summary = st.session_state.llm_handler.generate_summary(valid_emails)
-                                    st.subheader("📊 Dataset Summary")
-                                    st.markdown(summary)
-                                
-                                uploaded_files.clear()
-                                st.session_state.uploader_key += 1
-                                st.rerun()
-                            else:
-                                st.error("❌ Failed to load emails into vector database")
-                        
+                    with st.spinner("Uploading files..."):
+                        # Spool to disk and hand parsing/indexing to a background job
+                        job = get_job_registry().submit(
+                            uploaded_files, st.session_state.vector_db, st.session_state.llm_handler
+                        )
+                    st.session_state.ingest_job_id = job.job_id
+                    uploaded_files.clear()
+                    st.session_state.uploader_key += 1
+                    st.rerun()
                 except Exception as e:
                     st.error(f"Error processing file: {str(e)}")
+
+        job = get_job_registry().get(st.session_state.ingest_job_id) if st.session_state.ingest_job_id else None
+        if job is not None:
+            if hasattr(st, "fragment"):
+                # re-render just the progress panel every second while the job runs
+                st.fragment(run_every=1.0 if job.is_active else None)(render_ingest_job)(job)
+            else:
+                render_ingest_job(job)
+                if job.is_active:
+                    time.sleep(1.0)
+                    st.rerun()
+
+        # Jobs left unfinished by this or an earlier process can be resumed from here
+        stalled = [j for j in get_job_registry().list_jobs()
+                   if j.status in ("cancelled", "failed", "interrupted") and j.job_id != st.session_state.ingest_job_id]
+        if stalled:
+            with st.expander(f"⏸️ Unfinished ingestion jobs ({len(stalled)})"):
+                for stalled_job in stalled:
+                    st.write(f"`{stalled_job.job_id}` — {stalled_job.status}, "
+                             f"{stalled_job.indexed:,} / {stalled_job.valid_count:,} indexed")
+                    if st.button("Show", key=f"show_{stalled_job.job_id}"):
+                        st.session_state.ingest_job_id = stalled_job.job_id
+                        st.rerun()
     
     with tab2:
         st.header("Query Your Emails")
@@ -278,31 +301,46 @@ def main():
             if query:
                 try:
                     with st.spinner("Searching emails..."):
-                        # Search vector database
-                        search_results = st.session_state.vector_db.search_emails(query, num_results)
+                        # Exact SQLite paths for lookups/counts; vector search + LLM otherwise
+                        vector_db = st.session_state.vector_db
+                        cache = get_response_cache(vector_db.db_dir) if RESPONSE_CACHE_ENABLED else None
+                        router = QueryRouter(vector_db, st.session_state.llm_handler, response_cache=cache)
+                        response = router.route(query, num_results, stream=True)
+                        search_results = response["results"]
                         
+                    if response["answer"] or search_results:
+                        # Display response
+                        st.subheader("🤖 AI Response" if response["path"] in (PATH_VECTOR_LLM, PATH_VECTOR_CACHE)
+                                     else "✅ Answer")
+                        if "answer_stream" in response:
+                            # render tokens as they arrive instead of waiting for the full answer
+                            st.write_stream(response["answer_stream"])
+                            timings = response["timings"]
+                            prompt_stats = response["prompt_stats"]
+                            st.caption(f"Served by `{response['path']}`: retrieval {response['elapsed_ms']:.0f} ms, "
+                                       f"first token {timings.get('ttft_ms', 0):.0f} ms, "
+                                       f"total {timings.get('total_ms', 0):.0f} ms, "
+                                       f"prompt ~{prompt_stats.get('prompt_tokens', 0):,} tokens "
+                                       f"({prompt_stats.get('emails_included', 0)} emails)")
+                        else:
+                            st.markdown(response["answer"])
+                            cache_note = f" ({response['cache']} cache hit)" if response.get("cache") else ""
+                            st.caption(f"Served by `{response['path']}`{cache_note} in {response['elapsed_ms']:.0f} ms")
+                        
+                        # Display search results
                         if search_results:
-                            # Generate LLM response
-                            with st.spinner("Generating response..."):
-                                response = st.session_state.llm_handler.generate_response(query, search_results)
-                            
-                            # Display response
-                            st.subheader("🤖 AI Response")
-                            st.markdown(response)
-                            
-                            # Display search results
                             st.subheader("📋 Search Results")
-                            
-                            for i, result in enumerate(search_results, 1):
-                                with st.expander(f"Result {i} (Relevance: {(1-result['score']):.2f})"):
-                                    metadata = result['metadata']
-                                    
-                                    # Display metadata in a nice format
-                                    for key, value in metadata.items():
-                                        if value and str(value).strip():
-                                            st.write(f"**{key.title()}:** {value}")
-                        else:
-                            st.warning("No results found for your query. Try rephrasing or using different keywords.")
+                        
+                        for i, result in enumerate(search_results, 1):
+                            with st.expander(f"Result {i} (Relevance: {result['score']:.2f})"):
+                                metadata = result['metadata']
+                                
+                                # Display metadata in a nice format
+                                for key, value in metadata.items():
+                                    if value and str(value).strip():
+                                        st.write(f"**{key.title()}:** {value}")
+                    else:
+                        st.warning("No results found for your query. Try rephrasing or using different keywords.")
                 
                 except Exception as e:
                     st.error(f"Error during search: {str(e)}")
@@ -323,9 +361,26 @@ def main():
             st.metric("Total Emails", f"{collection_info.get('count', 0):,}")
         with col2:
             st.metric("Database Size", f"{get_directory_size(VECTOR_DB_PATH):.2f} MB")
+            # collections written before compression was enabled keep plain-text rows until compacted
+            if st.button("Compact storage", help="Compress stored emails and reclaim free space"):
+                with st.spinner("Compacting..."):
+                    sizes = st.session_state.vector_db.compact_storage()
+                st.success(f"Metadata store: {sizes['bytes_before'] / 1e6:.1f} MB → {sizes['bytes_after'] / 1e6:.1f} MB")
         with col3:
             st.metric("Collection Name", collection_info.get('name', 'N/A'))
         
+        # Exact numbers from the aggregates kept up to date by add_emails
+        engine = AnalyticsEngine(st.session_state.vector_db)
+        overview = engine.overview(k=10)
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Unique Domains", f"{overview['distinct_domains']:,}")
+        with col2:
+            st.metric("Unique Senders", f"{overview['distinct_senders']:,}")
+        with col3:
+            st.metric("Unique Recipients", f"{overview['distinct_recipients']:,}")
+
         # Quick analytics queries
         st.subheader("📊 Quick Analytics")
         
@@ -333,22 +388,51 @@ def main():
             "How many unique domains are in the dataset?",
             "What are the most common email domains?",
             "Analyze the email patterns in this dataset",
-            "Give me statistics about this email collection"
+            "Give me statistics about this email collection",
+            "Summarize the whole dataset (clusters every email)"
         ]
         
         selected_query = st.selectbox("Choose an analytics query:", analytics_queries)
         
         if st.button("📈 Run Analytics", type="primary"):
             try:
-                with st.spinner("Running analytics..."):
-                    # Search for relevant data
-                    search_results = st.session_state.vector_db.search_emails(selected_query, 20)
-                    
-                    # Generate analytics response
-                    response = st.session_state.llm_handler.generate_response(selected_query, search_results)
-                    
-                    st.subheader("📊 Analytics Results")
-                    st.markdown(response)
+                st.subheader("📊 Analytics Results")
+                if selected_query == analytics_queries[0]:
+                    st.markdown(f"The dataset contains **{overview['distinct_domains']:,}** unique domains "
+                                f"across **{overview['total']:,}** emails.")
+                elif selected_query == analytics_queries[1]:
+                    top_df = pd.DataFrame(overview["top_domains"], columns=["Domain", "Emails"])
+                    st.dataframe(top_df, use_container_width=True, hide_index=True)
+                    st.bar_chart(top_df.set_index("Domain"))
+                elif selected_query == analytics_queries[3]:
+                    st.json({
+                        "total_emails": overview["total"],
+                        "unique_domains": overview["distinct_domains"],
+                        "unique_senders": overview["distinct_senders"],
+                        "unique_recipients": overview["distinct_recipients"],
+                        "date_range": [overview["first_day"], overview["last_day"]],
+                        "top_senders": dict(overview["top_senders"]),
+                    })
+                    per_day = engine.per_day()
+                    if per_day:
+                        st.line_chart(pd.DataFrame(per_day, columns=["Day", "Emails"]).set_index("Day"))
+                elif selected_query == analytics_queries[4]:
+                    # map-reduce over every ingest batch; batches summarized before come from the cache
+                    progress_bar = st.progress(0.0, text="Summarizing clusters...")
+                    summarizer = CorpusSummarizer(st.session_state.vector_db, st.session_state.llm_handler)
+                    summary = summarizer.summarize(
+                        lambda done, total: progress_bar.progress(done / total, text=f"Batch {done}/{total}")
+                    )
+                    progress_bar.empty()
+                    st.markdown(summary)
+                else:
+                    # pattern analysis still needs the LLM, but it reads the exact numbers
+                    timings = {}
+                    st.write_stream(st.session_state.llm_handler.generate_summary_stream(
+                        engine.sample_emails(3), stats=overview, timings=timings
+                    ))
+                    st.caption(f"First token {timings.get('ttft_ms', 0):.0f} ms, "
+                               f"total {timings.get('total_ms', 0):.0f} ms")
             
             except Exception as e:
                 st.error(f"Error running analytics: {str(e)}")
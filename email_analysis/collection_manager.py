@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Many collections (one mailbox per client) in one process.
+
+    python collection_manager.py                 # list collections under VECTOR_DB_PATH with their stats
+
+Every collection is a `VectorDBManager` in its own directory under
+VECTOR_DB_PATH. They all encode with the one SentenceTransformer that
+`load_embedding_model` caches per process; only their FAISS indexes are
+per collection. Indexes are kept resident within COLLECTION_MEMORY_BUDGET_MB:
+when opening one goes over budget, the least recently used are unloaded
+(their SQLite metadata stays open) and read back from disk on their next use.
+"""
+
+import os
+import re
+import time
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from vector_db_manager import VectorDBManager, load_embedding_model
+from config import VECTOR_DB_PATH, EMBEDDING_MODEL, COLLECTION_MEMORY_BUDGET_MB
+
+VALID_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,127}$")
+
+_shared_collections = None
+_shared_collections_lock = threading.Lock()
+
+
+def _disk_bytes(directory: str) -> int:
+    """Size of every file under `directory`, including index shards and rebuild generations."""
+    total = 0
+    for dir_path, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(dir_path, name))
+            except OSError:
+                pass  # removed by a concurrent save or rebuild
+    return total
+
+
+def get_collection_manager() -> "CollectionManager":
+    """Return the process-wide collection manager."""
+    global _shared_collections
+    with _shared_collections_lock:
+        if _shared_collections is None:
+            _shared_collections = CollectionManager()
+        return _shared_collections
+
+
+class CollectionManager:
+    """Open collections on demand and keep the most recently used indexes in memory."""
+
+    def __init__(self, db_path: str = VECTOR_DB_PATH,
+                 memory_budget_mb: float = COLLECTION_MEMORY_BUDGET_MB, **manager_options):
+        self.db_path = db_path
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.manager_options = manager_options   # passed to every VectorDBManager (chunking, ...)
+        self._collections: "OrderedDict[str, VectorDBManager]" = OrderedDict()   # least recently used first
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def list_collections(self) -> List[str]:
+        """Names of the collections on disk, open or not."""
+        if not os.path.isdir(self.db_path):
+            return []
+        return sorted(name for name in os.listdir(self.db_path)
+                      if os.path.exists(os.path.join(self.db_path, name, "meta.sqlite")))
+
+    def get(self, name: str, create: bool = True) -> Optional[VectorDBManager]:
+        """
+        The collection called `name` with its index loaded, opening (and with
+        `create`, creating) it if needed. Colder indexes are unloaded to make room.
+        """
+        if not VALID_NAME.match(name):
+            raise ValueError(f"invalid collection name: {name!r}")
+        with self._lock:
+            vector_db = self._collections.get(name)
+            if vector_db is None:
+                if not create and name not in self.list_collections():
+                    return None
+                vector_db = VectorDBManager(collection_name=name, db_path=self.db_path, **self.manager_options)
+                self._collections[name] = vector_db
+                self._stats[name] = {"hits": 0, "misses": 0, "evictions": 0, "load_seconds": 0.0}
+            self._collections.move_to_end(name)
+            stats = self._stats[name]
+            stats["last_used"] = time.time()
+            loaded = vector_db.index_loaded
+            stats["hits" if loaded else "misses"] += 1
+        if not loaded:
+            # read outside the manager lock, so other collections stay available meanwhile
+            started = time.time()
+            _ = vector_db.index
+            with self._lock:
+                if name in self._stats:
+                    self._stats[name]["load_seconds"] += time.time() - started
+        self._evict(keep=name)
+        return vector_db
+
+    def _evict(self, keep: str):
+        """Unload least recently used indexes until the resident ones fit the budget."""
+        with self._lock:
+            resident = sum(vector_db.index_memory() for vector_db in self._collections.values())
+            victims = []
+            for name, vector_db in self._collections.items():
+                if resident <= self.memory_budget:
+                    break
+                if name != keep and vector_db.index_loaded:
+                    victims.append((name, vector_db))
+                    resident -= vector_db.index_memory()
+        # unloading waits for the collection's running searches and writes
+        for name, vector_db in victims:
+            if vector_db.unload_index():
+                with self._lock:
+                    if name in self._stats:
+                        self._stats[name]["evictions"] += 1
+
+    def unload(self, name: str) -> bool:
+        with self._lock:
+            vector_db = self._collections.get(name)
+        return vector_db is not None and vector_db.unload_index()
+
+    def drop(self, name: str) -> bool:
+        """Delete a collection and its files."""
+        with self._lock:
+            vector_db = self._collections.pop(name, None)
+            self._stats.pop(name, None)
+            path = os.path.join(self.db_path, name)
+            if vector_db is None and not os.path.isdir(path):
+                return False
+            if vector_db is not None:
+                vector_db.unload_index()
+            shutil.rmtree(path, ignore_errors=True)
+            return True
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per collection: emails, vectors, resident index bytes, on-disk bytes, hit rate and evictions."""
+        with self._lock:
+            open_collections = dict(self._collections)
+            stats = {name: dict(values) for name, values in self._stats.items()}
+        report = {}
+        for name in self.list_collections():
+            vector_db = open_collections.get(name)
+            entry = stats.get(name, {"hits": 0, "misses": 0, "evictions": 0, "load_seconds": 0.0})
+            lookups = entry["hits"] + entry["misses"]
+            entry["hit_rate"] = entry["hits"] / lookups if lookups else 0.0
+            entry["open"] = vector_db is not None
+            entry["resident"] = vector_db is not None and vector_db.index_loaded
+            entry["memory_bytes"] = vector_db.index_memory() if vector_db is not None else 0
+            entry["disk_bytes"] = _disk_bytes(os.path.join(self.db_path, name))
+            if vector_db is not None:
+                info = vector_db.get_collection_info()
+                entry["count"], entry["vectors"] = info.get("count", 0), info.get("vectors", 0)
+            report[name] = entry
+        return report
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """Resident index bytes against the budget; the shared model is loaded once for all collections."""
+        with self._lock:
+            resident = sum(vector_db.index_memory() for vector_db in self._collections.values())
+            loaded = sum(vector_db.index_loaded for vector_db in self._collections.values())
+        return {"resident_bytes": resident, "budget_bytes": self.memory_budget,
+                "resident_collections": loaded, "model": EMBEDDING_MODEL}
+
+    def warm_up(self):
+        """Load the shared embedding model ahead of the first query."""
+        load_embedding_model(EMBEDDING_MODEL)
+
+
+def main():
+    manager = CollectionManager()
+    for name, entry in manager.stats().items():
+        print(f"{name}: {entry['disk_bytes'] / (1024 * 1024):.1f} MB on disk")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import os
+import tempfile
 from dotenv import load_dotenv
-import streamlit as st
 
 load_dotenv()
 
@@ -11,20 +11,131 @@ QWEN_MODEL = "qwen/qwq-32b:free"
 DEEP_SEEK_MODEL="deepseek/deepseek-chat-v3-0324:free"
 LLAMA_MODEL="meta-llama/llama-4-maverick:free"
 
-OPEN_ROUTER_API=st.secrets["OPEN_ROUTER_API"]
+
+
+def get_open_router_api():
+    """Read the OpenRouter key on demand so headless scripts never import streamlit."""
+    key = os.getenv("OPEN_ROUTER_API")
+    if key:
+        return key
+    import streamlit as st
+    return st.secrets["OPEN_ROUTER_API"]
+
+
+def __getattr__(name):
+    # keep `from config import OPEN_ROUTER_API` working without reading secrets at import time
+    if name == "OPEN_ROUTER_API":
+        return get_open_router_api()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# LLM Backend Configuration (llm_backends.py)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openrouter")   # "openrouter", "stub" or "local"
+LLM_STUB_URL = os.getenv("LLM_STUB_URL", "http://127.0.0.1:8766/v1")  # stub_llm_server.py
+LOCAL_LLM_MODEL = "local-extractive"
+LOCAL_LLM_LATENCY_MS = float(os.getenv("LOCAL_LLM_LATENCY_MS", "0"))  # simulated time to first token
+LOCAL_LLM_TOKEN_MS = float(os.getenv("LOCAL_LLM_TOKEN_MS", "0"))      # simulated delay per token
+
+# LLM Client Configuration (llm_client.py)
+OPEN_ROUTER_BASE_URL = os.getenv("OPEN_ROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+LLM_FALLBACK_MODELS = [DEEP_SEEK_MODEL, QWEN_MODEL, LLAMA_MODEL]  # hedging order
+LLM_POOL_SIZE = 20                    # pooled HTTP connections shared by all sessions
+LLM_MAX_CONCURRENCY = 8               # in-flight requests across all sessions
+LLM_RATE_PER_SEC = 5.0                # token bucket refill; 0 disables rate limiting
+LLM_RATE_BURST = 10
+LLM_MAX_RETRIES = 4                   # on 429 / 5xx / timeouts, with jittered backoff
+LLM_BACKOFF_BASE_S = 0.5
+LLM_BACKOFF_CAP_S = 20.0
+LLM_TIMEOUT_S = 60.0                  # per HTTP attempt
+LLM_DEADLINE_S = 90.0                 # per call, across retries (streams: until the response starts)
+LLM_HEDGE_DELAY_S = 8.0               # start the next fallback model after this long; 0 disables
 
 
 # Vector Database Configuration
 VECTOR_DB_PATH = "./vector_db"
 COLLECTION_NAME = "email_collection"
 
+# Collection Manager Configuration (collection_manager.py)
+COLLECTION_MEMORY_BUDGET_MB = 1024    # resident FAISS indexes across all open collections
+
+# Document Storage Configuration (doc_store.py)
+DOC_COMPRESSION = False               # True: store metadata zlib-compressed, drop rebuildable documents
+DOC_DICT_TRAIN_ROWS = 1000            # emails sampled to train the shared compression dictionary
+DOC_DICT_SIZE = 32 * 1024             # zlib uses at most a 32 KB preset dictionary
+
 # Embedding Model Configuration
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384  # lets an empty index be created before the model is loaded
+
+# Index Partitioning Configuration (partitioned_index.py)
+INDEX_PARTITION_BY = "none"           # "none": one faiss.index file; "hash": INDEX_SHARDS shards by email id;
+                                      # "segment": a new shard every INDEX_SEGMENT_VECTORS vectors;
+                                      # "time": one shard per INDEX_TIME_BUCKET_MONTHS of email dates
+INDEX_SHARDS = 4
+INDEX_SEGMENT_VECTORS = 1_000_000
+INDEX_TIME_BUCKET_MONTHS = 1          # 3 = quarters, 12 = years
+REBUILD_BATCH_SIZE = 10_000           # vectors copied (or re-embedded) per step of index_rebuild.py
+
+# Chunking Configuration (long bodies are split into windows that fit MiniLM's 256-token limit)
+CHUNKING_ENABLED = False
+CHUNK_SIZE_WORDS = 180
+CHUNK_OVERLAP_WORDS = 30
+MAX_CHUNKS_PER_EMAIL = 8
+CHUNK_SCORE_AGGREGATION = "max"  # "max" or "sum"
+
+# Near-Duplicate Configuration (near_duplicates.py)
+NEAR_DUP_ENABLED = False              # True: embed one representative per cluster of near-identical bodies
+NEAR_DUP_NUM_PERM = 128               # MinHash signature length
+NEAR_DUP_BANDS = 16                   # LSH bands (8 rows each: candidates from ~0.7 Jaccard)
+NEAR_DUP_SHINGLE_WORDS = 5
+NEAR_DUP_THRESHOLD = 0.8              # estimated Jaccard needed to link to a representative
+NEAR_DUP_MIN_WORDS = 20               # shorter bodies are always embedded
+
+# Threading Configuration (email_threads.py)
+THREAD_COLLAPSE_OVERFETCH = 3         # candidates per result searched when collapsing by thread
+
+# Search Server Configuration (search_server.py)
+SEARCH_SERVER_HOST = "127.0.0.1"
+SEARCH_SERVER_PORT = 8765
+SEARCH_BATCH_MAX_SIZE = 64
+SEARCH_BATCH_MAX_WAIT_MS = 5
+SEARCH_MAX_RESULTS = 100              # larger n_results are clamped (a batch is searched with its largest k)
+
+# LLM Context Packing Configuration (context_packer.py)
+CONTEXT_TOKEN_BUDGET = 1500           # estimated tokens of email data per prompt
+CONTEXT_MAX_BODY_TOKENS = 300         # per email, after quotes and signatures are stripped
+CONTEXT_MAX_FIELD_CHARS = 200
+
+# LLM Response Cache Configuration (response_cache.py)
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_TTL_SECONDS = 24 * 3600
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+RESPONSE_CACHE_SIMILARITY = 0.92      # min cosine between query embeddings for a semantic hit
+RESPONSE_CACHE_MIN_OVERLAP = 0.8      # min Jaccard overlap of retrieved ids for a semantic hit
+
+# Corpus Summary Configuration (corpus_summarizer.py)
+SUMMARY_MAX_CLUSTERS = 8              # k-means clusters per ingest batch
+SUMMARY_MIN_CLUSTER_SIZE = 20         # fewer clusters for small batches
+SUMMARY_REPS_PER_CLUSTER = 4          # emails nearest each centroid shown to the LLM
+SUMMARY_CONCURRENCY = 4               # clusters summarized in parallel
+SUMMARY_REDUCE_FANIN = 24             # partial summaries merged per reduce call
+SUMMARY_KMEANS_ITERATIONS = 20
 
 # File Upload Configuration
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
 SUPPORTED_FORMATS = ['.csv', '.json', '.txt','.eml']
 
+# Background Ingestion Configuration (ingest_jobs.py)
+INGEST_SPOOL_DIR = os.path.join(tempfile.gettempdir(), "email_analysis_uploads")
+INGEST_BATCH_SIZE = 500               # emails per add_emails call / resume checkpoint
+SPOOL_CHUNK_SIZE = 1024 * 1024        # bytes copied per read while spooling uploads
+MBOX_SCAN_BATCH_SIZE = 5000           # header-only rows per transaction in mbox_scan.py
+
+# Mail Sync Configuration (mail_sync.py)
+SYNC_BATCH_SIZE = 200                 # parsed files per add_emails call
+SYNC_POLL_INTERVAL_S = 30             # watcher polling period
+SYNC_FULL_SCAN_EVERY = 20             # polls between full scans (others skip unchanged directories)
+
 # Streamlit Configuration
 PAGE_TITLE = "Email Analysis System"
 PAGE_ICON = "📧"
\ No newline at end of file
@@ -0,0 +1,235 @@
+import re
+import sqlite3
+from email.utils import getaddresses
+from typing import List, Dict, Any, Tuple
+
+import doc_store
+from email_processor import parse_email_date
+
+TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+# minimum trigram Dice similarity for a fuzzy name match
+FUZZY_MIN_SIMILARITY = 0.3
+FUZZY_CANDIDATES = 50
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(TOKEN_SPLIT.split(str(name or "").lower())).strip()
+
+
+def name_tokens(name: str, address: str = "") -> List[str]:
+    """Words of the display name plus the parts of the address's local part (john.smith -> john, smith)."""
+    tokens = set(normalize_name(name).split())
+    if address:
+        tokens.update(t for t in TOKEN_SPLIT.split(address.split("@")[0].lower()) if t)
+    return sorted(tokens)
+
+
+def trigrams(text: str) -> List[str]:
+    """Trigrams of each word padded with spaces, so word order doesn't matter ("Smith, John" ~ "jon smyth")."""
+    grams = set()
+    for word in normalize_name(text).split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return sorted(grams)
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Create the contact table and its prefix (token) and fuzzy (trigram) indexes."""
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS contacts (
+               address       TEXT PRIMARY KEY,
+               name          TEXT NOT NULL DEFAULT '',
+               email_count   INTEGER NOT NULL DEFAULT 0,
+               last_seen     TEXT,
+               trigram_count INTEGER NOT NULL DEFAULT 0
+           )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS contact_tokens (
+               token   TEXT NOT NULL,
+               address TEXT NOT NULL,
+               PRIMARY KEY (token, address)
+           ) WITHOUT ROWID"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS contact_trigrams (
+               trigram TEXT NOT NULL,
+               address TEXT NOT NULL,
+               PRIMARY KEY (trigram, address)
+           ) WITHOUT ROWID"""
+    )
+
+
+def extract_contacts(metadata: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Every (display name, address) pair an email mentions, from from/from_name, to_all and name/email."""
+    pairs = []
+    sender = str(metadata.get("from") or "").strip()
+    if "@" in sender:
+        pairs.append((str(metadata.get("from_name") or ""), sender))
+    recipients = str(metadata.get("to_all") or metadata.get("to") or "")
+    pairs.extend(getaddresses([recipients]))
+    # CSV contact lists: one person per row
+    address = str(metadata.get("email") or "").strip()
+    if "@" in address:
+        pairs.append((str(metadata.get("name") or ""), address))
+
+    seen, contacts = set(), []
+    for name, address in pairs:
+        address = address.strip().lower()
+        name = name.strip().strip('"')
+        if "@" not in address or address in seen:
+            continue
+        if name.lower() in ("nan", "none") or "@" in name:
+            name = ""
+        seen.add(address)
+        contacts.append((name, address))
+    return contacts
+
+
+def update_contacts(conn: sqlite3.Connection, metadatas: List[Dict[str, Any]]):
+    """Fold the contacts of `metadatas` into the directory on the caller's connection (same transaction)."""
+    stats: Dict[str, Dict[str, Any]] = {}
+    for metadata in metadatas:
+        parsed = parse_email_date(metadata.get("date"))
+        day = parsed.strftime("%Y-%m-%d") if parsed is not None else None
+        for name, address in extract_contacts(metadata):
+            entry = stats.setdefault(address, {"names": set(), "name": "", "count": 0, "last_seen": None})
+            entry["count"] += 1
+            if name:
+                entry["names"].add(name)
+                entry["name"] = name
+            if day and (entry["last_seen"] is None or day > entry["last_seen"]):
+                entry["last_seen"] = day
+    if not stats:
+        return
+
+    conn.executemany(
+        """INSERT INTO contacts (address, name, email_count, last_seen) VALUES (?, ?, ?, ?)
+           ON CONFLICT (address) DO UPDATE SET
+               name = CASE WHEN excluded.name != '' THEN excluded.name ELSE name END,
+               email_count = email_count + excluded.email_count,
+               last_seen = CASE WHEN last_seen IS NULL OR excluded.last_seen > last_seen
+                                THEN COALESCE(excluded.last_seen, last_seen) ELSE last_seen END""",
+        [(address, e["name"], e["count"], e["last_seen"]) for address, e in stats.items()],
+    )
+    token_rows, trigram_rows = [], []
+    for address, entry in stats.items():
+        for name in entry["names"] or {""}:
+            token_rows.extend((token, address) for token in name_tokens(name, address))
+            if name:
+                trigram_rows.extend((trigram, address) for trigram in trigrams(name))
+        trigram_rows.extend((trigram, address) for trigram in trigrams(address.split("@")[0]))
+    conn.executemany("INSERT OR IGNORE INTO contact_tokens (token, address) VALUES (?, ?)", token_rows)
+    conn.executemany("INSERT OR IGNORE INTO contact_trigrams (trigram, address) VALUES (?, ?)", trigram_rows)
+    conn.executemany(
+        """UPDATE contacts SET trigram_count =
+               (SELECT COUNT(*) FROM contact_trigrams WHERE contact_trigrams.address = contacts.address)
+           WHERE address = ?""",
+        [(address,) for address in stats],
+    )
+
+
+def remove_contacts(conn: sqlite3.Connection, metadatas: List[Dict[str, Any]]):
+    """Undo `update_contacts` for deleted emails; contacts no email mentions any more are dropped."""
+    counts: Dict[str, int] = {}
+    for metadata in metadatas:
+        for _, address in extract_contacts(metadata):
+            counts[address] = counts.get(address, 0) + 1
+    conn.executemany("UPDATE contacts SET email_count = email_count - ? WHERE address = ?",
+                     [(n, address) for address, n in counts.items()])
+    gone = [(row[0],) for row in conn.execute("SELECT address FROM contacts WHERE email_count <= 0")]
+    conn.executemany("DELETE FROM contact_tokens WHERE address = ?", gone)
+    conn.executemany("DELETE FROM contact_trigrams WHERE address = ?", gone)
+    conn.executemany("DELETE FROM contacts WHERE address = ?", gone)
+
+
+def clear_contacts(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM contacts")
+    conn.execute("DELETE FROM contact_tokens")
+    conn.execute("DELETE FROM contact_trigrams")
+
+
+def backfill_contacts(conn: sqlite3.Connection):
+    """Build the directory once for collections created before it existed."""
+    if conn.execute("SELECT 1 FROM contacts LIMIT 1").fetchone():
+        return
+    batch = []
+    for (metadata_json,) in conn.execute("SELECT metadata_json FROM emails WHERE deleted = 0").fetchall():
+        batch.append(doc_store.decode_metadata(conn, metadata_json))
+        if len(batch) >= 5000:
+            update_contacts(conn, batch)
+            batch = []
+    if batch:
+        update_contacts(conn, batch)
+
+
+class ContactDirectory:
+    """
+    Name -> address lookups over the contacts seen at ingest, without FAISS.
+    Prefix matches on name and address tokens come first ("jo smi" finds John
+    Smith); if none match, trigram similarity catches misspellings ("jon smyth").
+    """
+
+    def __init__(self, vector_db):
+        self.vector_db = vector_db
+
+    def _rows(self, conn, addresses: List[str]) -> Dict[str, Dict[str, Any]]:
+        placeholders = ",".join("?" * len(addresses))
+        rows = conn.execute(
+            f"""SELECT address, name, email_count, last_seen, trigram_count FROM contacts
+                WHERE address IN ({placeholders})""",
+            addresses,
+        ).fetchall()
+        return {row[0]: {"address": row[0], "name": row[1], "email_count": row[2],
+                         "last_seen": row[3], "trigram_count": row[4]} for row in rows}
+
+    def lookup(self, name: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Best matching contacts with `match` ("prefix" or "fuzzy") and `score`, most relevant first."""
+        tokens = normalize_name(name).split()
+        if not tokens:
+            return []
+        with self.vector_db._conn() as conn:
+            matches = self._prefix_lookup(conn, tokens, limit)
+            if not matches:
+                matches = self._fuzzy_lookup(conn, name, limit)
+        return matches
+
+    def _prefix_lookup(self, conn, tokens: List[str], limit: int) -> List[Dict[str, Any]]:
+        # each term is a range scan on the (token, address) primary key, i.e. an indexed prefix match
+        matching = " INTERSECT ".join(
+            ["SELECT address FROM contact_tokens WHERE token >= ? AND token < ?"] * len(tokens)
+        )
+        params = [bound for token in tokens for bound in (token, token + "\uffff")]
+        rows = conn.execute(
+            f"""SELECT address, name, email_count, last_seen, trigram_count FROM contacts
+                WHERE address IN ({matching})
+                ORDER BY email_count DESC, address LIMIT ?""",
+            (*params, limit),
+        ).fetchall()
+        return [{"address": row[0], "name": row[1], "email_count": row[2], "last_seen": row[3],
+                 "trigram_count": row[4], "match": "prefix", "score": 1.0} for row in rows]
+
+    def _fuzzy_lookup(self, conn, name: str, limit: int) -> List[Dict[str, Any]]:
+        query_trigrams = trigrams(name)
+        if not query_trigrams:
+            return []
+        placeholders = ",".join("?" * len(query_trigrams))
+        shared = conn.execute(
+            f"""SELECT address, COUNT(*) AS shared FROM contact_trigrams
+                WHERE trigram IN ({placeholders})
+                GROUP BY address ORDER BY shared DESC LIMIT ?""",
+            (*query_trigrams, FUZZY_CANDIDATES),
+        ).fetchall()
+        if not shared:
+            return []
+        rows = self._rows(conn, [address for address, _ in shared])
+        scored = []
+        for address, n in shared:
+            row = rows.get(address)
+            if row is None:
+                continue
+            similarity = 2 * n / (len(query_trigrams) + row["trigram_count"])
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                scored.append(dict(row, match="fuzzy", score=round(similarity, 3)))
+        scored.sort(key=lambda r: (-r["score"], -r["email_count"]))
+        return scored[:limit]
@@ -0,0 +1,138 @@
+import re
+from typing import List, Dict, Any, Tuple
+
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_MAX_BODY_TOKENS, CONTEXT_MAX_FIELD_CHARS
+
+# Fields in the order they are worth spending tokens on; anything else follows alphabetically
+FIELD_PRIORITY = ["from", "from_name", "email", "name", "to", "subject", "date", "company", "role", "title"]
+# Fields that identify an email rather than describe its sender
+IDENTITY_FIELDS = {"from", "email", "to", "subject", "date"}
+# Bookkeeping fields that never help the model
+SKIPPED_FIELDS = {"text_content", "body", "message_id", "in_reply_to", "references"}
+
+QUOTE_HEADER = re.compile(r"^\s*(On .{0,200}wrote:|-{2,}\s*Original Message\s*-{2,}|From: .+ Sent: .+)", re.IGNORECASE)
+SIGNATURE_LINE = re.compile(r"^(--|_{2,}|Sent from my .*)$")
+SUBJECT_PREFIX = re.compile(r"^\s*((re|fw|fwd|aw)\s*:\s*)+", re.IGNORECASE)
+BODY_LABEL = "\nbody: "
+TRUNCATION_MARKER = " …"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English prose)."""
+    return (len(text) + 3) // 4
+
+
+def clean_body(body: str) -> str:
+    """Drop quoted replies, forwarded history and signatures; collapse whitespace."""
+    kept = []
+    for line in body.splitlines():
+        stripped = line.strip()
+        if QUOTE_HEADER.match(line):
+            break
+        if SIGNATURE_LINE.match(stripped):
+            break
+        if stripped.startswith(">"):
+            continue
+        kept.append(stripped)
+    return re.sub(r"\s+", " ", " ".join(kept)).strip()
+
+
+def thread_key(subject: str) -> str:
+    return SUBJECT_PREFIX.sub("", subject or "").strip().lower()
+
+
+def truncate_tokens(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """Cut `text` to about `max_tokens`, on a word boundary; returns (text, was_truncated)."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text, False
+    cut = text[:max_chars].rsplit(" ", 1)[0]
+    return cut + TRUNCATION_MARKER, True
+
+
+class ContextPacker:
+    """
+    Build the LLM context from search results within a token budget.
+    Fields are ordered by importance and capped in length, bodies are cleaned
+    of quoted replies and signatures, repeated senders keep only their
+    identifying fields and repeated threads drop their bodies.
+    """
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 max_body_tokens: int = CONTEXT_MAX_BODY_TOKENS,
+                 max_field_chars: int = CONTEXT_MAX_FIELD_CHARS):
+        self.token_budget = token_budget
+        self.max_body_tokens = max_body_tokens
+        self.max_field_chars = max_field_chars
+
+    def _ordered_fields(self, metadata: Dict[str, Any]) -> List[Tuple[str, str]]:
+        keys = [k for k in FIELD_PRIORITY if k in metadata]
+        keys += sorted(k for k in metadata if k not in FIELD_PRIORITY)
+        fields = []
+        for key in keys:
+            if key in SKIPPED_FIELDS or key.startswith("_"):
+                continue
+            value = str(metadata[key]).strip()
+            if not value or value.lower() in ("nan", "none"):
+                continue
+            if len(value) > self.max_field_chars:
+                value = value[:self.max_field_chars] + " …"
+            fields.append((key, value))
+        return fields
+
+    def pack(self, search_results: List[Dict[str, Any]]) -> Tuple[str, Dict[str, int]]:
+        """Return (context, stats); stats has context_tokens, emails_included/dropped, bodies_truncated."""
+        stats = {"context_tokens": 0, "emails_included": 0, "emails_dropped": 0, "bodies_truncated": 0}
+        if not search_results:
+            return "No relevant email data found.", stats
+
+        parts, used = [], 0
+        seen_senders, seen_threads = {}, {}
+        for i, result in enumerate(search_results, 1):
+            metadata = result.get('metadata', {})
+            score = result.get('score', 0)
+
+            sender = str(metadata.get("from") or metadata.get("email") or "").lower()
+            thread = thread_key(str(metadata.get("subject", "")))
+            lines = []
+            for key, value in self._ordered_fields(metadata):
+                # the sender's descriptive fields were already shown once
+                if sender in seen_senders and key not in IDENTITY_FIELDS:
+                    continue
+                lines.append(f"{key}: {value}")
+            if sender in seen_senders:
+                lines.append(f"(sender details as Email {seen_senders[sender]})")
+
+            body = clean_body(str(metadata.get("body", "")))
+            if body and thread and thread in seen_threads:
+                lines.append(f"(body omitted: same thread as Email {seen_threads[thread]})")
+                body = ""
+
+            block = f"Email {i} (Relevance: {score:.2f}):\n" + "\n".join(lines)
+            remaining = self.token_budget - used - estimate_tokens(block)
+            if remaining <= 0 or not lines:
+                stats["emails_dropped"] += 1
+                continue
+
+            # the "body:" label and a truncation marker are added after the cut, so leave room for them
+            body_budget = min(self.max_body_tokens,
+                              remaining - estimate_tokens(BODY_LABEL) - estimate_tokens(TRUNCATION_MARKER))
+            if body and body_budget > 0:
+                body, truncated = truncate_tokens(body, body_budget)
+                block += f"{BODY_LABEL}{body}"
+                stats["bodies_truncated"] += int(truncated)
+            elif body:
+                stats["bodies_truncated"] += 1
+
+            parts.append(block)
+            used += estimate_tokens(block)
+            stats["emails_included"] += 1
+            if sender:
+                seen_senders.setdefault(sender, i)
+            if thread:
+                seen_threads.setdefault(thread, i)
+
+        stats["context_tokens"] = used
+        if not parts:
+            return "No relevant email data found.", stats
+        return "\n\n".join(parts), stats
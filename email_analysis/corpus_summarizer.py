@@ -0,0 +1,209 @@
+import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+from config import (SUMMARY_MAX_CLUSTERS, SUMMARY_MIN_CLUSTER_SIZE, SUMMARY_REPS_PER_CLUSTER,
+                    SUMMARY_CONCURRENCY, SUMMARY_REDUCE_FANIN, SUMMARY_KMEANS_ITERATIONS)
+
+# batch id used for vectors added before ingest batches were recorded
+LEGACY_BATCH = "legacy"
+SUMMARY_ERROR_PREFIX = "Error generating summary"
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Create the ingest batch ranges and the per-batch cluster summary cache."""
+    # one row per add_emails call: the FAISS positions [start_pos, end_pos) it appended
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS ingest_batches (
+               batch_id  TEXT NOT NULL,
+               start_pos INTEGER NOT NULL,
+               end_pos   INTEGER NOT NULL,
+               created   REAL NOT NULL
+           )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_batches_id ON ingest_batches (batch_id)")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS batch_summaries (
+               batch_id TEXT NOT NULL,
+               model    TEXT NOT NULL,
+               cluster  INTEGER NOT NULL,
+               size     INTEGER NOT NULL,
+               summary  TEXT NOT NULL,
+               created  REAL NOT NULL,
+               PRIMARY KEY (batch_id, model, cluster)
+           )"""
+    )
+
+
+def record_batch(conn: sqlite3.Connection, batch_id: str, start_pos: int, end_pos: int):
+    # a batch that grows (a resumed job or stream) must be summarized again
+    conn.execute("DELETE FROM batch_summaries WHERE batch_id = ?", (batch_id,))
+    conn.execute(
+        "INSERT INTO ingest_batches (batch_id, start_pos, end_pos, created) VALUES (?, ?, ?, ?)",
+        (batch_id, start_pos, end_pos, time.time()),
+    )
+
+
+def clear_batches(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM ingest_batches")
+    conn.execute("DELETE FROM batch_summaries")
+
+
+class CorpusSummarizer:
+    """
+    Map-reduce summary of the whole collection.
+
+    Map: each ingest batch is clustered with FAISS k-means over its stored
+    embeddings, and the emails closest to each centroid are summarized by the
+    LLM (clusters in parallel, at most `concurrency` at a time). Cluster
+    summaries are cached per batch, so a new upload only maps its own emails.
+    Reduce: the cached partial summaries are folded, `fanin` at a time, into
+    one dataset summary together with the exact aggregates.
+    """
+
+    def __init__(self, vector_db, llm_handler,
+                 max_clusters: int = SUMMARY_MAX_CLUSTERS,
+                 min_cluster_size: int = SUMMARY_MIN_CLUSTER_SIZE,
+                 reps_per_cluster: int = SUMMARY_REPS_PER_CLUSTER,
+                 concurrency: int = SUMMARY_CONCURRENCY,
+                 fanin: int = SUMMARY_REDUCE_FANIN):
+        self.vector_db = vector_db
+        self.llm_handler = llm_handler
+        self.max_clusters = max_clusters
+        self.min_cluster_size = min_cluster_size
+        self.reps_per_cluster = reps_per_cluster
+        self.concurrency = concurrency
+        self.fanin = fanin
+
+    def batches(self) -> List[Tuple[str, List[Tuple[int, int]]]]:
+        """(batch_id, [(start, end), ...]) in ingest order."""
+        with self.vector_db._conn() as conn:
+            rows = conn.execute(
+                "SELECT batch_id, start_pos, end_pos FROM ingest_batches ORDER BY created, start_pos"
+            ).fetchall()
+            # vectors added before batches were recorded become one legacy batch
+            first_recorded = min((start for _, start, _ in rows), default=len(self.vector_db.id_map))
+            if first_recorded > 0:
+                record_batch(conn, LEGACY_BATCH, 0, first_recorded)
+                rows.insert(0, (LEGACY_BATCH, 0, first_recorded))
+
+        batches: Dict[str, List[Tuple[int, int]]] = {}
+        for batch_id, start, end in rows:
+            batches.setdefault(batch_id, []).append((start, end))
+        return list(batches.items())
+
+    def summarize(self, progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """Summarize the collection, mapping only batches without cached partials."""
+        batches = self.batches()
+        if not batches:
+            return "No email data available for summary."
+
+        partials = []
+        for done, (batch_id, ranges) in enumerate(batches):
+            partials.extend(self.batch_partials(batch_id, ranges))
+            if progress is not None:
+                progress(done + 1, len(batches))
+        if not partials:
+            return f"{SUMMARY_ERROR_PREFIX}: no cluster could be summarized"
+
+        from analytics import AnalyticsEngine
+        stats = AnalyticsEngine(self.vector_db).overview()
+        return self._reduce(partials, stats)
+
+    def batch_partials(self, batch_id: str, ranges: List[Tuple[int, int]]) -> List[Tuple[int, str]]:
+        """Cached (cluster size, summary) pairs for one batch, computed on a miss."""
+        model = self.llm_handler.model
+        with self.vector_db._conn() as conn:
+            cached = conn.execute(
+                "SELECT size, summary FROM batch_summaries WHERE batch_id = ? AND model = ? ORDER BY cluster",
+                (batch_id, model),
+            ).fetchall()
+        if cached:
+            return [(size, summary) for size, summary in cached]
+
+        clusters = self._cluster(ranges)
+        if not clusters:
+            return []
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="summary-map") as pool:
+            summaries = list(pool.map(self._summarize_cluster, clusters))
+
+        partials = [(size, summary) for (size, _), summary in zip(clusters, summaries)]
+        if any(summary.startswith(SUMMARY_ERROR_PREFIX) for _, summary in partials):
+            # don't cache a partly failed map; the next call retries the batch
+            return [p for p in partials if not p[1].startswith(SUMMARY_ERROR_PREFIX)]
+
+        now = time.time()
+        with self.vector_db._conn() as conn:
+            conn.executemany(
+                """INSERT OR REPLACE INTO batch_summaries (batch_id, model, cluster, size, summary, created)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                [(batch_id, model, i, size, summary, now) for i, (size, summary) in enumerate(partials)],
+            )
+        return partials
+
+    def _cluster(self, ranges: List[Tuple[int, int]]) -> List[Tuple[int, List[str]]]:
+        """K-means the batch's vectors; return (cluster size, representative email ids) per cluster."""
+        import numpy as np
+        from vector_db_manager import _faiss
+
+        db = self.vector_db
+        with db._rw_lock.read_lock():
+            parts, owners = [], []
+            for start, end in ranges:
+                end = min(end, db.index.ntotal)
+                if end > start:
+                    parts.append(db.index.reconstruct_n(start, end - start))
+                    owners.extend(db.id_map[start:end])
+        if not parts:
+            return []
+        vectors = np.vstack(parts).astype("float32")
+
+        # with chunking an email owns several vectors; cluster on its first (subject + opening)
+        first = {}
+        for row, owner in enumerate(owners):
+            first.setdefault(owner, row)
+        rows = list(first.values())
+        vectors, owners = vectors[rows], [owners[row] for row in rows]
+
+        k = max(1, min(self.max_clusters, len(owners) // self.min_cluster_size))
+        if k == 1:
+            centroids = vectors.mean(axis=0, keepdims=True)
+            assignment = np.zeros(len(owners), dtype="int64")
+        else:
+            kmeans = _faiss().Kmeans(vectors.shape[1], k, niter=SUMMARY_KMEANS_ITERATIONS,
+                                     spherical=True, seed=1234, verbose=False,
+                                     min_points_per_centroid=self.min_cluster_size)
+            kmeans.train(vectors)
+            centroids = kmeans.centroids
+            assignment = kmeans.index.search(vectors, 1)[1].ravel()
+
+        clusters = []
+        for cluster in range(len(centroids)):
+            members = np.flatnonzero(assignment == cluster)
+            if not len(members):
+                continue
+            closeness = vectors[members] @ centroids[cluster]
+            reps = members[np.argsort(-closeness)[:self.reps_per_cluster]]
+            clusters.append((len(members), [owners[i] for i in reps]))
+        clusters.sort(key=lambda c: -c[0])
+        return clusters
+
+    def _summarize_cluster(self, cluster: Tuple[int, List[str]]) -> str:
+        size, rep_ids = cluster
+        rows = self.vector_db._fetch_rows(rep_ids)
+        emails = [rows[email_id] for email_id in rep_ids if email_id in rows]
+        return self.llm_handler.summarize_cluster(emails, size)
+
+    def _reduce(self, partials: List[Tuple[int, str]], stats: Dict[str, Any]) -> str:
+        # fold wide inputs in groups first so no single prompt grows with the corpus
+        while len(partials) > self.fanin:
+            groups = [partials[i:i + self.fanin] for i in range(0, len(partials), self.fanin)]
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="summary-reduce") as pool:
+                merged = list(pool.map(self.llm_handler.reduce_summaries, groups))
+            partials = [(sum(size for size, _ in group), summary)
+                        for group, summary in zip(groups, merged)
+                        if not summary.startswith(SUMMARY_ERROR_PREFIX)]
+            if not partials:
+                return f"{SUMMARY_ERROR_PREFIX}: reduce step failed"
+        return self.llm_handler.reduce_summaries(partials, stats)
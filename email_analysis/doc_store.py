@@ -0,0 +1,140 @@
+"""
+Compact encoding of the `document` and `metadata_json` columns of `emails`.
+
+`document` is the email's text_content, which for parsed emails is just the
+metadata fields joined together; it is stored as NULL whenever it can be
+rebuilt from the metadata. The metadata JSON (and any document that can't be
+rebuilt) is stored as a zlib blob compressed against a dictionary trained on
+the collection's own emails, which pays off even on short messages:
+
+    b"Z" + dict id (4 bytes, crc32 of the dictionary; 0 = none) + zlib stream
+
+Plain TEXT values written before compression was enabled still decode, and
+decoding happens per row, only for the rows a caller actually reads.
+"""
+
+import re
+import json
+import zlib
+import time
+import struct
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Any, Optional, Tuple
+
+from email_processor import TEXT_SKIPPED_FIELDS
+from config import DOC_DICT_TRAIN_ROWS, DOC_DICT_SIZE
+
+MAGIC = b"Z"
+TOKEN = re.compile(r'"[a-z_]+": "|[A-Za-z0-9@._-]{4,}')
+
+# dictionaries never change once stored and are keyed by their checksum, so one cache serves every database
+_dicts: Dict[int, bytes] = {0: b""}
+_dicts_lock = threading.Lock()
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS compression_dicts (
+               dict_id INTEGER PRIMARY KEY,
+               zdict   BLOB NOT NULL,
+               created REAL NOT NULL
+           )"""
+    )
+
+
+def rebuild_document(metadata: Dict[str, Any]) -> str:
+    """text_content as EmailProcessor._create_text_content builds it, from stored (string) metadata."""
+    return " | ".join(f"{key}: {value}" for key, value in metadata.items() if key not in TEXT_SKIPPED_FIELDS)
+
+
+def _zdict(conn: sqlite3.Connection, dict_id: int) -> bytes:
+    with _dicts_lock:
+        if dict_id in _dicts:
+            return _dicts[dict_id]
+    row = conn.execute("SELECT zdict FROM compression_dicts WHERE dict_id = ?", (dict_id,)).fetchone()
+    if row is None:
+        raise ValueError(f"compression dictionary {dict_id} is missing")
+    with _dicts_lock:
+        _dicts[dict_id] = bytes(row[0])
+    return _dicts[dict_id]
+
+
+def current_dict_id(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT dict_id FROM compression_dicts ORDER BY created DESC LIMIT 1").fetchone()
+    return row[0] if row else 0
+
+
+def compress(conn: sqlite3.Connection, text: str, dict_id: int) -> bytes:
+    zdict = _zdict(conn, dict_id)
+    compressor = zlib.compressobj(6, zdict=zdict) if zdict else zlib.compressobj(6)
+    return MAGIC + struct.pack("<I", dict_id) + compressor.compress(text.encode("utf-8")) + compressor.flush()
+
+
+def decompress(conn: sqlite3.Connection, value) -> str:
+    """Text of a stored column value: a compressed blob or legacy plain text."""
+    if not isinstance(value, bytes):
+        return value or ""
+    dict_id = struct.unpack("<I", value[1:5])[0]
+    zdict = _zdict(conn, dict_id)
+    decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+    return (decompressor.decompress(value[5:]) + decompressor.flush()).decode("utf-8")
+
+
+def encode_row(conn: sqlite3.Connection, document: str, metadata: Dict[str, Any],
+               dict_id: Optional[int]) -> Tuple[Any, Any]:
+    """(document, metadata_json) column values; `dict_id` None stores both as plain text."""
+    metadata_json = json.dumps(metadata, ensure_ascii=False)
+    if dict_id is None:
+        return document, metadata_json
+    stored_document = None if document == rebuild_document(metadata) else compress(conn, document, dict_id)
+    return stored_document, compress(conn, metadata_json, dict_id)
+
+
+def decode_metadata(conn: sqlite3.Connection, value) -> Dict[str, Any]:
+    text = decompress(conn, value)
+    return json.loads(text) if text else {}
+
+
+def decode_row(conn: sqlite3.Connection, document, metadata_value) -> Tuple[str, Dict[str, Any]]:
+    """(document, metadata) of a stored row."""
+    metadata = decode_metadata(conn, metadata_value)
+    if document is None:
+        return rebuild_document(metadata), metadata
+    return decompress(conn, document), metadata
+
+
+def train_dictionary(conn: sqlite3.Connection, samples: int = DOC_DICT_TRAIN_ROWS) -> int:
+    """
+    Build a zlib preset dictionary from up to `samples` stored emails and
+    return its id (0 if there is too little data). The fragments that recur
+    across emails (field names, addresses, domains, boilerplate words) are
+    packed up to DOC_DICT_SIZE, the most valuable last, since zlib reaches
+    the end of the dictionary with the shortest distances.
+    """
+    rows = conn.execute(
+        "SELECT metadata_json FROM emails WHERE deleted = 0 ORDER BY rowid DESC LIMIT ?", (samples,)
+    ).fetchall()
+    if len(rows) < samples // 2:
+        return 0
+    spread = Counter()
+    for (value,) in rows:
+        spread.update(set(TOKEN.findall(decompress(conn, value))))
+    scored = sorted(((count * len(token), token) for token, count in spread.items() if count > 1), reverse=True)
+    picked, size = [], 0
+    for _, token in scored:
+        encoded = token.encode("utf-8")
+        if size + len(encoded) > DOC_DICT_SIZE:
+            break
+        picked.append(encoded)
+        size += len(encoded)
+    if not picked:
+        return 0
+    zdict = b"".join(reversed(picked))
+    dict_id = zlib.crc32(zdict) or 1
+    conn.execute("INSERT OR IGNORE INTO compression_dicts (dict_id, zdict, created) VALUES (?, ?, ?)",
+                 (dict_id, zdict, time.time()))
+    with _dicts_lock:
+        _dicts[dict_id] = zdict
+    return dict_id
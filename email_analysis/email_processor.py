@@ -1,13 +1,114 @@
-import pandas as pd
 import json
 import re
-from typing import List, Dict, Any
+from datetime import date, datetime, timezone
+from typing import List, Dict, Any, Optional, Iterator, Tuple, TYPE_CHECKING
 from email_validator import validate_email, EmailNotValidError
 import email
-from bs4 import BeautifulSoup
 import os
-from email.utils import parseaddr
+from email.utils import parseaddr, getaddresses, formataddr, parsedate_to_datetime
 import mailbox
+
+if TYPE_CHECKING:
+    import pandas as pd  # imported lazily in _load_from_csv to keep startup fast
+
+TEXT_SKIPPED_FIELDS = {"message_id", "in_reply_to", "references"}
+
+
+def parse_email_date(value: Any) -> Optional[datetime]:
+    """Parse an RFC 2822 header or ISO date string into an aware UTC datetime (None if unparseable)."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    if not text or text.lower() in ("nan", "none"):
+        return None
+    try:
+        parsed = parsedate_to_datetime(text)
+    except (TypeError, ValueError, IndexError):
+        try:
+            parsed = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def date_timestamp(value: Any) -> Optional[int]:
+    """Epoch seconds of a date header, ISO string, datetime or date (midnight UTC); numbers pass through."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime):
+        parsed = value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+    elif isinstance(value, date):
+        parsed = datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+    else:
+        parsed = parse_email_date(value)
+    return int(parsed.timestamp()) if parsed is not None else None
+
+
+def date_upper_bound(value: Any) -> Optional[int]:
+    """Like `date_timestamp`, but a date without a time ("2024-01-07", a `date`) covers its whole UTC day."""
+    ts = date_timestamp(value)
+    if ts is None:
+        return None
+    whole_day = (isinstance(value, date) and not isinstance(value, datetime)) or \
+        (isinstance(value, str) and ":" not in value)
+    return ts + 86399 if whole_day else ts
+
+
+def thread_fields(msg) -> Dict[str, str]:
+    """Threading headers, whitespace-collapsed (see email_threads)."""
+    return {
+        "message_id": " ".join(str(msg.get("message-id", "")).split()),
+        "in_reply_to": " ".join(str(msg.get("in-reply-to", "")).split()),
+        "references": " ".join(str(msg.get("references", "")).split()),
+    }
+
+
+def address_fields(msg) -> Dict[str, str]:
+    """
+    Sender and recipient fields of a message: `from`/`to` keep the first bare
+    address as before; `from_name` keeps the sender's display name and
+    `to_all` every To/Cc recipient as "Name <address>", comma separated.
+    """
+    from_name, from_email = parseaddr(str(msg.get("from", "")))
+    # one parse of To serves both `to` (its first address) and `to_all`
+    to_parsed = getaddresses([str(msg.get("to", ""))])
+    to_email = to_parsed[0][1] if to_parsed else ""
+    recipients = to_parsed + getaddresses([str(value) for value in msg.get_all("to", [])[1:] + msg.get_all("cc", [])])
+    recipients = [(name, address) for name, address in recipients if address]
+    return {
+        "from": from_email,
+        "from_name": from_name,
+        "to": to_email,
+        "to_all": ", ".join(formataddr(pair) for pair in recipients),
+    }
+
+
+def header_fields(msg) -> Dict[str, str]:
+    """Every field the parsers take from the headers, in their usual order (no body)."""
+    return {
+        "subject": msg.get("subject", ""),
+        **address_fields(msg),
+        "date": msg.get("date", ""),
+        **thread_fields(msg),
+    }
+
+
+def message_body(msg: email.message.Message) -> str:
+    """Plain text of a message: text/plain parts as-is, text/html parts stripped of markup."""
+    body = ""
+    for part in msg.walk():
+        content_type = part.get_content_type()
+        if content_type == "text/plain":
+            body += part.get_payload(decode=True).decode(errors='ignore')
+        elif content_type == "text/html":
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(part.get_payload(decode=True).decode(errors='ignore'), 'html.parser')
+            body += soup.get_text()
+    return body.strip()
+
+
 class EmailProcessor:
     """Process and validate email data from various file formats"""
     
@@ -32,9 +133,49 @@ class EmailProcessor:
         except Exception as e:
             raise Exception(f"Error loading emails: {str(e)}")
     
+    def iter_records(self, file_path: str, file_type: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Stream (record number, email) for the valid emails of a file, for
+        `VectorDBManager.ingest_stream`. CSV rows and mbox messages are read
+        incrementally; numbering counts invalid records too, so it is stable
+        across runs and a resumed import can skip what it already stored.
+        """
+        if file_type == 'csv':
+            import pandas as pd
+
+            position = -1
+            for frame in pd.read_csv(file_path, chunksize=1000):
+                email_columns = self._identify_email_columns(frame)
+                for _, row in frame.iterrows():
+                    position += 1
+                    email_data = {('email' if col in email_columns else col): row[col] for col in frame.columns}
+                    email_data['text_content'] = self._create_text_content(email_data)
+                    if self.validate_emails([email_data]):
+                        yield position, email_data
+            return
+        if file_type == 'mbox':
+            mbox = mailbox.mbox(file_path, create=False)
+            try:
+                for position, message in enumerate(mbox):
+                    try:
+                        email_data = self._parse_and_enrich(message)
+                    except Exception as e:
+                        print(f"Error parsing message {position}: {e}")
+                        continue
+                    if self.validate_emails([email_data]):
+                        yield position, email_data
+            finally:
+                mbox.close()
+            return
+        for position, email_data in enumerate(self.load_emails_from_file(file_path, file_type)):
+            if self.validate_emails([email_data]):
+                yield position, email_data
+
     def _load_from_csv(self, file_path: str) -> List[Dict[str, Any]]:
     
         """Load emails from CSV file"""
+        import pandas as pd
+
         df = pd.read_csv(file_path)
         
         # Try to identify email columns automatically
@@ -93,29 +234,17 @@ class EmailProcessor:
 
         return emails
 
+    def parse_message_file(self, file_path: str) -> Dict[str, Any]:
+        """Parse one RFC 822 message file (.eml or a Maildir entry) with its text_content."""
+        email_data = self._parse_eml(file_path)
+        email_data["text_content"] = self._create_text_content(email_data)
+        return email_data
+
     def _parse_eml(self, file_path: str) -> Dict[str, Any]:
         with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
             msg = email.message_from_file(f)
 
-        body = ""
-        for part in msg.walk():
-            content_type = part.get_content_type()
-            if content_type == "text/plain":
-                body += part.get_payload(decode=True).decode(errors='ignore')
-            elif content_type == "text/html":
-                soup = BeautifulSoup(part.get_payload(decode=True).decode(errors='ignore'), 'html.parser')
-                body += soup.get_text()
-        
-        _, from_email = parseaddr(msg.get("from", ""))
-        _, to_email = parseaddr(msg.get("to", ""))
-        
-        return {
-            "subject": msg.get("subject", ""),
-            "from": from_email,
-            "to": to_email,
-            "date": msg.get("date", ""),
-            "body": body.strip()
-        }
+        return {**header_fields(msg), "body": message_body(msg)}
     def _load_from_mbox(self, file_path: str) -> List[Dict[str, Any]]:
         """Load emails from mbox file"""
         emails = []
@@ -137,26 +266,7 @@ class EmailProcessor:
         """Parses an email message 
         into a dictionary
         with subject, from, to, date, and body."""
-        body = ""
-        # if msg.is_multipart():
-        for part in msg.walk():
-            content_type = part.get_content_type()
-            if content_type == "text/plain":
-                body += part.get_payload(decode=True).decode(errors='ignore')
-            elif content_type == "text/html":
-                soup = BeautifulSoup(part.get_payload(decode=True).decode(errors='ignore'), 'html.parser')
-                body += soup.get_text()
-        
-        _, from_email = parseaddr(msg.get("from", ""))
-        _, to_email = parseaddr(msg.get("to", ""))
-    
-        return {
-        "subject": msg.get("subject", ""),
-        "from": from_email,
-        "to": to_email,
-        "date": msg.get("date", ""),
-        "body": body.strip()
-    }
+        return {**header_fields(msg), "body": message_body(msg)}
 
        
     
@@ -179,7 +289,7 @@ class EmailProcessor:
         
         return emails
     
-    def _identify_email_columns(self, df: pd.DataFrame) -> List[str]:
+    def _identify_email_columns(self, df: "pd.DataFrame") -> List[str]:
         """Identify columns that likely contain email addresses"""
         email_columns = []
         
@@ -214,7 +324,8 @@ class EmailProcessor:
         text_parts = []
         
         for key, value in email_data.items():
-            if key != 'text_content' and value is not None:
+            # message ids are opaque tokens that would only add noise to the embedding
+            if key != 'text_content' and key not in TEXT_SKIPPED_FIELDS and value is not None:
                 text_parts.append(f"{key}: {str(value)}")
         
         return " | ".join(text_parts)
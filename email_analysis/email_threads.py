@@ -0,0 +1,269 @@
+import re
+import uuid
+import sqlite3
+from typing import List, Dict, Any, Iterable
+
+import doc_store
+from email_processor import parse_email_date
+
+MESSAGE_ID = re.compile(r"<[^<>\s]+>")
+REPLY_PREFIX = re.compile(r"^\s*((re|fw|fwd|aw|sv)\s*(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+
+
+def subject_key(subject: Any) -> str:
+    """Subject without Re:/Fwd: prefixes, lowercased, for subject-based grouping."""
+    return re.sub(r"\s+", " ", REPLY_PREFIX.sub("", str(subject or ""))).strip().lower()
+
+
+def is_reply_subject(subject: Any) -> bool:
+    return bool(REPLY_PREFIX.match(str(subject or "")))
+
+
+def parse_message_ids(value: Any) -> List[str]:
+    """Message-IDs in a header value, in order, lowercased."""
+    return [mid.lower() for mid in MESSAGE_ID.findall(str(value or ""))]
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Create the message-id map, per-email thread rows and per-thread summary."""
+    # every Message-ID seen or referenced (referenced-only ids are JWZ "phantom" containers)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS message_ids (
+               message_id TEXT PRIMARY KEY,
+               thread_id  TEXT NOT NULL
+           ) WITHOUT ROWID"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_msgid_thread ON message_ids (thread_id)")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS email_threads (
+               email_id  TEXT PRIMARY KEY,
+               thread_id TEXT NOT NULL,
+               date_ts   REAL
+           )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_email_threads_thread ON email_threads (thread_id, date_ts)")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS threads (
+               thread_id   TEXT PRIMARY KEY,
+               subject_key TEXT NOT NULL DEFAULT '',
+               subject     TEXT NOT NULL DEFAULT '',
+               email_count INTEGER NOT NULL DEFAULT 0,
+               first_ts    REAL,
+               last_ts     REAL
+           )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_threads_subject ON threads (subject_key, last_ts)")
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent: Dict[str, str] = {}
+
+    def find(self, node: str) -> str:
+        parent = self.parent.setdefault(node, node)
+        while parent != self.parent[parent]:
+            self.parent[parent] = self.parent[self.parent[parent]]
+            parent = self.parent[parent]
+        self.parent[node] = parent
+        return parent
+
+    def union(self, a: str, b: str):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+
+def _select_in(conn, sql: str, values: List[str]) -> List[tuple]:
+    rows = []
+    for start in range(0, len(values), 500):
+        batch = values[start:start + 500]
+        rows.extend(conn.execute(sql.format(",".join("?" * len(batch))), batch).fetchall())
+    return rows
+
+
+def update_threads(conn: sqlite3.Connection, ids: List[str], metadatas: List[Dict[str, Any]]):
+    """
+    Assign `ids` to threads in one pass over the batch (JWZ-style, on the caller's connection).
+
+    Message-ID, In-Reply-To and References link messages through a union-find
+    over message ids; components are then matched against stored ids, so a
+    reply joins its thread even when the parent arrived in an earlier batch or
+    is only known as a reference (phantom). Components touching several stored
+    threads merge them. A component with no link to a stored thread falls back
+    to a thread with the same normalized subject when it looks like a reply.
+    Emails without a Message-ID or subject (e.g. CSV contact rows) get no thread.
+    """
+    links = _UnionFind()
+    members = []  # (email_id, node, metadata, date_ts)
+    for email_id, metadata in zip(ids, metadatas):
+        if not (metadata.get("message_id") or metadata.get("subject")):
+            continue
+        own = parse_message_ids(metadata.get("message_id"))
+        node = own[0] if own else f"email:{email_id}"
+        for ref in parse_message_ids(metadata.get("references")) + parse_message_ids(metadata.get("in_reply_to")):
+            links.union(node, ref)
+        links.find(node)
+        parsed = parse_email_date(metadata.get("date"))
+        members.append((email_id, node, metadata, parsed.timestamp() if parsed else None))
+    if not members:
+        return
+
+    message_ids = [node for node in links.parent if not node.startswith("email:")]
+    stored = dict(_select_in(conn, "SELECT message_id, thread_id FROM message_ids WHERE message_id IN ({})",
+                             message_ids))
+
+    components: Dict[str, Dict[str, Any]] = {}
+    for node in links.parent:
+        component = components.setdefault(links.find(node), {"nodes": [], "threads": set(), "emails": []})
+        component["nodes"].append(node)
+        if node in stored:
+            component["threads"].add(stored[node])
+    for member in members:
+        components[links.find(member[1])]["emails"].append(member)
+
+    new_subjects: Dict[str, str] = {}  # subject key -> thread created in this batch
+    merged: Dict[str, str] = {}
+    # oldest conversations first, so an original is threaded before replies that only match its subject
+    ordered = sorted(components.values(), key=lambda c: min((m[3] or 0 for m in c["emails"]), default=0))
+    for component in ordered:
+        if not component["emails"] and not component["threads"]:
+            continue
+        thread_id = _resolve_thread(conn, component, new_subjects, merged)
+        conn.executemany(
+            "INSERT OR REPLACE INTO message_ids (message_id, thread_id) VALUES (?, ?)",
+            [(node, thread_id) for node in component["nodes"] if not node.startswith("email:")],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO email_threads (email_id, thread_id, date_ts) VALUES (?, ?, ?)",
+            [(email_id, thread_id, date_ts) for email_id, _, _, date_ts in component["emails"]],
+        )
+        _refresh_thread(conn, thread_id, component["emails"])
+
+
+def backfill_threads(conn: sqlite3.Connection):
+    """Thread the stored emails once for collections created before threading existed."""
+    if conn.execute("SELECT 1 FROM email_threads LIMIT 1").fetchone():
+        return
+    ids, metadatas = [], []
+    # insertion order, so a reply stored after its parent links the same way it did at ingest
+    for email_id, metadata_json in conn.execute(
+            "SELECT id, metadata_json FROM emails WHERE deleted = 0 ORDER BY rowid").fetchall():
+        ids.append(email_id)
+        metadatas.append(doc_store.decode_metadata(conn, metadata_json))
+        if len(ids) >= 5000:
+            update_threads(conn, ids, metadatas)
+            ids, metadatas = [], []
+    if ids:
+        update_threads(conn, ids, metadatas)
+
+
+def _resolve_thread(conn, component, new_subjects: Dict[str, str], merged: Dict[str, str]) -> str:
+    threads = sorted({merged.get(t, t) for t in component["threads"]})
+    if threads:
+        # this batch links threads stored separately so far: fold them into the first
+        thread_id = threads[0]
+        for other in threads[1:]:
+            conn.execute("UPDATE message_ids SET thread_id = ? WHERE thread_id = ?", (thread_id, other))
+            conn.execute("UPDATE email_threads SET thread_id = ? WHERE thread_id = ?", (thread_id, other))
+            conn.execute("DELETE FROM threads WHERE thread_id = ?", (other,))
+            merged[other] = thread_id
+        return thread_id
+
+    emails = sorted(component["emails"], key=lambda m: m[3] or 0)
+    key = next((subject_key(m[2].get("subject")) for m in emails if subject_key(m[2].get("subject"))), "")
+    has_phantom_parent = any(not node.startswith("email:") and node not in {m[1] for m in emails}
+                             for node in component["nodes"])
+    looks_like_reply = has_phantom_parent or any(is_reply_subject(m[2].get("subject")) for m in emails)
+    if key and looks_like_reply:
+        if key in new_subjects:
+            return new_subjects[key]
+        row = conn.execute(
+            "SELECT thread_id FROM threads WHERE subject_key = ? ORDER BY last_ts DESC LIMIT 1", (key,)
+        ).fetchone()
+        if row:
+            return merged.get(row[0], row[0])
+
+    thread_id = uuid.uuid4().hex
+    conn.execute("INSERT INTO threads (thread_id, subject_key) VALUES (?, ?)", (thread_id, key))
+    if key:
+        new_subjects.setdefault(key, thread_id)
+    return thread_id
+
+
+def _refresh_thread(conn, thread_id: str, emails: List[tuple]):
+    # a thread emptied by deletions can be revived by a late reply to it
+    conn.execute("INSERT OR IGNORE INTO threads (thread_id) VALUES (?)", (thread_id,))
+    conn.execute(
+        """UPDATE threads SET
+               email_count = (SELECT COUNT(*) FROM email_threads WHERE thread_id = ?),
+               first_ts = (SELECT MIN(date_ts) FROM email_threads WHERE thread_id = ?),
+               last_ts = (SELECT MAX(date_ts) FROM email_threads WHERE thread_id = ?)
+           WHERE thread_id = ?""",
+        (thread_id, thread_id, thread_id, thread_id),
+    )
+    # the thread's subject is its earliest subject without a reply prefix, if there is one
+    current = conn.execute("SELECT subject FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+    if current is None or (current[0] and not is_reply_subject(current[0])):
+        return
+    subjects = [str(m[2].get("subject") or "") for m in sorted(emails, key=lambda m: m[3] or 0)]
+    subjects = [subject for subject in subjects if subject]
+    originals = [subject for subject in subjects if not is_reply_subject(subject)]
+    subject = originals[0] if originals else (subjects[0] if subjects and not current[0] else "")
+    if subject:
+        conn.execute("UPDATE threads SET subject = ?, subject_key = ? WHERE thread_id = ?",
+                     (subject, subject_key(subject), thread_id))
+
+
+def remove_from_threads(conn: sqlite3.Connection, ids: List[str]):
+    """Take deleted emails out of their threads; the message-id map is kept so replies still link up."""
+    thread_ids = {row[0] for row in _select_in(
+        conn, "SELECT thread_id FROM email_threads WHERE email_id IN ({})", list(ids))}
+    conn.executemany("DELETE FROM email_threads WHERE email_id = ?", [(email_id,) for email_id in ids])
+    for thread_id in thread_ids:
+        _refresh_thread(conn, thread_id, [])
+    conn.executemany("DELETE FROM threads WHERE thread_id = ? AND email_count = 0",
+                     [(thread_id,) for thread_id in thread_ids])
+
+
+def clear_threads(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM message_ids")
+    conn.execute("DELETE FROM email_threads")
+    conn.execute("DELETE FROM threads")
+
+
+def thread_ids_for(conn: sqlite3.Connection, email_ids: Iterable[str]) -> Dict[str, tuple]:
+    """email id -> (thread id, thread size) for the emails that belong to a thread."""
+    return {
+        email_id: (thread_id, count)
+        for email_id, thread_id, count in _select_in(
+            conn,
+            """SELECT t.email_id, t.thread_id, th.email_count FROM email_threads t
+               JOIN threads th ON th.thread_id = t.thread_id WHERE t.email_id IN ({})""",
+            list(email_ids),
+        )
+    }
+
+
+def collapse_by_thread(results: List[Dict[str, Any]], threads: Dict[str, tuple]) -> List[Dict[str, Any]]:
+    """Keep the best-scoring result of each thread (results must be sorted by score)."""
+    collapsed, seen = [], set()
+    for result in results:
+        thread_id, size = threads.get(result["id"], (None, 1))
+        if thread_id is not None:
+            if thread_id in seen:
+                continue
+            seen.add(thread_id)
+        collapsed.append(dict(result, thread_id=thread_id, thread_size=size))
+    return collapsed
+
+
+def get_thread_rows(conn: sqlite3.Connection, email_or_thread_id: str) -> List[tuple]:
+    """(id, document, metadata_json) of a whole thread in date order, from one indexed query."""
+    return conn.execute(
+        """SELECT e.id, e.document, e.metadata_json FROM email_threads t
+           JOIN emails e ON e.id = t.email_id
+           WHERE t.thread_id = COALESCE(
+               (SELECT thread_id FROM email_threads WHERE email_id = ?), ?)
+           ORDER BY t.date_ts""",
+        (email_or_thread_id, email_or_thread_id),
+    ).fetchall()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Online index rebuild with an atomic switch to the new index generation.
+
+    python index_rebuild.py                          # drop deleted emails' vectors
+    python index_rebuild.py --partition-by time      # move to another index layout
+    python index_rebuild.py --model all-mpnet-base-v2   # re-embed the stored emails with another model
+
+The new index is built next to the current one (db_dir/gen-N) while the
+current one keeps serving searches and taking writes. Vectors are copied from
+the current index, or re-encoded from the stored documents when the model
+changes. Writes made meanwhile are replayed from the current index's tail,
+and the switch happens under the collection's write lock: vector_ids and the
+ingest batch ranges are renumbered and the generation recorded in one SQLite
+transaction, which is the commit point. Until then nothing the current index
+uses is touched, so a failed or interrupted rebuild just leaves it in place
+(its half-built generation is removed on the next start).
+"""
+
+import os
+import time
+import shutil
+import argparse
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from vector_db_manager import load_embedding_model, PARTITION_SCHEMES
+from config import REBUILD_BATCH_SIZE
+
+
+class IndexRebuild:
+    """Build a new index generation for a collection in the background and swap it in."""
+
+    def __init__(self, vector_db, partition_by: Optional[str] = None, model: Optional[str] = None,
+                 purge_deleted: bool = True, batch_size: int = REBUILD_BATCH_SIZE):
+        if partition_by is not None and partition_by not in PARTITION_SCHEMES:
+            raise ValueError(f"partition_by must be one of {PARTITION_SCHEMES}, not {partition_by!r}")
+        self.vector_db = vector_db
+        self.partition_by = partition_by or vector_db.partition_by
+        self.model = model or vector_db.model_name
+        self.purge_deleted = purge_deleted
+        self.batch_size = batch_size
+        self.status = "idle"       # idle | running | done | failed
+        self.stage = ""
+        self.progress = {"done": 0, "total": 0}
+        self.error = ""
+        self.stats = {}
+        self._thread = None
+
+    @property
+    def fraction(self) -> float:
+        total = self.progress["total"]
+        return min(1.0, self.progress["done"] / total) if total else 0.0
+
+    def start(self) -> threading.Thread:
+        self._thread = threading.Thread(target=self.run, name="index-rebuild", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def run(self) -> bool:
+        db = self.vector_db
+        if not db._rebuild_lock.acquire(blocking=False):
+            print("An index rebuild is already running for this collection")
+            return False
+        self.status, self.error = "running", ""
+        generation = db._generation + 1
+        generation_dir = os.path.dirname(db._index_paths(generation)[0])
+        try:
+            self._rebuild(generation)
+            self.status = "done"
+            return True
+        except Exception as e:
+            # rollback: the current generation was never modified; only the new one goes
+            shutil.rmtree(generation_dir, ignore_errors=True)
+            self.status, self.error = "failed", str(e)
+            print(f"❌ Index rebuild failed, keeping the current index: {e}")
+            return False
+        finally:
+            db._rebuild_lock.release()
+
+    def _rebuild(self, generation: int):
+        db = self.vector_db
+        started = time.time()
+        reembed = self.model != db.model_name
+        model = load_embedding_model(self.model) if reembed else None
+        index_file, shard_dir = db._index_paths(generation)
+        shutil.rmtree(os.path.dirname(index_file), ignore_errors=True)
+        os.makedirs(os.path.dirname(index_file))
+
+        self.stage = "snapshot"
+        epoch = db._index_epoch
+        with db._rw_lock.read_lock(), db._conn() as conn:
+            end = db.index.ntotal
+            dim = model.get_sentence_embedding_dimension() if reembed else db.index.d
+            if self.purge_deleted:
+                keep = [pos for (pos,) in conn.execute(
+                    """SELECT v.pos FROM vector_ids v JOIN emails e ON e.id = v.email_id
+                       WHERE e.deleted = 0 AND v.pos < ? ORDER BY v.pos""", (end,))]
+            else:
+                keep = list(range(end))
+        new = db._new_index(self.partition_by, dim, shard_dir)
+
+        # build from the snapshot, then catch up with what was added meanwhile, all without blocking writers
+        self.stage = "build"
+        self.progress = {"done": 0, "total": len(keep)}
+        self._copy(new, keep, model)
+        done = end
+        while True:
+            with db._rw_lock.read_lock():
+                now = db.index.ntotal
+            self._check_epoch(epoch)
+            if now - done <= self.batch_size:
+                break
+            self.progress["total"] += now - done
+            self._copy(new, list(range(done, now)), model)
+            keep.extend(range(done, now))
+            done = now
+        db._write_index(new, index_file)
+
+        self.stage = "swap"
+        with db._rw_lock.write_lock():
+            self._check_epoch(epoch)
+            # replay the last writes; searches wait only for this tail (and its index write)
+            tail = list(range(done, db.index.ntotal))
+            if tail:
+                self._copy(new, tail, model, locked=True)
+                keep.extend(tail)
+                db._write_index(new, index_file)
+            if new.ntotal != len(keep):
+                raise RuntimeError(f"new index has {new.ntotal} vectors, expected {len(keep)}")
+            self._commit(generation, new, keep, model)
+
+        db._remove_generations(keep=generation)
+        self.stats = {"vectors_before": done + len(tail), "vectors_after": len(keep),
+                      "seconds": round(time.time() - started, 1)}
+        print(f"Rebuilt vector index as generation {generation}: "
+              f"{self.stats['vectors_before']} -> {self.stats['vectors_after']} vectors")
+
+    def _check_epoch(self, epoch: int):
+        if self.vector_db._index_epoch != epoch:
+            raise RuntimeError("the collection was cleared during the rebuild")
+
+    def _copy(self, new, positions: List[int], model=None, locked: bool = False):
+        """Add the vectors at `positions` (old numbering) to `new`, in order."""
+        db = self.vector_db
+        for start in range(0, len(positions), self.batch_size):
+            batch = positions[start:start + self.batch_size]
+            owners = [db.id_map[pos] for pos in batch]
+            if model is not None:
+                embs = model.encode(db._vector_texts(batch, owners), batch_size=64,
+                                    show_progress_bar=False, convert_to_numpy=True).astype("float32")
+                embs = db._normalize(embs)
+            elif locked:
+                embs = self._reconstruct(batch)
+            else:
+                # appends can reallocate the index's storage, so reads take the read lock
+                with db._rw_lock.read_lock():
+                    embs = self._reconstruct(batch)
+            db._add_to_index(new, embs, owners)
+            self.progress["done"] += len(batch)
+
+    def _reconstruct(self, positions: List[int]) -> np.ndarray:
+        block = self.vector_db.index.reconstruct_n(positions[0], positions[-1] - positions[0] + 1)
+        return block[np.asarray(positions) - positions[0]]
+
+    def _commit(self, generation: int, new, keep: List[int], model):
+        """Renumber the SQLite side and switch generations (write lock held)."""
+        db = self.vector_db
+        kept = np.asarray(keep, dtype=np.int64)
+        with db._conn() as conn:
+            # owners as of now: deletes during the rebuild may have handed vectors to a promoted duplicate
+            owners = [db.id_map[pos] for pos in keep]
+            conn.execute("DELETE FROM vector_ids")
+            conn.executemany("INSERT INTO vector_ids (pos, email_id) VALUES (?, ?)", enumerate(owners))
+            batches = conn.execute("SELECT rowid, start_pos, end_pos FROM ingest_batches").fetchall()
+            conn.executemany("UPDATE ingest_batches SET start_pos = ?, end_pos = ? WHERE rowid = ?", [
+                (int(np.searchsorted(kept, start)), int(np.searchsorted(kept, end)), rowid)
+                for rowid, start, end in batches
+            ])
+            conn.execute("DELETE FROM ingest_batches WHERE start_pos >= end_pos")
+            db._set_state(conn, "index_generation", str(generation))
+            db._set_state(conn, "embedding_model", self.model)
+            db._set_state(conn, "embedding_dim", str(new.d))
+            db._bump_data_version(conn)
+            tombstones = conn.execute(
+                """SELECT COUNT(*) FROM emails e WHERE e.deleted = 1
+                   AND EXISTS (SELECT 1 FROM vector_ids v WHERE v.email_id = e.id)"""
+            ).fetchone()[0]
+        # committed: from here on the new generation is the collection's index
+        db._switch_generation(generation, new, owners, tombstones)
+        if model is not None:
+            with db._load_lock:
+                db.model_name, db._embedding_model, db.dim = self.model, model, new.d
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the vector index while it keeps serving searches")
+    parser.add_argument("--partition-by", choices=PARTITION_SCHEMES,
+                        help="index layout of the new generation (set INDEX_PARTITION_BY to match, "
+                             "or the next start converts it back)")
+    parser.add_argument("--model", help="re-embed the stored emails with this SentenceTransformer model")
+    parser.add_argument("--keep-deleted", action="store_true", help="keep vectors of deleted emails")
+    args = parser.parse_args()
+
+    from vector_db_manager import VectorDBManager
+
+    vector_db = VectorDBManager()
+    IndexRebuild(vector_db, args.partition_by, args.model, purge_deleted=not args.keep_deleted).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+from email_processor import EmailProcessor
+from corpus_summarizer import CorpusSummarizer
+from config import INGEST_SPOOL_DIR, INGEST_BATCH_SIZE, SPOOL_CHUNK_SIZE
+
+STAGES = ["spool", "parse", "validate", "index", "summarize"]
+
+_shared_registry = None
+_shared_registry_lock = threading.Lock()
+
+
+def get_job_registry() -> "JobRegistry":
+    """Return the process-wide job registry (jobs outlive the browser session that started them)."""
+    global _shared_registry
+    with _shared_registry_lock:
+        if _shared_registry is None:
+            _shared_registry = JobRegistry()
+        return _shared_registry
+
+
+class IngestJob:
+    """State of one background upload: spooled files, per-stage progress and the resume point."""
+
+    def __init__(self, job_id: str, spool_dir: str):
+        self.job_id = job_id
+        self.spool_dir = spool_dir
+        self.files: List[Dict[str, Any]] = []   # {"name", "path", "type", "size"}
+        self.status = "queued"                  # queued | running | done | failed | cancelled | interrupted
+        self.stage = "spool"
+        self.progress = {stage: {"done": 0, "total": 0} for stage in STAGES}
+        self.total_emails = 0
+        self.valid_count = 0
+        self.indexed = 0                        # valid emails already in the vector DB (resume offset)
+        self.created = time.time()
+        self.index_started = None
+        self.index_elapsed = 0.0
+        self.error = ""
+        self.summary = ""
+        self.sample: List[Dict[str, Any]] = []
+        self.cancel_event = threading.Event()
+
+    @property
+    def manifest_file(self) -> str:
+        return os.path.join(self.spool_dir, "job.json")
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    @property
+    def records_per_sec(self) -> float:
+        elapsed = self.index_elapsed
+        if self.index_started is not None:
+            elapsed += time.time() - self.index_started
+        return self.indexed / elapsed if elapsed > 0 else 0.0
+
+    def fraction(self, stage: str) -> float:
+        done, total = self.progress[stage]["done"], self.progress[stage]["total"]
+        if total <= 0:
+            return 1.0 if STAGES.index(stage) < STAGES.index(self.stage) or self.status == "done" else 0.0
+        return min(1.0, done / total)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "files": self.files,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "total_emails": self.total_emails,
+            "valid_count": self.valid_count,
+            "indexed": self.indexed,
+            "created": self.created,
+            "index_elapsed": self.index_elapsed,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], spool_dir: str) -> "IngestJob":
+        job = cls(data["job_id"], spool_dir)
+        for key in ("files", "status", "stage", "progress", "total_emails", "valid_count",
+                    "indexed", "created", "index_elapsed", "error"):
+            if key in data:
+                setattr(job, key, data[key])
+        return job
+
+    def save(self):
+        tmp = self.manifest_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp, self.manifest_file)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobRegistry:
+    """
+    Run ingestion jobs on a background worker.
+    Uploads are spooled to INGEST_SPOOL_DIR in chunks; parsing, validation and
+    indexing then happen off the Streamlit script thread. Each job records how
+    many valid emails are already indexed, so a cancelled, failed or
+    interrupted job resumes from that point instead of starting over.
+    """
+
+    def __init__(self, spool_root: str = INGEST_SPOOL_DIR, batch_size: int = INGEST_BATCH_SIZE):
+        self.spool_root = spool_root
+        self.batch_size = batch_size
+        self.jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+        # one worker: jobs queue behind each other instead of competing for the write lock
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-job")
+        os.makedirs(self.spool_root, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        """Pick up jobs left behind by a previous process; unfinished ones become resumable."""
+        for name in os.listdir(self.spool_root):
+            manifest = os.path.join(self.spool_root, name, "job.json")
+            if not os.path.exists(manifest):
+                continue
+            try:
+                with open(manifest, "r", encoding="utf-8") as f:
+                    job = IngestJob.from_dict(json.load(f), os.path.join(self.spool_root, name))
+            except Exception as e:
+                print(f"Error loading ingest job {name}: {e}")
+                continue
+            if job.status in ("queued", "running"):
+                job.status = "interrupted"
+            self.jobs[job.job_id] = job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[IngestJob]:
+        return sorted(self.jobs.values(), key=lambda job: job.created, reverse=True)
+
+    def submit(self, uploaded_files, vector_db, llm_handler=None) -> IngestJob:
+        """Spool `uploaded_files` (Streamlit UploadedFile objects) and queue the job."""
+        job_id = uuid.uuid4().hex[:12]
+        job = IngestJob(job_id, os.path.join(self.spool_root, job_id))
+        os.makedirs(job.spool_dir, exist_ok=True)
+
+        # the UploadedFile buffers belong to the session, so spooling happens on the caller's thread
+        job.status = "running"
+        job.progress["spool"]["total"] = sum(f.size for f in uploaded_files if f is not None)
+        for uploaded_file in uploaded_files:
+            if uploaded_file is None or uploaded_file.name.strip() == "":
+                continue  # Skip invalid file
+            name = os.path.basename(uploaded_file.name)
+            path = os.path.join(job.spool_dir, f"{len(job.files):03d}_{name}")
+            uploaded_file.seek(0)
+            with open(path, "wb") as f:
+                while True:
+                    chunk = uploaded_file.read(SPOOL_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    job.progress["spool"]["done"] += len(chunk)
+            job.files.append({
+                "name": name,
+                "path": path,
+                "type": os.path.splitext(name)[1].lower()[1:],
+                "size": os.path.getsize(path),
+            })
+
+        job.status = "queued"
+        job.save()
+        with self._lock:
+            self.jobs[job_id] = job
+        self._executor.submit(self._run, job, vector_db, llm_handler)
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or not job.is_active:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def resume(self, job_id: str, vector_db, llm_handler=None) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.status not in ("cancelled", "failed", "interrupted"):
+            return False
+        job.cancel_event = threading.Event()
+        job.status = "queued"
+        job.error = ""
+        job.save()
+        self._executor.submit(self._run, job, vector_db, llm_handler)
+        return True
+
+    def remove(self, job_id: str) -> bool:
+        """Forget a finished job and delete its spooled files."""
+        job = self.jobs.get(job_id)
+        if job is None or job.is_active:
+            return False
+        with self._lock:
+            self.jobs.pop(job_id, None)
+        shutil.rmtree(job.spool_dir, ignore_errors=True)
+        return True
+
+    def _check_cancel(self, job: IngestJob):
+        if job.cancel_event.is_set():
+            raise JobCancelled()
+
+    def _run(self, job: IngestJob, vector_db, llm_handler):
+        job.status = "running"
+        try:
+            valid_emails = self._parse_and_validate(job)
+            self._index(job, vector_db, valid_emails)
+
+            job.sample = valid_emails[:5]
+            if llm_handler is not None and valid_emails:
+                job.stage = "summarize"
+                job.progress["summarize"] = {"done": 0, "total": 1}
+
+                def summary_progress(done: int, total: int):
+                    job.progress["summarize"] = {"done": done, "total": total}
+
+                # earlier uploads reuse their cached cluster summaries; only this job's batch is mapped
+                job.summary = CorpusSummarizer(vector_db, llm_handler).summarize(summary_progress)
+
+            job.status = "done"
+            vector_db.clear_checkpoint(f"job:{job.job_id}")
+            shutil.rmtree(job.spool_dir, ignore_errors=True)
+            return
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"❌ Ingest job {job.job_id} failed: {e}")
+        finally:
+            if job.index_started is not None:
+                job.index_elapsed += time.time() - job.index_started
+                job.index_started = None
+        job.save()
+
+    def _parse_and_validate(self, job: IngestJob) -> List[Dict[str, Any]]:
+        job.stage = "parse"
+        job.progress["parse"] = {"done": 0, "total": len(job.files)}
+        processor = EmailProcessor()
+        parsed = []
+        for file_info in job.files:
+            self._check_cancel(job)
+            try:
+                parsed.extend(processor.load_emails_from_file(file_info["path"], file_info["type"]))
+            except Exception as e:
+                print(f"❌ Error processing file {file_info['name']}: {e}")
+            job.progress["parse"]["done"] += 1
+        job.total_emails = len(parsed)
+
+        job.stage = "validate"
+        job.progress["validate"] = {"done": 0, "total": len(parsed)}
+        valid_emails = []
+        for start in range(0, len(parsed), self.batch_size):
+            self._check_cancel(job)
+            batch = parsed[start:start + self.batch_size]
+            valid_emails.extend(processor.validate_emails(batch))
+            job.progress["validate"]["done"] += len(batch)
+        job.valid_count = len(valid_emails)
+        return valid_emails
+
+    def _index(self, job: IngestJob, vector_db, valid_emails: List[Dict[str, Any]]):
+        job.stage = "index"
+        # parsing is deterministic, so the first `indexed` valid emails are already stored;
+        # the collection's checkpoint is committed with each batch, so it wins over a stale job.json
+        checkpoint = vector_db.get_checkpoint(f"job:{job.job_id}")
+        if checkpoint is not None:
+            job.indexed = checkpoint[0]
+        job.progress["index"] = {"done": job.indexed, "total": len(valid_emails)}
+        job.index_started = time.time()
+        for start in range(job.indexed, len(valid_emails), self.batch_size):
+            self._check_cancel(job)
+            batch = valid_emails[start:start + self.batch_size]
+            if not vector_db.add_emails(batch, batch_id=job.job_id,
+                                        checkpoint=(f"job:{job.job_id}", start + len(batch))):
+                raise RuntimeError(f"failed to add emails {start}-{start + len(batch)} to vector database")
+            job.indexed = start + len(batch)
+            job.progress["index"]["done"] = job.indexed
+            job.save()
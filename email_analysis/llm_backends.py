@@ -0,0 +1,142 @@
+"""
+Pluggable LLM backends for LLMHandler.
+
+A backend exposes `models` (the first is the default), `complete(messages, **kwargs)`
+returning an OpenAI-style chat completion and `stream(messages, **kwargs)` yielding
+OpenAI-style chunks. `LLM_BACKEND` selects one:
+
+    openrouter   pooled AsyncLLMClient against OPEN_ROUTER_BASE_URL (default)
+    stub         the same client against a local stub_llm_server.py (LLM_STUB_URL)
+    local        in-process, deterministic extractive answers; no network or key
+"""
+
+import re
+import time
+from types import SimpleNamespace
+from typing import List, Dict, Any, Iterator
+
+from config import (LLM_BACKEND, LLM_STUB_URL, LLM_FALLBACK_MODELS, OPEN_ROUTER_BASE_URL,
+                    LOCAL_LLM_MODEL, LOCAL_LLM_LATENCY_MS, LOCAL_LLM_TOKEN_MS, get_open_router_api)
+
+QUERY_LINE = re.compile(r"^User Query:\s*(.+)$", re.MULTILINE)
+EMAIL_HEADER = re.compile(r"^Email \d+ \(Relevance: [^)]*\):$", re.MULTILINE)
+WORD = re.compile(r"[a-z0-9@._-]{3,}")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# prompt lines worth echoing in a summary: statistics and "- (N emails) theme" bullets
+SUMMARY_LINE = re.compile(r"^(Total Emails|Unique Domains|Top Domains|Date Range):|^- \(\d+ emails\)")
+
+
+def create_backend(name: str = LLM_BACKEND):
+    """Build the backend called `name` (see module docstring)."""
+    from llm_client import get_llm_client
+
+    if name == "local":
+        return LocalBackend()
+    if name == "stub":
+        return get_llm_client(LLM_STUB_URL, "stub", LLM_FALLBACK_MODELS)
+    if name == "openrouter":
+        return get_llm_client(OPEN_ROUTER_BASE_URL, get_open_router_api(), LLM_FALLBACK_MODELS)
+    raise ValueError(f"Unknown LLM_BACKEND {name!r}; expected 'openrouter', 'stub' or 'local'")
+
+
+def _best_sentence(text: str, terms: set) -> str:
+    sentences = [s.strip() for s in SENTENCE_END.split(text) if s.strip()]
+    if not sentences:
+        return ""
+    return max(sentences, key=lambda s: len(terms & set(WORD.findall(s.lower()))))
+
+
+def _email_blocks(prompt: str) -> List[Dict[str, str]]:
+    """Parse the "Email N (Relevance: x):" blocks written by ContextPacker."""
+    blocks = []
+    for header in EMAIL_HEADER.finditer(prompt):
+        fields = {}
+        for line in prompt[header.end():].split("\n\n", 1)[0].splitlines():
+            key, sep, value = line.partition(": ")
+            if sep:
+                fields[key.strip()] = value.strip()
+        blocks.append(fields)
+    return blocks
+
+
+def extractive_answer(messages: List[Dict[str, str]], max_items: int = 5) -> str:
+    """
+    Deterministic answer built only from the prompt: the email blocks sharing
+    the most terms with the user query, or the statistics and theme lines of a
+    summary prompt. Same messages, same answer.
+    """
+    prompt = messages[-1]["content"] if messages else ""
+    query_match = QUERY_LINE.search(prompt)
+    blocks = _email_blocks(prompt)
+
+    if query_match and blocks:
+        terms = set(WORD.findall(query_match.group(1).lower()))
+        ranked = sorted(
+            enumerate(blocks),
+            key=lambda item: (-len(terms & set(WORD.findall(" ".join(item[1].values()).lower()))), item[0]),
+        )[:max_items]
+        lines = [f"Based on the {len(ranked)} most relevant emails:", ""]
+        for n, (_, fields) in enumerate(ranked, 1):
+            who = fields.get("from") or fields.get("email") or fields.get("name") or "unknown sender"
+            line = f"{n}. **{who}**"
+            if fields.get("subject"):
+                line += f" — {fields['subject']}"
+            sentence = _best_sentence(fields.get("body", ""), terms)
+            if sentence:
+                line += f": {sentence}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    if query_match:
+        return "No relevant email data was found for this query."
+
+    picked = [line.strip() for line in prompt.splitlines() if SUMMARY_LINE.match(line.strip())]
+    if picked:
+        return "Dataset summary (extractive):\n\n" + "\n".join(picked[:12])
+    # e.g. a cluster prompt: keep the first subject lines it quotes
+    subjects = [line.strip() for line in prompt.splitlines() if line.startswith("Subject: ")]
+    if subjects:
+        return "Emails about: " + "; ".join(s[len("Subject: "):] for s in subjects[:max_items])
+    return " ".join(prompt.split()[:60])
+
+
+class LocalBackend:
+    """
+    In-process stand-in for the hosted models: `extractive_answer` with an
+    optional simulated first-token latency and per-token delay, so full
+    pipeline benchmarks run offline and reproducibly.
+    """
+
+    def __init__(self, latency_ms: float = LOCAL_LLM_LATENCY_MS, token_ms: float = LOCAL_LLM_TOKEN_MS):
+        self.models = [LOCAL_LLM_MODEL]
+        self.latency_ms = latency_ms
+        self.token_ms = token_ms
+        self.stats = {"calls": 0}
+
+    def _text(self, messages: List[Dict[str, str]], max_tokens: int = 1024) -> str:
+        self.stats["calls"] += 1
+        return extractive_answer(messages)[:max_tokens * 4]
+
+    def complete(self, messages: List[Dict[str, str]], model: str = None, max_tokens: int = 1024,
+                 **kwargs) -> Any:
+        text = self._text(messages, max_tokens)
+        pieces = text.split(" ")
+        time.sleep((self.latency_ms + self.token_ms * len(pieces)) / 1000)
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        return SimpleNamespace(
+            model=model or self.models[0],
+            choices=[SimpleNamespace(index=0, finish_reason="stop",
+                                     message=SimpleNamespace(role="assistant", content=text))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(pieces),
+                                  total_tokens=prompt_tokens + len(pieces)),
+        )
+
+    def stream(self, messages: List[Dict[str, str]], model: str = None, max_tokens: int = 1024,
+               **kwargs) -> Iterator[Any]:
+        text = self._text(messages, max_tokens)
+        time.sleep(self.latency_ms / 1000)
+        for i, word in enumerate(text.split(" ")):
+            if i and self.token_ms:
+                time.sleep(self.token_ms / 1000)
+            piece = word if i == 0 else " " + word
+            yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=piece))])
@@ -0,0 +1,256 @@
+import time
+import queue
+import random
+import asyncio
+import threading
+from typing import List, Dict, Any, Optional, Iterator, Callable, Awaitable
+
+from config import (LLM_MAX_CONCURRENCY, LLM_RATE_PER_SEC, LLM_RATE_BURST, LLM_MAX_RETRIES,
+                    LLM_BACKOFF_BASE_S, LLM_BACKOFF_CAP_S, LLM_TIMEOUT_S, LLM_DEADLINE_S,
+                    LLM_HEDGE_DELAY_S, LLM_POOL_SIZE)
+
+_clients: Dict[tuple, "AsyncLLMClient"] = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(base_url: str, api_key: str, models: List[str]) -> "AsyncLLMClient":
+    """One client (connection pool, limiter, event loop) per endpoint and key, shared process-wide."""
+    key = (base_url, api_key, tuple(models))
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = AsyncLLMClient(base_url, api_key, models)
+        return _clients[key]
+
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _is_retryable(error: Exception) -> bool:
+    import openai
+
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class AsyncLLMClient:
+    """
+    Async OpenAI-compatible chat client shared by every session.
+
+    Calls run on a private event loop thread, so the synchronous Streamlit code
+    uses `complete()` / `stream()` while the work itself is async. All calls
+    share one pooled HTTP client, a global concurrency semaphore and a token
+    bucket rate limiter; retryable failures (429, 5xx, timeouts) back off
+    exponentially with full jitter, honouring Retry-After. Every call has an
+    overall deadline, and `hedge=True` starts the next fallback model if the
+    current one has not answered within `hedge_delay_s`.
+    """
+
+    def __init__(self, base_url: str, api_key: str, models: List[str],
+                 max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 rate_per_sec: float = LLM_RATE_PER_SEC,
+                 burst: int = LLM_RATE_BURST,
+                 max_retries: int = LLM_MAX_RETRIES,
+                 timeout_s: float = LLM_TIMEOUT_S,
+                 deadline_s: float = LLM_DEADLINE_S,
+                 hedge_delay_s: float = LLM_HEDGE_DELAY_S,
+                 pool_size: int = LLM_POOL_SIZE):
+        self.base_url = base_url
+        self.models = list(models)
+        self.max_retries = max_retries
+        self.deadline_s = deadline_s
+        self.hedge_delay_s = hedge_delay_s
+        self.stats = {"calls": 0, "retries": 0, "hedges": 0, "failures": 0}
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-client-loop", daemon=True)
+        self._thread.start()
+        # asyncio primitives and the HTTP pool must be created on the loop that uses them
+        self._run(self._setup(api_key, max_concurrency, rate_per_sec, burst, timeout_s, pool_size))
+
+    async def _setup(self, api_key, max_concurrency, rate_per_sec, burst, timeout_s, pool_size):
+        import httpx
+        from openai import AsyncOpenAI
+
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(timeout_s, connect=10.0),
+        )
+        # retries are handled here, with the shared limiter, rather than inside the SDK
+        self._client = AsyncOpenAI(base_url=self.base_url, api_key=api_key,
+                                   http_client=self._http, max_retries=0)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._bucket = TokenBucket(rate_per_sec, burst)
+
+    def _run(self, coro, timeout: Optional[float] = None):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def close(self):
+        self._run(self._http.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _with_retries(self, attempt: Callable[[], Awaitable[Any]], limit: bool = True) -> Any:
+        """Run `attempt` with retries; `limit=False` when the caller already holds a concurrency slot."""
+        for retry in range(self.max_retries + 1):
+            try:
+                await self._bucket.acquire()
+                if not limit:
+                    return await attempt()
+                async with self._semaphore:
+                    return await attempt()
+            except Exception as e:
+                if retry >= self.max_retries or not _is_retryable(e):
+                    raise
+                self.stats["retries"] += 1
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(LLM_BACKOFF_CAP_S, LLM_BACKOFF_BASE_S * 2 ** retry))
+                await asyncio.sleep(delay)
+
+    async def _hedged(self, call: Callable[[str], Awaitable[Any]], models: List[str]) -> Any:
+        """Race `call` across `models`, starting the next one after `hedge_delay_s` or on failure."""
+        waiting = list(models)
+        tasks, errors = [], []
+
+        def launch():
+            if tasks:
+                self.stats["hedges"] += 1
+            tasks.append(asyncio.ensure_future(call(waiting.pop(0))))
+
+        launch()
+        try:
+            while True:
+                active = [task for task in tasks if not task.done()]
+                if not active:
+                    if not waiting:
+                        raise errors[-1]
+                    launch()
+                    continue
+                done, _ = await asyncio.wait(active, timeout=self.hedge_delay_s if waiting else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()  # hedge timer fired
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def acomplete(self, messages: List[Dict[str, str]], model: Optional[str] = None,
+                        hedge: bool = False, deadline_s: Optional[float] = None, **kwargs) -> Any:
+        """Chat completion with retries, an overall deadline and optional hedging across models."""
+        self.stats["calls"] += 1
+
+        async def call(call_model: str):
+            return await self._with_retries(lambda: self._client.chat.completions.create(
+                model=call_model, messages=messages, stream=False, **kwargs))
+
+        primary = model or self.models[0]
+        if hedge and self.hedge_delay_s > 0:
+            models = [primary] + [m for m in self.models if m != primary]
+            work = self._hedged(call, models)
+        else:
+            work = call(primary)
+        try:
+            return await asyncio.wait_for(work, deadline_s or self.deadline_s)
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+
+    async def astream(self, messages: List[Dict[str, str]], model: Optional[str] = None,
+                      deadline_s: Optional[float] = None, **kwargs):
+        """
+        Streamed chat completion; the deadline covers the time to the first chunk.
+        The concurrency slot is held until the stream is consumed or closed.
+        """
+        self.stats["calls"] += 1
+
+        async def open_stream():
+            await self._semaphore.acquire()
+            try:
+                return await self._with_retries(lambda: self._client.chat.completions.create(
+                    model=model or self.models[0], messages=messages, stream=True, **kwargs), limit=False)
+            except BaseException:
+                self._semaphore.release()
+                raise
+
+        stream = await asyncio.wait_for(open_stream(), deadline_s or self.deadline_s)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            try:
+                await stream.close()     # closes the HTTP response if the consumer stopped early
+            finally:
+                self._semaphore.release()
+
+    def complete(self, messages: List[Dict[str, str]], **kwargs) -> Any:
+        """Blocking wrapper around `acomplete` for synchronous callers."""
+        return self._run(self.acomplete(messages, **kwargs))
+
+    def stream(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[Any]:
+        """Blocking iterator over `astream` chunks for synchronous callers."""
+        items: queue.Queue = queue.Queue()
+
+        async def pump():
+            chunks = self.astream(messages, **kwargs)
+            try:
+                async for chunk in chunks:
+                    items.put(("chunk", chunk))
+            except BaseException as e:
+                items.put(("error", e))
+                raise
+            finally:
+                await chunks.aclose()
+                items.put(("end", None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        try:
+            while True:
+                kind, item = items.get()
+                if kind == "chunk":
+                    yield item
+                elif kind == "error":
+                    raise item
+                else:
+                    return
+        finally:
+            # the consumer may stop early (e.g. Streamlit rerun); cancelling the pump closes
+            # the stream and its HTTP response and releases the concurrency slot
+            future.cancel()
@@ -1,80 +1,115 @@
-from groq import Groq
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 from config import GROQ_API_KEY, GROQ_MODEL
-from config import QWEN_MODEL,OPEN_ROUTER_API,DEEP_SEEK_MODEL,LLAMA_MODEL
-from openai import OpenAI
+from config import LLM_BACKEND
+from context_packer import ContextPacker, estimate_tokens, clean_body, truncate_tokens
+from llm_backends import create_backend
 
 
 class LLMHandler:
     """Handle LLM interactions using Groq API with Llama3"""
     
-    def __init__(self):
-        if not GROQ_API_KEY:
+    def __init__(self, backend: str = LLM_BACKEND):
+        # the offline backends need no API keys
+        if backend == "openrouter" and not GROQ_API_KEY:
             raise ValueError("GROQ_API_KEY not found in environment variables")
         
         # self.client = Groq(api_key=GROQ_API_KEY)
         # self.model = GROQ_MODEL
 
-        self.client =OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=OPEN_ROUTER_API
-        )
-        #
-        self.model = DEEP_SEEK_MODEL
+        # see llm_backends; the remote ones share one pooled async client per endpoint
+        self.client = create_backend(backend)
+        self.model = self.client.models[0]
+        self.context_packer = ContextPacker()
     
-    def generate_response(self, query: str, search_results: List[Dict[str, Any]]) -> str:
-        """Generate response based on query and search results"""
+    def generate_response(self, query: str, search_results: List[Dict[str, Any]],
+                          prompt_stats: Optional[Dict[str, int]] = None) -> str:
+        """
+        Generate response based on query and search results.
+        `prompt_stats` (if given) receives the packed context stats and `prompt_tokens`.
+        """
         try:
-            # Prepare context from search results
-            context = self._prepare_context(search_results)
-            
-            # Create prompt
-            prompt = self._create_prompt(query, context)
-            
-            # Generate response using Groq
-            response = self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an intelligent email analysis assistant. You help users find and analyze email data based on their queries. Provide accurate, helpful, and well-formatted responses based on the email data provided."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
+            response = self.client.complete(
+                self._response_messages(query, search_results, prompt_stats),
                 model=self.model,
+                hedge=True,
                 temperature=0.3,
                 max_tokens=1024,
-                top_p=1,
-                stream=False
+                top_p=1
             )
             
+            if prompt_stats is not None and getattr(response, "usage", None):
+                prompt_stats["usage_prompt_tokens"] = response.usage.prompt_tokens
             return response.choices[0].message.content
             
         except Exception as e:
             return f"Error generating response: {str(e)}"
+
+    def generate_response_stream(self, query: str, search_results: List[Dict[str, Any]],
+                                 timings: Optional[Dict[str, float]] = None,
+                                 prompt_stats: Optional[Dict[str, int]] = None) -> Iterator[str]:
+        """
+        Streaming variant of `generate_response`: yields text as it arrives.
+        `timings` (if given) receives `ttft_ms` and `total_ms`.
+        """
+        try:
+            messages = self._response_messages(query, search_results, prompt_stats)
+            yield from self._stream_chat(messages, 1024, timings, top_p=1)
+        except Exception as e:
+            yield f"Error generating response: {str(e)}"
+
+    def _response_messages(self, query: str, search_results: List[Dict[str, Any]],
+                           prompt_stats: Optional[Dict[str, int]] = None) -> List[Dict[str, str]]:
+        # Prepare context from search results
+        context = self._prepare_context(search_results, prompt_stats)
+
+        # Create prompt
+        prompt = self._create_prompt(query, context)
+
+        messages = [
+            {
+                "role": "system",
+                "content": "You are an intelligent email analysis assistant. You help users find and analyze email data based on their queries. Provide accurate, helpful, and well-formatted responses based on the email data provided."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+        if prompt_stats is not None:
+            prompt_stats["prompt_tokens"] = sum(estimate_tokens(m["content"]) for m in messages)
+        return messages
+
+    def _stream_chat(self, messages: List[Dict[str, str]], max_tokens: int,
+                     timings: Optional[Dict[str, float]] = None, **kwargs) -> Iterator[str]:
+        """Yield content deltas of a streamed chat completion, recording time-to-first-token."""
+        timings = timings if timings is not None else {}
+        started = time.perf_counter()
+        stream = self.client.stream(
+            messages,
+            model=self.model,
+            temperature=0.3,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if "ttft_ms" not in timings:
+                timings["ttft_ms"] = (time.perf_counter() - started) * 1000
+            yield delta
+        timings["total_ms"] = (time.perf_counter() - started) * 1000
     
-    def _prepare_context(self, search_results: List[Dict[str, Any]]) -> str:
-        """Prepare context from search results"""
-        if not search_results:
-            return "No relevant email data found."
-        
-        context_parts = []
-        for i, result in enumerate(search_results, 1):  # Limit to top 5 results
-            metadata = result.get('metadata', {})
-            distance = result.get('distance', 0)
-            
-            # Format email information
-            email_info = []
-            for key, value in metadata.items():
-                if value and str(value).strip():
-                    email_info.append(f"{key}: {value}")
-            
-            if email_info:
-                context_parts.append(f"Email {i} (Relevance: {1-distance:.2f}):\n" + "\n".join(email_info))
-        
-        return "\n\n".join(context_parts)
+    def _prepare_context(self, search_results: List[Dict[str, Any]],
+                         prompt_stats: Optional[Dict[str, int]] = None) -> str:
+        """Prepare context from search results, packed into the configured token budget"""
+        context, stats = self.context_packer.pack(search_results)
+        if prompt_stats is not None:
+            prompt_stats.update(stats)
+        return context
     
     def _create_prompt(self, query: str, context: str) -> str:
         """Create prompt for LLM"""
@@ -133,36 +168,94 @@ Response:"""
         
         return intent_analysis
     
-    def generate_summary(self, emails_data: List[Dict[str, Any]]) -> str:
-        """Generate a summary of the email dataset"""
+    def generate_summary(self, emails_data: List[Dict[str, Any]],
+                         stats: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Generate a summary of the email dataset.
+        Pass `stats` (AnalyticsEngine.overview()) to use the stored aggregates
+        instead of scanning `emails_data`, which is then only used for samples.
+        """
         try:
             if not emails_data:
                 return "No email data available for summary."
             
-            # Prepare basic statistics
-            total_emails = len(emails_data)
-            
-            # Extract domains
-            domains = set()
-            for email in emails_data:
-                if 'email' in email:
-                    domain = email['email'].split('@')[-1] if '@' in email['email'] else ''
-                    if domain:
-                        domains.add(domain)
+            response = self.client.complete(
+                self._summary_messages(emails_data, stats),
+                model=self.model,
+                hedge=True,
+                temperature=0.3,
+                max_tokens=512
+            )
             
-            # Create summary prompt
-            sample_emails = emails_data[:3]  # Sample for analysis
-            sample_text = "\n".join([email.get('text_content', '')[:200] for email in sample_emails])
+            return response.choices[0].message.content
             
+        except Exception as e:
+            return f"Error generating summary: {str(e)}"
+
+    def generate_summary_stream(self, emails_data: List[Dict[str, Any]],
+                                stats: Optional[Dict[str, Any]] = None,
+                                timings: Optional[Dict[str, float]] = None) -> Iterator[str]:
+        """Streaming variant of `generate_summary`; `timings` receives `ttft_ms` and `total_ms`."""
+        try:
+            if not emails_data:
+                yield "No email data available for summary."
+                return
+            yield from self._stream_chat(self._summary_messages(emails_data, stats), 512, timings)
+        except Exception as e:
+            yield f"Error generating summary: {str(e)}"
+
+    def summarize_cluster(self, emails: List[Dict[str, Any]], cluster_size: int) -> str:
+        """Map step of the corpus summary: describe a cluster from its representative emails."""
+        try:
+            samples = []
+            for email in emails:
+                metadata = email.get("metadata", {})
+                body, _ = truncate_tokens(clean_body(email.get("document", "")), 120)
+                samples.append(f"From: {metadata.get('from') or metadata.get('email', '')}\n"
+                               f"Subject: {metadata.get('subject', '')}\n{body}")
             prompt = f"""
+The following emails are the most typical members of a group of {cluster_size} similar emails.
+
+{chr(10).join(samples)}
+
+In 2-3 sentences, describe what this group is about: its topics, the kind of senders and its purpose.
+"""
+            response = self.client.complete(
+                [{"role": "user", "content": prompt}],
+                model=self.model,
+                temperature=0.3,
+                max_tokens=160
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            return f"Error generating summary: {str(e)}"
+
+    def reduce_summaries(self, partials: List[Tuple[int, str]],
+                         stats: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Reduce step of the corpus summary: merge (cluster size, summary) pairs.
+        With `stats` (AnalyticsEngine.overview()) the result is the final dataset summary.
+        """
+        try:
+            groups = "\n".join(f"- ({size} emails) {summary}" for size, summary in partials)
+            if stats is None:
+                prompt = f"""
+Merge these descriptions of groups of emails into one description of at most 6 sentences, keeping the largest themes:
+
+{groups}
+"""
+                max_tokens = 300
+            else:
+                prompt = f"""
 Analyze this email dataset and provide a comprehensive summary:
 
-Total Emails: {total_emails}
-Unique Domains: {len(domains)}
-Top Domains: {', '.join(list(domains)[:5])}
+Total Emails: {stats['total']}
+Unique Domains: {stats['distinct_domains']}
+Top Domains: {', '.join(domain for domain, _ in stats['top_domains'])}
+Date Range: {stats['first_day']} to {stats['last_day']}
 
-Sample Email Data:
-{sample_text}
+Themes found by clustering the whole dataset (group size, description):
+{groups}
 
 Please provide:
 1. Dataset overview
@@ -172,24 +265,73 @@ Please provide:
 
 Keep the summary concise but informative.
 """
-            
-            response = self.client.chat.completions.create(
-                messages=[
+                max_tokens = 700
+            response = self.client.complete(
+                [
                     {
                         "role": "system",
                         "content": "You are a data analyst specializing in email dataset analysis. Provide clear, professional summaries."
                     },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
+                    {"role": "user", "content": prompt}
                 ],
                 model=self.model,
+                hedge=True,
                 temperature=0.3,
-                max_tokens=512
+                max_tokens=max_tokens
             )
-            
             return response.choices[0].message.content
-            
         except Exception as e:
-            return f"Error generating summary: {str(e)}"
\ No newline at end of file
+            return f"Error generating summary: {str(e)}"
+
+    def _summary_messages(self, emails_data: List[Dict[str, Any]],
+                          stats: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+        if stats is not None:
+            total_emails = stats["total"]
+            unique_domains = stats["distinct_domains"]
+            top_domains = [domain for domain, _ in stats["top_domains"]]
+        else:
+            # Prepare basic statistics
+            total_emails = len(emails_data)
+
+            # Extract domains
+            domains = set()
+            for email in emails_data:
+                if 'email' in email:
+                    domain = email['email'].split('@')[-1] if '@' in email['email'] else ''
+                    if domain:
+                        domains.add(domain)
+            unique_domains = len(domains)
+            top_domains = list(domains)[:5]
+
+        # Create summary prompt
+        sample_emails = emails_data[:3]  # Sample for analysis
+        sample_text = "\n".join([email.get('text_content', '')[:200] for email in sample_emails])
+
+        prompt = f"""
+Analyze this email dataset and provide a comprehensive summary:
+
+Total Emails: {total_emails}
+Unique Domains: {unique_domains}
+Top Domains: {', '.join(top_domains)}
+
+Sample Email Data:
+{sample_text}
+
+Please provide:
+1. Dataset overview
+2. Key patterns or insights
+3. Data quality assessment
+4. Potential use cases for this data
+
+Keep the summary concise but informative.
+"""
+        return [
+            {
+                "role": "system",
+                "content": "You are a data analyst specializing in email dataset analysis. Provide clear, professional summaries."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Incremental sync of a Maildir or a directory tree of .eml files into the collection.
+
+    python mail_sync.py /path/to/Maildir            # one pass
+    python mail_sync.py /path/to/Maildir --watch    # keep polling
+
+A manifest (path, size, mtime, content hash, email id) lives in the
+collection's SQLite. Each pass parses only new or changed files, follows
+renames (Maildir moves new/ -> cur/ and rewrites flags in the file name) by
+content hash, and tombstones the emails of files that disappeared.
+"""
+
+import os
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+from typing import List, Dict, Optional, Iterator, Tuple
+
+from email_processor import EmailProcessor
+from config import SYNC_BATCH_SIZE, SYNC_POLL_INTERVAL_S, SYNC_FULL_SCAN_EVERY
+
+# a file is a message if it ends in .eml or sits in a Maildir cur/ or new/ folder
+MAILDIR_FOLDERS = ("cur", "new")
+
+
+def ensure_schema(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS sync_manifest (
+               path     TEXT PRIMARY KEY,
+               dir      TEXT NOT NULL,
+               size     INTEGER NOT NULL,
+               mtime    REAL NOT NULL,
+               sha1     TEXT NOT NULL,
+               email_id TEXT,            -- NULL: not indexable (unparseable or failed validation)
+               synced   REAL NOT NULL
+           )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_manifest_dir ON sync_manifest (dir)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_manifest_sha1 ON sync_manifest (sha1)")
+    # directory mtimes from the last pass: unchanged directories gained, lost or renamed nothing
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS sync_dirs (
+               path  TEXT PRIMARY KEY,
+               mtime REAL NOT NULL
+           )"""
+    )
+
+
+def clear_manifest(conn):
+    conn.execute("DELETE FROM sync_manifest")
+    conn.execute("DELETE FROM sync_dirs")
+
+
+def file_sha1(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class MailSync:
+    """Keep the collection in step with a mail directory, one pass or continuously."""
+
+    def __init__(self, vector_db, root: str, batch_size: int = SYNC_BATCH_SIZE):
+        self.vector_db = vector_db
+        self.root = os.path.abspath(root)
+        self.batch_size = batch_size
+        self.processor = EmailProcessor()
+        self.passes = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._walked: set = set()
+
+    @staticmethod
+    def _is_message(dir_path: str, name: str) -> bool:
+        if name.startswith("."):
+            return False
+        return name.endswith(".eml") or os.path.basename(dir_path) in MAILDIR_FOLDERS
+
+    def _changed_dirs(self, full: bool) -> Iterator[Tuple[str, float, List[os.DirEntry]]]:
+        """Walk the tree; yield (dir, mtime, message entries) for directories that need a look."""
+        with self.vector_db._conn() as conn:
+            known = dict(conn.execute("SELECT path, mtime FROM sync_dirs").fetchall())
+        self._walked = set()
+        pending = [self.root]
+        while pending:
+            dir_path = pending.pop()
+            self._walked.add(dir_path)
+            try:
+                mtime = os.stat(dir_path).st_mtime
+                entries = list(os.scandir(dir_path))
+            except OSError:
+                continue
+            messages = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != "tmp":  # Maildir tmp/ holds messages still being written
+                        pending.append(entry.path)
+                elif self._is_message(dir_path, entry.name):
+                    messages.append(entry)
+            if full or known.get(dir_path) != mtime:
+                yield dir_path, mtime, messages
+
+    def sync_once(self, full: bool = True) -> Dict[str, int]:
+        """
+        One pass. With `full=False`, directories whose mtime is unchanged are
+        skipped (no stat per file), which misses only in-place rewrites.
+        """
+        stats = {"added": 0, "changed": 0, "renamed": 0, "removed": 0, "skipped": 0, "errors": 0}
+        new_files: List[Tuple[str, str, os.stat_result]] = []
+        dropped: Dict[str, Tuple[str, Optional[str]]] = {}  # path -> (sha1, email_id)
+        replaced: List[str] = []
+        seen_dirs = []
+
+        for dir_path, mtime, entries in self._changed_dirs(full):
+            seen_dirs.append((dir_path, mtime))
+            with self.vector_db._conn() as conn:
+                manifest = {row[0]: row[1:] for row in conn.execute(
+                    "SELECT path, size, mtime, sha1, email_id FROM sync_manifest WHERE dir = ?", (dir_path,)
+                )}
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                known = manifest.pop(entry.path, None)
+                if known is None:
+                    new_files.append((entry.path, dir_path, st))
+                elif known[0] != st.st_size or known[1] != st.st_mtime:
+                    new_files.append((entry.path, dir_path, st))
+                    replaced.append(entry.path)
+                    dropped[entry.path] = (known[2], known[3])
+            for path, (_, _, sha1, email_id) in manifest.items():
+                dropped[path] = (sha1, email_id)
+
+        # directories that disappeared altogether lost every file they held
+        with self.vector_db._conn() as conn:
+            vanished = [d for (d,) in conn.execute("SELECT DISTINCT dir FROM sync_manifest")
+                        if d not in self._walked]
+            for dir_path in vanished:
+                for path, sha1, email_id in conn.execute(
+                    "SELECT path, sha1, email_id FROM sync_manifest WHERE dir = ?", (dir_path,)
+                ):
+                    dropped[path] = (sha1, email_id)
+            conn.executemany("DELETE FROM sync_dirs WHERE path = ?", [(d,) for d in vanished])
+
+        # hash new files; a hash matching a dropped file is a rename, not a new email
+        dropped_by_hash = {}
+        for path, (sha1, email_id) in dropped.items():
+            dropped_by_hash.setdefault(sha1, []).append((path, email_id))
+        to_parse, moves = [], []
+        for path, dir_path, st in new_files:
+            try:
+                sha1 = file_sha1(path)
+            except OSError:
+                stats["errors"] += 1
+                continue
+            candidates = dropped_by_hash.get(sha1)
+            if candidates:
+                old_path, email_id = candidates.pop()
+                del dropped[old_path]
+                moves.append((path, dir_path, st, sha1, email_id, old_path))
+                stats["renamed" if old_path != path else "skipped"] += 1
+            else:
+                to_parse.append((path, dir_path, st, sha1))
+                if path in replaced:
+                    stats["changed"] += 1
+
+        with self.vector_db._conn() as conn:
+            for path, dir_path, st, sha1, email_id, old_path in moves:
+                conn.execute("DELETE FROM sync_manifest WHERE path = ?", (old_path,))
+                self._record(conn, path, dir_path, st, sha1, email_id)
+
+        # one summary batch per pass: cached partials of earlier passes don't cover these emails
+        batch_id = f"sync:{self.root}:{uuid.uuid4().hex}"
+        for start in range(0, len(to_parse), self.batch_size):
+            stats["added"] += self._ingest(to_parse[start:start + self.batch_size], stats, batch_id)
+
+        if dropped:
+            with self.vector_db._conn() as conn:
+                conn.executemany("DELETE FROM sync_manifest WHERE path = ? AND sha1 = ?",
+                                 [(path, sha1) for path, (sha1, _) in dropped.items()])
+                # identical copies share one email, which stays while any copy is left
+                gone = [email_id for email_id in {e for _, e in dropped.values() if e}
+                        if not conn.execute("SELECT 1 FROM sync_manifest WHERE email_id = ? LIMIT 1",
+                                            (email_id,)).fetchone()]
+            if gone and not self.vector_db.delete_emails(gone):
+                raise RuntimeError("failed to tombstone removed messages")
+            stats["removed"] = len([p for p in dropped if p not in replaced])
+
+        with self.vector_db._conn() as conn:
+            conn.executemany("INSERT OR REPLACE INTO sync_dirs (path, mtime) VALUES (?, ?)", seen_dirs)
+        self.passes += 1
+        return stats
+
+    def _ingest(self, files: List[tuple], stats: Dict[str, int], batch_id: str) -> int:
+        """Parse, validate and add one batch; every file gets a manifest row either way."""
+        fresh, records = {}, []
+        with self.vector_db._conn() as conn:
+            for path, dir_path, st, sha1 in files:
+                email_id = None
+                try:
+                    parsed = self.processor.parse_message_file(path)
+                    if self.processor.validate_emails([parsed]):
+                        email_id, stored = self._email_id(conn, sha1)
+                        if not stored:
+                            fresh[email_id] = parsed
+                except Exception as e:
+                    print(f"Error parsing {path}: {e}")
+                    stats["errors"] += 1
+                records.append((path, dir_path, st, sha1, email_id))
+
+        if fresh and not self.vector_db.add_emails(list(fresh.values()), batch_id=batch_id,
+                                                   email_ids=list(fresh)):
+            raise RuntimeError(f"failed to add {len(fresh)} synced messages to vector database")
+
+        with self.vector_db._conn() as conn:
+            for path, dir_path, st, sha1, email_id in records:
+                self._record(conn, path, dir_path, st, sha1, email_id)
+        return len(fresh)
+
+    def _email_id(self, conn, sha1: str) -> Tuple[str, bool]:
+        """
+        Id for a message with content `sha1` and whether it is already stored.
+        Derived from the content, so a pass that crashed between adding emails
+        and writing the manifest doesn't duplicate them when it is re-run; ids
+        of tombstoned emails are skipped, since they can't be reused.
+        """
+        for n in range(1000):
+            email_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.root}:{sha1}" + (f":{n}" if n else "")))
+            row = conn.execute("SELECT deleted FROM emails WHERE id = ?", (email_id,)).fetchone()
+            if row is None or not row[0]:
+                return email_id, row is not None
+        return str(uuid.uuid4()), False
+
+    @staticmethod
+    def _record(conn, path: str, dir_path: str, st: os.stat_result, sha1: str, email_id: Optional[str]):
+        conn.execute(
+            """INSERT OR REPLACE INTO sync_manifest (path, dir, size, mtime, sha1, email_id, synced)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (path, dir_path, st.st_size, st.st_mtime, sha1, email_id, time.time()),
+        )
+
+    def watch(self, interval: float = SYNC_POLL_INTERVAL_S, full_every: int = SYNC_FULL_SCAN_EVERY):
+        """Poll until `stop()`; every `full_every`-th pass is a full scan."""
+        while not self._stop.is_set():
+            try:
+                stats = self.sync_once(full=self.passes % full_every == 0)
+                if any(stats[key] for key in ("added", "changed", "renamed", "removed")):
+                    print(f"Mail sync {self.root}: {stats}")
+            except Exception as e:
+                print(f"Error syncing {self.root}: {e}")
+            self._stop.wait(interval)
+
+    def start(self, interval: float = SYNC_POLL_INTERVAL_S) -> threading.Thread:
+        """Run `watch` on a daemon thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.watch, args=(interval,), name="mail-sync", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync a Maildir / .eml directory into the collection")
+    parser.add_argument("root")
+    parser.add_argument("--watch", action="store_true", help="keep polling for changes")
+    parser.add_argument("--interval", type=float, default=SYNC_POLL_INTERVAL_S)
+    args = parser.parse_args()
+
+    from vector_db_manager import get_shared_manager
+
+    sync = MailSync(get_shared_manager(), args.root)
+    if args.watch:
+        try:
+            sync.watch(args.interval)
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(sync.sync_once())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Header-only mbox import with lazy bodies.
+
+    python mbox_scan.py archive.mbox            # headers only: counts, contacts, domains, threads
+    python mbox_scan.py archive.mbox --embed    # then embed the bodies for semantic search
+
+The scan memory-maps the file, splits it on "From " lines and parses only
+each message's header block (BytesHeaderParser); the byte offset and length
+of every message go to SQLite. Bodies are read and decoded from the map
+only when a message is embedded (`embed_pending`) or shown in search results
+(`hydrate_bodies`). The archive must stay at its path for that.
+"""
+
+import os
+import mmap
+import uuid
+import argparse
+import threading
+from email import message_from_bytes
+from email.parser import BytesHeaderParser
+from typing import List, Dict, Any, Optional, Iterator, Tuple, Callable
+
+import doc_store
+from email_processor import EmailProcessor, header_fields, message_body
+from config import MBOX_SCAN_BATCH_SIZE, INGEST_BATCH_SIZE
+
+_maps: Dict[str, mmap.mmap] = {}
+_maps_lock = threading.Lock()
+
+
+def ensure_schema(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS mbox_messages (
+               email_id TEXT PRIMARY KEY,
+               path     TEXT NOT NULL,
+               offset   INTEGER NOT NULL,
+               length   INTEGER NOT NULL
+           )"""
+    )
+
+
+def clear_messages(conn):
+    conn.execute("DELETE FROM mbox_messages")
+
+
+def _mapped(path: str, end: int) -> mmap.mmap:
+    """Shared read-only map of `path`, re-mapped if the file has grown past `end` since."""
+    with _maps_lock:
+        mm = _maps.get(path)
+        if mm is None or len(mm) < end:
+            # the old map isn't closed: another thread may still be slicing it
+            with open(path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            _maps[path] = mm
+        return mm
+
+
+def iter_messages(path: str, start: int = 0) -> Iterator[Tuple[int, int, Any, int]]:
+    """
+    (offset, length, headers, next) per message from byte `start` (a "From " line):
+    the message without its From_ line, its parsed header block, and where the
+    next message begins (the resume point once this one is stored).
+    """
+    if os.path.getsize(path) == 0:
+        return
+    parser = BytesHeaderParser()
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        pos = start
+        if mm[pos:pos + 5] != b"From ":
+            found = mm.find(b"\nFrom ", pos)
+            pos = size if found == -1 else found + 1
+        while pos < size:
+            found = mm.find(b"\nFrom ", pos)
+            end = size if found == -1 else found + 1
+            content = mm.find(b"\n", pos, end) + 1 or end
+            header_end = end
+            for separator in (b"\n\n", b"\r\n\r\n"):
+                found_sep = mm.find(separator, content, end)
+                if found_sep != -1:
+                    header_end = min(header_end, found_sep + len(separator))
+            yield content, end - content, parser.parsebytes(mm[content:header_end]), end
+            pos = end
+
+
+def read_message(path: str, offset: int, length: int):
+    """The full message stored at `offset`, parsed from the shared map."""
+    return message_from_bytes(_mapped(path, offset + length)[offset:offset + length])
+
+
+def hydrate_bodies(conn, rows: Dict[str, Dict[str, Any]]):
+    """Fill in `body` (and the body part of `document`) for header-only rows, in place."""
+    lazy = [email_id for email_id, row in rows.items() if "body" not in row["metadata"]]
+    for start in range(0, len(lazy), 500):
+        batch = lazy[start:start + 500]
+        for email_id, path, offset, length in conn.execute(
+            f"SELECT email_id, path, offset, length FROM mbox_messages "
+            f"WHERE email_id IN ({','.join('?' * len(batch))})",
+            batch,
+        ):
+            try:
+                body = message_body(read_message(path, offset, length))
+            except (OSError, ValueError) as e:
+                print(f"Error reading message body from {path}: {e}")
+                continue
+            row = rows[email_id]
+            row["metadata"]["body"] = body
+            # _create_text_content puts the body last, so this is the full document
+            row["document"] = f"{row['document']} | body: {body}"
+
+
+class MboxScanner:
+    """Metadata-only mbox import into a collection, and deferred embedding of the bodies."""
+
+    def __init__(self, vector_db, batch_size: int = MBOX_SCAN_BATCH_SIZE):
+        self.vector_db = vector_db
+        self.batch_size = batch_size
+        self.processor = EmailProcessor()
+
+    def scan(self, path: str, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+        """
+        Store the headers of every valid message in `path` without embedding.
+        Checkpointed per batch (byte offset), so an interrupted scan resumes;
+        ids derive from path and offset, so a repeated batch is a no-op.
+        """
+        path = os.path.abspath(path)
+        source = f"mbox:{path}"
+        done = self.vector_db.get_checkpoint(source)
+        stats = {"messages": 0, "stored": 0, "invalid": 0}
+        size = os.path.getsize(path)
+        batch, ids, rows, next_pos = [], [], [], done[0] if done else 0
+        for offset, length, headers, next_pos in iter_messages(path, next_pos):
+            stats["messages"] += 1
+            entry = header_fields(headers)
+            if not self.processor.validate_emails([entry]):
+                stats["invalid"] += 1
+                continue
+            entry["text_content"] = self.processor._create_text_content(entry)
+            email_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{path}:{offset}"))
+            batch.append(entry)
+            ids.append(email_id)
+            rows.append((email_id, path, offset, length))
+            if len(batch) >= self.batch_size:
+                stats["stored"] += self._store(batch, ids, rows, (source, next_pos))
+                batch, ids, rows = [], [], []
+                if progress:
+                    progress(next_pos, size)
+        stats["stored"] += self._store(batch, ids, rows, (source, next_pos))
+        if progress:
+            progress(size, size)
+        return stats
+
+    def _store(self, batch: List[Dict[str, Any]], ids: List[str], rows: List[tuple],
+               checkpoint: Tuple[str, int]) -> int:
+        with self.vector_db._conn() as conn:
+            # offsets first: a crash before the emails commit leaves only rows the rerun overwrites
+            conn.executemany(
+                "INSERT OR REPLACE INTO mbox_messages (email_id, path, offset, length) VALUES (?, ?, ?, ?)", rows
+            )
+            stored = set()
+            for start in range(0, len(ids), 500):
+                batch_ids = ids[start:start + 500]
+                stored.update(row[0] for row in conn.execute(
+                    f"SELECT id FROM emails WHERE id IN ({','.join('?' * len(batch_ids))})", batch_ids))
+        fresh = [(entry, email_id) for entry, email_id in zip(batch, ids) if email_id not in stored]
+        if not fresh:
+            with self.vector_db._conn() as conn:
+                self.vector_db._save_checkpoint(conn, checkpoint, 0)
+            return 0
+        if not self.vector_db.add_emails([e for e, _ in fresh], email_ids=[i for _, i in fresh],
+                                         checkpoint=checkpoint, embed=False):
+            raise RuntimeError(f"failed to store message headers up to byte {checkpoint[1]}")
+        return len(fresh)
+
+    def embed_pending(self, batch_size: int = INGEST_BATCH_SIZE,
+                      progress: Optional[Callable[[int], None]] = None) -> int:
+        """Read, decode and embed the bodies of scanned messages that have no vectors yet."""
+        embedded, last_rowid = 0, 0
+        batch_id = None
+        while True:
+            with self.vector_db._conn() as conn:
+                # pending = neither embedded nor linked to a representative; walked by rowid, not re-scanned
+                pending = conn.execute(
+                    """SELECT m.rowid, m.email_id, m.path, m.offset, m.length, e.metadata_json
+                       FROM mbox_messages m JOIN emails e ON e.id = m.email_id
+                       WHERE m.rowid > ? AND e.deleted = 0
+                         AND NOT EXISTS (SELECT 1 FROM vector_ids v WHERE v.email_id = m.email_id)
+                         AND NOT EXISTS (SELECT 1 FROM near_duplicates d WHERE d.email_id = m.email_id)
+                       ORDER BY m.rowid LIMIT ?""",
+                    (last_rowid, batch_size),
+                ).fetchall()
+                pending = [row[:5] + (doc_store.decode_metadata(conn, row[5]),) for row in pending]
+            if not pending:
+                return embedded
+            last_rowid = pending[-1][0]
+            ids, entries = [], []
+            for _, email_id, path, offset, length, entry in pending:
+                try:
+                    entry["body"] = message_body(read_message(path, offset, length))
+                except (OSError, ValueError) as e:
+                    print(f"Error reading message body from {path}: {e}")
+                    continue
+                entry["text_content"] = self.processor._create_text_content(entry)
+                ids.append(email_id)
+                entries.append(entry)
+            # one summary batch per run: cached partials of an earlier run don't cover these emails
+            batch_id = batch_id or f"mbox:{pending[0][2]}:{uuid.uuid4().hex}"
+            if not self.vector_db.embed_stored(ids, entries, batch_id=batch_id):
+                raise RuntimeError("failed to embed scanned messages")
+            embedded += len(ids)
+            if progress:
+                progress(embedded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Header-only mbox import with lazy body loading")
+    parser.add_argument("path")
+    parser.add_argument("--embed", action="store_true", help="embed the bodies after the header scan")
+    args = parser.parse_args()
+
+    from vector_db_manager import get_shared_manager
+
+    scanner = MboxScanner(get_shared_manager())
+    print(scanner.scan(args.path, lambda done, total: print(f"\r{done * 100 // max(total, 1)}%", end="")))
+    if args.embed:
+        print(f"Embedded {scanner.embed_pending()} messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import re
+import zlib
+import hashlib
+import sqlite3
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+import numpy as np
+
+from config import (NEAR_DUP_NUM_PERM, NEAR_DUP_BANDS, NEAR_DUP_SHINGLE_WORDS,
+                    NEAR_DUP_THRESHOLD, NEAR_DUP_MIN_WORDS)
+
+WORD = re.compile(r"[a-z0-9]+")
+_PRIME = (1 << 31) - 1
+# fixed seed: signatures must stay comparable across processes and restarts
+_rng = np.random.RandomState(20240101)
+_PERM_A = _rng.randint(1, _PRIME, NEAR_DUP_NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, _PRIME, NEAR_DUP_NUM_PERM).astype(np.uint64)
+_ROWS = NEAR_DUP_NUM_PERM // NEAR_DUP_BANDS
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Create the representative signatures, their LSH buckets and the duplicate links."""
+    # only representatives are bucketed: a new email is compared against what actually got embedded
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS minhash_signatures (
+               email_id  TEXT PRIMARY KEY,
+               signature BLOB NOT NULL
+           )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS minhash_buckets (
+               bucket   INTEGER NOT NULL,
+               email_id TEXT NOT NULL,
+               PRIMARY KEY (bucket, email_id)
+           ) WITHOUT ROWID"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS near_duplicates (
+               email_id          TEXT PRIMARY KEY,
+               representative_id TEXT NOT NULL,
+               similarity        REAL NOT NULL
+           )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_near_dup_rep ON near_duplicates (representative_id)")
+
+
+def dedupe_text(entry: Dict[str, Any]) -> str:
+    """The part of an email compared for near-duplicates: its body (contact rows have none)."""
+    return str(entry.get("body") or "")
+
+
+def signature(text: str) -> Optional[np.ndarray]:
+    """MinHash signature over word shingles, or None if the text is too short to compare."""
+    words = WORD.findall(text.lower())
+    if len(words) < NEAR_DUP_MIN_WORDS:
+        return None
+    n = NEAR_DUP_SHINGLE_WORDS
+    shingles = {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) & _PRIME for s in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    # a*x + b stays below 2**62, so uint64 never overflows
+    return ((np.outer(hashes, _PERM_A) + _PERM_B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+def band_buckets(sig: np.ndarray) -> List[int]:
+    """One bucket per band; the band number is hashed in, so buckets of different bands never collide."""
+    buckets = []
+    for band in range(NEAR_DUP_BANDS):
+        digest = hashlib.blake2b(sig[band * _ROWS:(band + 1) * _ROWS].tobytes(), digest_size=8,
+                                 person=band.to_bytes(2, "little")).digest()
+        buckets.append(int.from_bytes(digest, "little", signed=True))
+    return buckets
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return float(np.mean(a == b))
+
+
+def _select_in(conn, sql: str, values: List[Any]) -> List[tuple]:
+    rows = []
+    for start in range(0, len(values), 500):
+        batch = values[start:start + 500]
+        rows.extend(conn.execute(sql.format(",".join("?" * len(batch))), batch).fetchall())
+    return rows
+
+
+def find_representatives(conn: sqlite3.Connection, ids: List[str],
+                         entries: List[Dict[str, Any]]) -> Dict[str, Tuple[str, float]]:
+    """
+    Streaming pass over a batch about to be stored: email id -> (representative
+    id, similarity) for every email that nearly duplicates an already stored
+    representative or an earlier email of the same batch. Emails not in the
+    result become representatives; `link_duplicates` records both kinds.
+    """
+    sigs = {email_id: signature(dedupe_text(entry)) for email_id, entry in zip(ids, entries)}
+    buckets = {email_id: band_buckets(sig) for email_id, sig in sigs.items() if sig is not None}
+    if not buckets:
+        return {}
+
+    # candidates among stored representatives, fetched for the whole batch at once
+    stored: Dict[int, List[str]] = {}
+    for bucket, email_id in _select_in(conn, "SELECT bucket, email_id FROM minhash_buckets WHERE bucket IN ({})",
+                                       sorted({b for bs in buckets.values() for b in bs})):
+        stored.setdefault(bucket, []).append(email_id)
+    stored_sigs = {
+        email_id: np.frombuffer(blob, dtype=np.uint32)
+        for email_id, blob in _select_in(conn, "SELECT email_id, signature FROM minhash_signatures "
+                                               "WHERE email_id IN ({})",
+                                         sorted({e for es in stored.values() for e in es}))
+    }
+
+    links: Dict[str, Tuple[str, float]] = {}
+    for email_id in ids:
+        if email_id not in buckets:
+            continue
+        sig = sigs[email_id]
+        best, best_score = None, NEAR_DUP_THRESHOLD
+        for candidate in {c for b in buckets[email_id] for c in stored.get(b, ())}:
+            score = similarity(sig, stored_sigs[candidate])
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is None:
+            # a new representative: later emails of this batch may link to it
+            for bucket in buckets[email_id]:
+                stored.setdefault(bucket, []).append(email_id)
+            stored_sigs[email_id] = sig
+        else:
+            links[email_id] = (best, best_score)
+    return links
+
+
+def link_duplicates(conn: sqlite3.Connection, ids: List[str], entries: List[Dict[str, Any]],
+                    links: Dict[str, Tuple[str, float]]):
+    """Store representatives' signatures and buckets and the duplicates' links (caller's transaction)."""
+    conn.executemany(
+        "INSERT OR REPLACE INTO near_duplicates (email_id, representative_id, similarity) VALUES (?, ?, ?)",
+        [(email_id, rep, score) for email_id, (rep, score) in links.items()],
+    )
+    for email_id, entry in zip(ids, entries):
+        if email_id in links:
+            continue
+        sig = signature(dedupe_text(entry))
+        if sig is not None:
+            store_signature(conn, email_id, sig)
+
+
+def store_signature(conn: sqlite3.Connection, email_id: str, sig: np.ndarray):
+    """Make `email_id` a representative that later emails are compared against."""
+    conn.execute("INSERT OR REPLACE INTO minhash_signatures (email_id, signature) VALUES (?, ?)",
+                 (email_id, sig.tobytes()))
+    conn.executemany("INSERT OR IGNORE INTO minhash_buckets (bucket, email_id) VALUES (?, ?)",
+                     [(bucket, email_id) for bucket in band_buckets(sig)])
+
+
+def remove_duplicates(conn: sqlite3.Connection, ids: List[str]) -> Dict[str, str]:
+    """
+    Unlink deleted emails. A deleted representative hands its vectors, signature
+    and cluster to its closest surviving duplicate, so the cluster stays
+    searchable without re-embedding. Returns {old representative: new representative}.
+    """
+    conn.executemany("DELETE FROM near_duplicates WHERE email_id = ?", [(email_id,) for email_id in ids])
+    promoted = {}
+    for email_id in ids:
+        row = conn.execute(
+            """SELECT email_id FROM near_duplicates WHERE representative_id = ?
+               ORDER BY similarity DESC, email_id LIMIT 1""",
+            (email_id,),
+        ).fetchone()
+        if row is None:
+            conn.execute("DELETE FROM minhash_signatures WHERE email_id = ?", (email_id,))
+            conn.execute("DELETE FROM minhash_buckets WHERE email_id = ?", (email_id,))
+            continue
+        successor = row[0]
+        conn.execute("DELETE FROM near_duplicates WHERE email_id = ?", (successor,))
+        conn.execute("UPDATE near_duplicates SET representative_id = ? WHERE representative_id = ?",
+                     (successor, email_id))
+        conn.execute("UPDATE minhash_signatures SET email_id = ? WHERE email_id = ?", (successor, email_id))
+        conn.execute("UPDATE minhash_buckets SET email_id = ? WHERE email_id = ?", (successor, email_id))
+        promoted[email_id] = successor
+    return promoted
+
+
+def clear_duplicates(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM minhash_signatures")
+    conn.execute("DELETE FROM minhash_buckets")
+    conn.execute("DELETE FROM near_duplicates")
+
+
+def duplicates_of(conn: sqlite3.Connection, representative_ids: Iterable[str]) -> Dict[str, List[str]]:
+    """representative id -> ids of its near-duplicates, most similar first."""
+    clusters: Dict[str, List[str]] = {}
+    for email_id, rep in _select_in(
+        conn,
+        """SELECT email_id, representative_id FROM near_duplicates
+           WHERE representative_id IN ({}) ORDER BY similarity DESC, email_id""",
+        list(representative_ids),
+    ):
+        clusters.setdefault(rep, []).append(email_id)
+    return clusters
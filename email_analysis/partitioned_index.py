@@ -0,0 +1,216 @@
+"""
+A FAISS index split into named partitions (shards) that are stored, loaded and searched separately.
+
+Each partition is an IndexIDMap2 over IndexFlatIP whose ids are the global
+vector positions, so to VectorDBManager the whole thing still behaves like
+one flat index numbered 0..ntotal-1 (`vector_ids`, `id_map`, batch ranges
+and `reconstruct_n` keep working unchanged). Which partition a vector goes to
+is decided by the caller, per vector, when it is added.
+
+On disk (`directory`):
+
+    manifest.json          partitions, their files and sizes; replaced atomically on save
+    <key>.<version>.index  one file per partition, rewritten only when it changed
+    owners.<version>.npy   partition number of every position (int32)
+
+Partitions are read from disk the first time a search, add or reconstruct
+touches them. A search fans out over the partitions on a thread pool (FAISS
+releases the GIL) and the per-partition top-k lists are merged with a heap.
+"""
+
+import os
+import json
+import heapq
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Iterable
+
+import numpy as np
+
+MANIFEST = "manifest.json"
+
+_search_pool = None
+_search_pool_lock = threading.Lock()
+
+
+def _faiss():
+    import faiss
+    return faiss
+
+
+def _pool() -> ThreadPoolExecutor:
+    """Threads shared by every partitioned index in the process for the per-partition searches."""
+    global _search_pool
+    with _search_pool_lock:
+        if _search_pool is None:
+            _search_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="index-shard")
+        return _search_pool
+
+
+class PartitionedIndex:
+    """Partitions of IndexFlatIP vectors keyed by global position, searched in parallel."""
+
+    def __init__(self, directory: str, d: int, partition_by: str = ""):
+        self.directory = directory
+        self.d = d
+        self.code_size = d * 4
+        self.partition_by = partition_by      # recorded in the manifest; the caller's routing scheme
+        self.keys: List[str] = []             # partition names, in creation order
+        self._parts: Dict[str, object] = {}   # key -> loaded index; missing = still on disk
+        self._files: Dict[str, str] = {}
+        self._sizes: Dict[str, int] = {}
+        self._owners = np.zeros(0, dtype=np.int32)   # position -> index into `keys`
+        self._dirty = set()
+        self._version = 0
+        self._load_lock = threading.Lock()
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, MANIFEST))
+
+    @classmethod
+    def load(cls, directory: str) -> "PartitionedIndex":
+        """Read the manifest and position map; the partitions themselves load on first use."""
+        with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        index = cls(directory, manifest["dim"], manifest.get("partition_by", ""))
+        index._version = manifest["version"]
+        for part in manifest["partitions"]:
+            index.keys.append(part["key"])
+            index._files[part["key"]] = part["file"]
+            index._sizes[part["key"]] = part["ntotal"]
+        if manifest.get("owners"):
+            index._owners = np.load(os.path.join(directory, manifest["owners"]))
+        return index
+
+    @property
+    def ntotal(self) -> int:
+        return len(self._owners)
+
+    def partition_sizes(self) -> Dict[str, int]:
+        return dict(self._sizes)
+
+    def keys_of(self, positions: np.ndarray) -> List[str]:
+        """Partitions holding the vectors at `positions`."""
+        return [self.keys[number] for number in np.unique(self._owners[positions])]
+
+    def memory_bytes(self) -> int:
+        """Bytes of vectors in the partitions currently loaded."""
+        return sum(self._sizes[key] for key in list(self._parts)) * self.code_size
+
+    def _part(self, key: str):
+        part = self._parts.get(key)
+        if part is not None:
+            return part
+        with self._load_lock:
+            if key not in self._parts:
+                if key in self._files:
+                    part = _faiss().read_index(os.path.join(self.directory, self._files[key]))
+                else:
+                    part = _faiss().IndexIDMap2(_faiss().IndexFlatIP(self.d))
+                self._parts[key] = part
+            return self._parts[key]
+
+    def add(self, x: np.ndarray, keys: List[str]):
+        """Append vectors at positions ntotal.. , vector i going to partition `keys[i]`."""
+        if len(x) != len(keys):
+            raise ValueError("one partition key per vector is required")
+        start = self.ntotal
+        positions = np.arange(start, start + len(x), dtype=np.int64)
+        owners = np.empty(len(x), dtype=np.int32)
+        wanted = np.asarray(keys)
+        for key in dict.fromkeys(keys):
+            if key not in self._sizes:
+                self.keys.append(key)
+                self._sizes[key] = 0
+            mask = wanted == key
+            self._part(key).add_with_ids(np.ascontiguousarray(x[mask]), positions[mask])
+            self._sizes[key] += int(mask.sum())
+            owners[mask] = self.keys.index(key)
+            self._dirty.add(key)
+        self._owners = np.concatenate([self._owners, owners])
+
+    def search(self, x: np.ndarray, k: int, keys: Optional[Iterable[str]] = None, params=None):
+        """
+        Top `k` over the partitions in `keys` (all by default), as faiss returns
+        it: (scores, positions), padded with -inf / -1. `params` (e.g. an id
+        selector over positions) is passed to every partition's search.
+        """
+        keys = [key for key in (self.keys if keys is None else keys) if self._sizes.get(key)]
+        scores = np.full((len(x), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(x), k), -1, dtype=np.int64)
+        if not keys or k <= 0:
+            return scores, ids
+
+        def search_part(key):
+            part = self._part(key)
+            return part.search(x, min(k, part.ntotal), params=params)
+
+        results = list(_pool().map(search_part, keys)) if len(keys) > 1 else [search_part(keys[0])]
+        for row in range(len(x)):
+            # each partition's list is already sorted best first
+            merged = heapq.merge(*(zip(d[row], i[row]) for d, i in results), key=lambda hit: -hit[0])
+            for col, (score, position) in enumerate(islice((h for h in merged if h[1] != -1), k)):
+                scores[row, col] = score
+                ids[row, col] = position
+        return scores, ids
+
+    def reconstruct_n(self, start: int, n: int) -> np.ndarray:
+        out = np.empty((n, self.d), dtype=np.float32)
+        owners = self._owners[start:start + n]
+        positions = np.arange(start, start + n, dtype=np.int64)
+        for number in np.unique(owners):
+            mask = owners == number
+            out[mask] = self._part(self.keys[number]).reconstruct_batch(positions[mask])
+        return out
+
+    def truncate(self, n: int):
+        """Drop every vector at position >= n (used to cut off an uncommitted tail)."""
+        if n >= self.ntotal:
+            return
+        selector = _faiss().IDSelectorRange(n, self.ntotal)
+        for number in np.unique(self._owners[n:]):
+            key = self.keys[number]
+            self._sizes[key] -= self._part(key).remove_ids(selector)
+            self._dirty.add(key)
+        self._owners = self._owners[:n]
+
+    def reset(self):
+        self.keys, self._parts, self._files, self._sizes = [], {}, {}, {}
+        self._owners = np.zeros(0, dtype=np.int32)
+        self._dirty = set()
+
+    def save(self):
+        """
+        Write changed partitions and the position map under a new version, then
+        switch the manifest over in one rename; files of older versions are removed after.
+        """
+        faiss = _faiss()
+        os.makedirs(self.directory, exist_ok=True)
+        version = self._version + 1
+        for key in self._dirty:
+            if key in self._parts:
+                name = f"{key}.{version}.index"
+                faiss.write_index(self._parts[key], os.path.join(self.directory, name))
+                self._files[key] = name
+        owners = f"owners.{version}.npy"
+        np.save(os.path.join(self.directory, owners), self._owners)
+        manifest = {
+            "version": version,
+            "dim": self.d,
+            "partition_by": self.partition_by,
+            "owners": owners,
+            "partitions": [{"key": key, "file": self._files[key], "ntotal": self._sizes[key]}
+                           for key in self.keys],
+        }
+        tmp = os.path.join(self.directory, MANIFEST + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, os.path.join(self.directory, MANIFEST))
+        self._version = version
+        self._dirty = set()
+        current = set(self._files.values()) | {owners, MANIFEST}
+        for name in os.listdir(self.directory):
+            if name not in current:
+                os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,243 @@
+import re
+import time
+from typing import Dict, Any, Optional
+
+from analytics import AnalyticsEngine
+from contact_directory import ContactDirectory
+from response_cache import ResponseCache
+
+EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b')
+DOMAIN_PATTERN = re.compile(r'(?<![@\w.-])((?:[a-z0-9-]+\.)+[a-z]{2,})\b', re.IGNORECASE)
+TOP_K_PATTERN = re.compile(r'\b(?:most (?:common|frequent|active)|top(?: \d+)?)\s+(domains?|senders?|recipients?)\b')
+# what a count question may contain besides its address/domain and still be answered exactly
+COUNT_WORD = re.compile(r"[a-z0-9]+")
+COUNT_KINDS = {"domains": "domain", "senders": "sender", "recipients": "recipient"}
+COUNT_FILLER = {
+    "how", "many", "count", "the", "number", "of", "total", "in", "all", "are", "were", "there", "is",
+    "do", "does", "did", "we", "i", "you", "have", "has", "got", "email", "emails", "mail", "mails",
+    "message", "messages", "from", "to", "by", "with", "for", "involving", "sent", "received",
+    "send", "receive", "exchanged", "address", "domain", "sender", "recipient", "unique", "distinct", "different",
+    "dataset", "corpus", "database", "collection", "inbox", "mailbox", "what", "s",
+}
+# "John Smith's email address", "contact for sarah", "who is jon smyth"
+CONTACT_PATTERN = re.compile(r"\b(e-?mail address(es)?|address(es)? (of|for)|contact|who is|named|called)\b|'s e-?mail", re.IGNORECASE)
+THREAD_PATTERN = re.compile(r"\b(conversation|thread|email chain|discussion|back and forth)\b", re.IGNORECASE)
+NAME_WORD = re.compile(r"[A-Za-z][A-Za-z'.-]*")
+NAME_STOPWORDS = {
+    "give", "me", "get", "find", "show", "what", "whats", "is", "are", "the", "a", "an", "of", "for",
+    "email", "emails", "e-mail", "address", "addresses", "contact", "contacts", "details", "info",
+    "information", "who", "named", "called", "person", "someone", "please", "can", "you", "i", "need",
+    "look", "up", "lookup", "his", "her", "their", "to", "with", "from", "about", "and", "list", "all",
+}
+
+# Routing paths recorded on every response
+PATH_ADDRESS_LOOKUP = "address_lookup"
+PATH_DOMAIN_LOOKUP = "domain_lookup"
+PATH_COUNT = "count"
+PATH_TOP_K = "top_k"
+PATH_CONTACT_LOOKUP = "contact_lookup"
+PATH_THREAD = "thread"                 # best matching email's whole conversation
+PATH_VECTOR_LLM = "vector_llm"
+PATH_VECTOR_CACHE = "vector_cache"   # vector search, answer reused from the response cache
+
+
+class QueryRouter:
+    """
+    Plan each query from `LLMHandler.analyze_query_intent` and serve it from the
+    cheapest path that can answer it exactly: indexed SQLite lookups for
+    addresses, domains, counts and top-k questions, the contact directory for
+    "what is X's email address"; vector search plus the LLM only for
+    everything else.
+    """
+
+    def __init__(self, vector_db, llm_handler, analytics: Optional[AnalyticsEngine] = None,
+                 response_cache: Optional[ResponseCache] = None,
+                 contacts: Optional[ContactDirectory] = None):
+        self.vector_db = vector_db
+        self.llm_handler = llm_handler
+        self.analytics = analytics or AnalyticsEngine(vector_db)
+        self.response_cache = response_cache
+        self.contacts = contacts or ContactDirectory(vector_db)
+
+    def route(self, query: str, n_results: int = 10, stream: bool = False) -> Dict[str, Any]:
+        """
+        Answer `query`. The response dict always has `path` (which route served it),
+        `answer` (markdown), `results` (search-result shaped rows), `intent` and `elapsed_ms`.
+        With `stream=True` an uncached LLM answer comes back as `answer_stream`
+        (a generator of text pieces) and `timings` is filled in as it is consumed.
+        """
+        started = time.perf_counter()
+        intent = self.llm_handler.analyze_query_intent(query)
+        response = self._plan(query, intent, n_results, stream)
+        response["intent"] = intent
+        response["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return response
+
+    def _plan(self, query: str, intent: Dict[str, Any], n_results: int, stream: bool) -> Dict[str, Any]:
+        query_lower = query.lower()
+        address = self._extract_address(query)
+        domain = "" if address else self._extract_domain(query)
+        wants_count = intent["is_analysis_request"] and any(
+            keyword in query_lower for keyword in ("how many", "count", "number of")
+        )
+
+        if wants_count:
+            # "how many emails mention the merger?" is not a question the aggregates can answer
+            response = self._count(query_lower, address, domain)
+            return response or self._vector_llm(query, n_results, stream)
+        top_k = TOP_K_PATTERN.search(query_lower)
+        if top_k:
+            return self._top_k(top_k.group(1).rstrip("s"), n_results)
+        if address or domain:
+            path = PATH_ADDRESS_LOOKUP if address else PATH_DOMAIN_LOOKUP
+            response = self._lookup(path, n_results, address=address, domain=domain)
+            # "node.js" looks like a domain too; fall back to semantic search when nothing matches
+            if response["results"]:
+                return response
+        elif THREAD_PATTERN.search(query):
+            response = self._thread(query)
+            if response["results"]:
+                return response
+        elif CONTACT_PATTERN.search(query) or intent["is_person_search"]:
+            name = self._extract_name(query)
+            if name:
+                response = self._contact_lookup(name, n_results)
+                if response["value"]:
+                    return response
+        return self._vector_llm(query, n_results, stream)
+
+    @staticmethod
+    def _extract_address(query: str) -> str:
+        match = EMAIL_PATTERN.search(query)
+        return match.group(0).lower() if match else ""
+
+    @staticmethod
+    def _extract_domain(query: str) -> str:
+        match = DOMAIN_PATTERN.search(query)
+        return match.group(1).lower() if match else ""
+
+    @staticmethod
+    def _extract_name(query: str) -> str:
+        """What is left of a contact question once the question words are removed (at most 3 words)."""
+        words = []
+        for word in NAME_WORD.findall(query):
+            word = re.sub(r"'s$", "", word).strip(".'")
+            if word and word.lower() not in NAME_STOPWORDS:
+                words.append(word)
+        return " ".join(words) if 0 < len(words) <= 3 else ""
+
+    def _contact_lookup(self, name: str, n_results: int) -> Dict[str, Any]:
+        contacts = self.contacts.lookup(name, limit=min(n_results, 5))
+        lines = []
+        for contact in contacts:
+            line = f"- **{contact['name'] or contact['address']}** — {contact['address']} " \
+                   f"({contact['email_count']:,} emails"
+            if contact["last_seen"]:
+                line += f", last seen {contact['last_seen']}"
+            lines.append(line + ")")
+        fuzzy = contacts and contacts[0]["match"] == "fuzzy"
+        heading = f"Closest contacts to **{name}**:" if fuzzy else f"Contacts matching **{name}**:"
+        return {"path": PATH_CONTACT_LOOKUP, "answer": heading + "\n\n" + "\n".join(lines),
+                "results": [], "value": contacts}
+
+    def _thread(self, query: str) -> Dict[str, Any]:
+        best = self.vector_db.search_by_vectors(self.vector_db.encode_queries([query]), 1)[0]
+        if not best:
+            return {"path": PATH_THREAD, "answer": "", "results": []}
+        emails = self.vector_db.get_thread(best[0]["id"]) or [best[0]]
+        results = [dict(email, score=best[0]["score"]) for email in emails]
+
+        subject = emails[0]["metadata"].get("subject") or "(no subject)"
+        lines = []
+        for i, email in enumerate(emails, 1):
+            metadata = email["metadata"]
+            lines.append(f"{i}. {metadata.get('date', '')} — **{self._address_of(metadata) or 'unknown'}**: "
+                         f"{metadata.get('subject', '')}")
+        answer = f"Conversation **{subject}** ({len(emails)} messages):\n\n" + "\n".join(lines)
+        return {"path": PATH_THREAD, "answer": answer, "results": results}
+
+    def _count(self, query_lower: str, address: str, domain: str) -> Optional[Dict[str, Any]]:
+        """The exact count the question asks for, or None when it asks for more than an address/domain filter."""
+        target = address or domain
+        words = COUNT_WORD.findall(query_lower.replace(target, " ") if target else query_lower)
+        kinds = {COUNT_KINDS[word] for word in words if word in COUNT_KINDS}
+        if any(word not in COUNT_FILLER and word not in COUNT_KINDS for word in words) or len(kinds) > 1:
+            return None
+        if kinds and (address or domain):
+            return None      # e.g. "how many senders from acme.com": not kept in the aggregates
+        if address:
+            n = self.analytics.count_for(address=address)
+            answer = f"There are **{n:,}** emails from or to **{address}**."
+        elif domain:
+            n = self.analytics.count_for(domain=domain)
+            if not n:
+                return None  # more likely not a domain at all ("node.js")
+            answer = f"There are **{n:,}** emails involving **{domain}**."
+        elif kinds:
+            kind = kinds.pop()
+            n = self.analytics.distinct(kind)
+            answer = f"The dataset contains **{n:,}** unique {kind}s."
+        else:
+            n = self.analytics.total_emails()
+            answer = f"The dataset contains **{n:,}** emails."
+        return {"path": PATH_COUNT, "answer": answer, "results": [], "value": n}
+
+    def _top_k(self, kind: str, n_results: int) -> Dict[str, Any]:
+        rows = self.analytics.top(kind, n_results)
+        lines = [f"{i}. **{key}** — {count:,} emails" for i, (key, count) in enumerate(rows, 1)]
+        answer = f"Most common {kind}s:\n\n" + "\n".join(lines) if lines else f"No {kind} data found."
+        return {"path": PATH_TOP_K, "answer": answer, "results": [], "value": rows}
+
+    def _lookup(self, path: str, n_results: int, address: str = "", domain: str = "") -> Dict[str, Any]:
+        target = address or domain
+        total = self.analytics.count_for(address=address, domain=domain)
+        ids = self.analytics.emails_for(address=address, domain=domain, limit=n_results)
+        rows = self.vector_db._fetch_rows(ids)
+        results = [dict(rows[email_id], score=1.0) for email_id in ids if email_id in rows]
+
+        shown = ", ".join(sorted({self._address_of(r["metadata"]) for r in results} - {""}))
+        answer = f"Found **{total:,}** emails for **{target}** (showing {len(results)})."
+        if shown:
+            answer += f"\n\nAddresses: {shown}"
+        return {"path": path, "answer": answer, "results": results}
+
+    @staticmethod
+    def _address_of(metadata: Dict[str, Any]) -> str:
+        return str(metadata.get("from") or metadata.get("email") or "")
+
+    def _vector_llm(self, query: str, n_results: int, stream: bool = False) -> Dict[str, Any]:
+        q_vec = self.vector_db.encode_queries([query])
+        # one result per conversation, so replies don't crowd out other matches
+        results = self.vector_db.search_by_vectors(q_vec, n_results, collapse_threads=True)[0]
+        if not results:
+            return {"path": PATH_VECTOR_LLM, "answer": "", "results": []}
+
+        result_ids = [result["id"] for result in results]
+        model = self.llm_handler.model
+        if self.response_cache is not None:
+            data_version = self.vector_db.get_data_version()
+            answer, layer = self.response_cache.get(query, result_ids, model, data_version, q_vec[0])
+            if answer is not None:
+                return {"path": PATH_VECTOR_CACHE, "cache": layer, "answer": answer, "results": results}
+
+        def remember(answer: str):
+            if self.response_cache is not None and not answer.startswith("Error generating response"):
+                self.response_cache.put(query, result_ids, model, data_version, answer, q_vec[0])
+
+        prompt_stats = {}
+        if stream:
+            timings = {}
+
+            def answer_stream():
+                parts = []
+                for piece in self.llm_handler.generate_response_stream(query, results, timings, prompt_stats):
+                    parts.append(piece)
+                    yield piece
+                remember("".join(parts))
+
+            return {"path": PATH_VECTOR_LLM, "answer": "", "answer_stream": answer_stream(),
+                    "timings": timings, "prompt_stats": prompt_stats, "results": results}
+
+        answer = self.llm_handler.generate_response(query, results, prompt_stats)
+        remember(answer)
+        return {"path": PATH_VECTOR_LLM, "answer": answer, "prompt_stats": prompt_stats, "results": results}
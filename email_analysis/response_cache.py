@@ -0,0 +1,159 @@
+import re
+import json
+import time
+import sqlite3
+import hashlib
+from typing import List, Optional, Tuple
+
+from config import (RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES,
+                    RESPONSE_CACHE_SIMILARITY, RESPONSE_CACHE_MIN_OVERLAP)
+
+# how many recent entries a semantic lookup compares against
+SEMANTIC_CANDIDATES = 500
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", query.lower()).strip().rstrip("?!. ")
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache for LLM answers.
+
+    Exact layer: key = (normalized query, sorted result ids, model).
+    Semantic layer: reuse an answer when the query embedding is within
+    `similarity` cosine of a cached one and the retrieved id sets overlap by
+    at least `min_overlap` (Jaccard).
+    Entries are tagged with the collection's data version and are purged as
+    soon as the collection changes; TTL and `max_entries` bound the rest.
+    """
+
+    def __init__(self, db_path: str,
+                 ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 similarity: float = RESPONSE_CACHE_SIMILARITY,
+                 min_overlap: float = RESPONSE_CACHE_MIN_OVERLAP):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.min_overlap = min_overlap
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        with self._conn() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS response_cache (
+                       key          TEXT PRIMARY KEY,
+                       query_norm   TEXT,
+                       model        TEXT,
+                       result_ids   TEXT,
+                       data_version TEXT,
+                       embedding    BLOB,
+                       response     TEXT,
+                       created      REAL,
+                       last_hit     REAL
+                   )"""
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_scope ON response_cache (model, data_version, last_hit)"
+            )
+
+    def _conn(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def _key(query: str, result_ids: List[str], model: str) -> str:
+        raw = json.dumps([normalize_query(query), sorted(result_ids), model])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, query: str, result_ids: List[str], model: str, data_version: str,
+            embedding=None) -> Tuple[Optional[str], Optional[str]]:
+        """Return (response, layer) where layer is "exact" or "semantic"; (None, None) on a miss."""
+        now = time.time()
+        with self._conn() as conn:
+            self._invalidate(conn, data_version)
+            key = self._key(query, result_ids, model)
+            row = conn.execute(
+                "SELECT response FROM response_cache WHERE key = ? AND created >= ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE response_cache SET last_hit = ? WHERE key = ?", (now, key))
+                self.stats["exact_hits"] += 1
+                return row[0], "exact"
+
+            if embedding is not None:
+                hit = self._semantic_lookup(conn, result_ids, model, data_version, embedding, now)
+                if hit is not None:
+                    self.stats["semantic_hits"] += 1
+                    return hit, "semantic"
+
+        self.stats["misses"] += 1
+        return None, None
+
+    def _semantic_lookup(self, conn, result_ids, model, data_version, embedding, now) -> Optional[str]:
+        import numpy as np
+
+        query_vec = np.asarray(embedding, dtype="float32").ravel()
+        wanted = set(result_ids)
+        rows = conn.execute(
+            """SELECT key, result_ids, embedding, response FROM response_cache
+               WHERE model = ? AND data_version = ? AND created >= ? AND embedding IS NOT NULL
+               ORDER BY last_hit DESC LIMIT ?""",
+            (model, data_version, now - self.ttl_seconds, SEMANTIC_CANDIDATES),
+        ).fetchall()
+
+        best_key, best_response, best_score = None, None, self.similarity
+        for key, ids_json, blob, response in rows:
+            cached_vec = np.frombuffer(blob, dtype="float32")
+            if cached_vec.shape != query_vec.shape:
+                continue
+            # both vectors are L2-normalised, so the dot product is the cosine
+            score = float(np.dot(query_vec, cached_vec))
+            if score < best_score:
+                continue
+            cached_ids = set(json.loads(ids_json))
+            union = wanted | cached_ids
+            overlap = len(wanted & cached_ids) / len(union) if union else 1.0
+            if overlap >= self.min_overlap:
+                best_key, best_response, best_score = key, response, score
+
+        if best_key is not None:
+            conn.execute("UPDATE response_cache SET last_hit = ? WHERE key = ?", (now, best_key))
+        return best_response
+
+    def put(self, query: str, result_ids: List[str], model: str, data_version: str,
+            response: str, embedding=None):
+        now = time.time()
+        blob = None
+        if embedding is not None:
+            import numpy as np
+            blob = np.asarray(embedding, dtype="float32").ravel().tobytes()
+
+        with self._conn() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO response_cache
+                       (key, query_norm, model, result_ids, data_version, embedding, response, created, last_hit)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (self._key(query, result_ids, model), normalize_query(query), model,
+                 json.dumps(sorted(result_ids)), data_version, blob, response, now, now),
+            )
+            self._evict(conn, now)
+
+    def _invalidate(self, conn, data_version: str):
+        """Drop answers computed against an older version of the collection."""
+        conn.execute("DELETE FROM response_cache WHERE data_version != ?", (data_version,))
+
+    def _evict(self, conn, now: float):
+        conn.execute("DELETE FROM response_cache WHERE created < ?", (now - self.ttl_seconds,))
+        count = conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                """DELETE FROM response_cache WHERE key IN (
+                       SELECT key FROM response_cache ORDER BY last_hit LIMIT ?)""",
+                (count - self.max_entries,),
+            )
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM response_cache")
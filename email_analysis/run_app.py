@@ -10,6 +10,10 @@ from pathlib import Path
 
 def check_env_file():
     """Check if .env file exists and has GROQ_API_KEY"""
+    if os.getenv("LLM_BACKEND", "openrouter") != "openrouter":
+        print(f"✅ Using the offline '{os.getenv('LLM_BACKEND')}' LLM backend, no API key needed")
+        return True
+
     env_file = Path('.env')
     
     if not env_file.exists():
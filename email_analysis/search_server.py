@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Headless search service for the email vector database.
+
+Concurrent queries are gathered into micro-batches so each batch costs one
+embedding call and one FAISS search instead of one of each per request.
+
+    python search_server.py serve [--port 8765] [--max-batch 64] [--max-wait-ms 5]
+    python search_server.py bench [--clients 200] [--requests 5]
+
+Endpoints (JSON over HTTP/1.1):
+    POST /search   {"query": "...", "n_results": 10}  ->  {"results": [...]}   (n_results <= SEARCH_MAX_RESULTS)
+    GET  /health                                      ->  {"status": "ok", "count": N}
+    GET  /stats                                       ->  batching counters
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Tuple
+
+from config import (SEARCH_SERVER_HOST, SEARCH_SERVER_PORT,
+                    SEARCH_BATCH_MAX_SIZE, SEARCH_BATCH_MAX_WAIT_MS, SEARCH_MAX_RESULTS)
+
+MAX_BODY_BYTES = 1 << 20
+
+
+class BadRequest(ValueError):
+    """A request that can't be parsed; answered with 400 and the connection closed."""
+
+
+class MicroBatcher:
+    """Collect queries for up to `max_wait_ms` (or `max_batch_size` items) and search them together."""
+
+    def __init__(self, search_fn: Callable[[List[str], int], List[List[Dict[str, Any]]]],
+                 max_batch_size: int = SEARCH_BATCH_MAX_SIZE,
+                 max_wait_ms: float = SEARCH_BATCH_MAX_WAIT_MS,
+                 workers: int = 1):
+        self.search_fn = search_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search-batch")
+        self._queue: asyncio.Queue = None
+        self._task = None
+        self.stats = {"batches": 0, "queries": 0, "max_batch": 0}
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, query: str, n_results: int) -> List[Dict[str, Any]]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, n_results, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, int, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            queries = [query for query, _, _ in batch]
+            k = max(n_results for _, n_results, _ in batch)
+
+            self.stats["batches"] += 1
+            self.stats["queries"] += len(batch)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+
+            try:
+                results = await loop.run_in_executor(self._executor, self.search_fn, queries, k)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, n_results, future), query_results in zip(batch, results):
+                if not future.done():
+                    future.set_result(query_results[:n_results])
+
+
+class SearchServer:
+    """Minimal asyncio HTTP front end over a MicroBatcher."""
+
+    def __init__(self, vector_db, host: str = SEARCH_SERVER_HOST, port: int = SEARCH_SERVER_PORT,
+                 max_batch_size: int = SEARCH_BATCH_MAX_SIZE,
+                 max_wait_ms: float = SEARCH_BATCH_MAX_WAIT_MS):
+        self.vector_db = vector_db
+        self.host = host
+        self.port = port
+        self.batcher = MicroBatcher(self._search_batch, max_batch_size, max_wait_ms)
+        self._server = None
+
+    async def start(self):
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        # port 0 picks a free port; report the real one
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"Search server listening on http://{self.host}:{self.port}")
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.batcher.stop()
+
+    def _search_batch(self, queries: List[str], k: int) -> List[List[Dict[str, Any]]]:
+        # search_emails_batch returns empty lists on errors; let them reach submit() as a 500
+        return self.vector_db.search_by_vectors(self.vector_db.encode_queries(queries), k)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self._dispatch(method, path, body)
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except BadRequest as e:
+            # the framing may be off, so nothing more is read from this connection
+            _write_response(writer, 400, {"error": f"bad request: {e}"}, keep_alive=False)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        if method == "GET" and path == "/health":
+            # counting queries SQLite, which can wait on a write lock; keep it off the event loop
+            info = await asyncio.get_running_loop().run_in_executor(None, self.vector_db.get_collection_info)
+            return 200, {"status": "ok", "count": info.get("count", 0)}
+        if method == "GET" and path == "/stats":
+            return 200, dict(self.batcher.stats)
+        if method != "POST" or path != "/search":
+            return 404, {"error": f"no route for {method} {path}"}
+
+        try:
+            data = json.loads(body or b"{}")
+            query = str(data["query"])
+            n_results = data.get("n_results", 10)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return 400, {"error": f"invalid request: {e}"}
+        if not isinstance(n_results, int) or isinstance(n_results, bool) or n_results < 1:
+            return 400, {"error": "invalid request: n_results must be a positive integer"}
+        # the whole micro-batch is searched with the largest n_results in it
+        n_results = min(n_results, SEARCH_MAX_RESULTS)
+
+        started = time.perf_counter()
+        try:
+            results = await self.batcher.submit(query, n_results)
+        except Exception as e:
+            return 500, {"error": str(e)}
+        return 200, {
+            "query": query,
+            "results": results,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+
+async def _read_request(reader: asyncio.StreamReader):
+    """Parse one HTTP/1.1 request; None when the client closed the connection."""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    parts = request_line.decode("latin-1").split()
+    if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+        raise BadRequest("malformed request line")
+    method, path, _ = parts
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise BadRequest("invalid Content-Length") from None
+    if not 0 <= length <= MAX_BODY_BYTES:
+        raise BadRequest(f"Content-Length must be between 0 and {MAX_BODY_BYTES}")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path.split("?", 1)[0], headers, body
+
+
+def _write_response(writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any], keep_alive: bool):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}[status]
+    writer.write(
+        f"HTTP/1.1 {status} {reason}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+    )
+
+
+async def _bench(host: str, port: int, clients: int, requests: int, query: str):
+    """Fire `clients` concurrent keep-alive connections, `requests` searches each."""
+    latencies = []
+
+    async def client(i: int):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for j in range(requests):
+                body = json.dumps({"query": f"{query} {i} {j}", "n_results": 10}).encode("utf-8")
+                started = time.perf_counter()
+                writer.write(
+                    f"POST /search HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+                )
+                await writer.drain()
+                await _read_response(reader)
+                latencies.append(time.perf_counter() - started)
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{len(latencies)} requests from {clients} clients in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:.1f} req/s)")
+    print(f"latency p50={latencies[len(latencies) // 2] * 1000:.1f}ms "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms")
+
+
+async def _read_response(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    await reader.readline()  # status line
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value.strip())
+    return json.loads(await reader.readexactly(length))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless email search service")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="run the search server")
+    serve.add_argument("--host", default=SEARCH_SERVER_HOST)
+    serve.add_argument("--port", type=int, default=SEARCH_SERVER_PORT)
+    serve.add_argument("--max-batch", type=int, default=SEARCH_BATCH_MAX_SIZE,
+                       help="1 disables batching (per-request encoding)")
+    serve.add_argument("--max-wait-ms", type=float, default=SEARCH_BATCH_MAX_WAIT_MS)
+
+    bench = sub.add_parser("bench", help="load-test a running server on localhost")
+    bench.add_argument("--host", default=SEARCH_SERVER_HOST)
+    bench.add_argument("--port", type=int, default=SEARCH_SERVER_PORT)
+    bench.add_argument("--clients", type=int, default=200)
+    bench.add_argument("--requests", type=int, default=5)
+    bench.add_argument("--query", default="quarterly invoice")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        from vector_db_manager import get_shared_manager
+
+        vector_db = get_shared_manager()
+        vector_db.warm_up(background=False)
+        server = SearchServer(vector_db, args.host, args.port, args.max_batch, args.max_wait_ms)
+        try:
+            asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            pass
+    else:
+        asyncio.run(_bench(args.host, args.port, args.clients, args.requests, args.query))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Portable collection snapshots: export once, bulk-load anywhere without re-embedding.
+
+    python snapshot.py export /backups/emails-2024-06
+    python snapshot.py import /backups/emails-2024-06 [--no-verify]
+
+A snapshot directory holds
+
+    embeddings.npy   float32 (vectors x dim), row i = FAISS position i; memory-mappable
+    vectors.parquet  email_id per row of embeddings.npy
+    emails.parquet   id, document (null when rebuildable from metadata), metadata_json,
+                     representative_id / similarity (near-duplicates), signature (MinHash)
+    manifest.json    format, embedding model, dimension, counts and a sha256 per file
+
+Only live emails are exported (tombstoned ones and their vectors are dropped)
+and bodies of header-only mbox imports are read into the metadata, so a
+snapshot is self-contained. Derived indexes (counts, addresses, contacts,
+threads) are rebuilt from the metadata on import; nothing is re-encoded.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+import analytics
+import contact_directory
+import corpus_summarizer
+import doc_store
+import email_threads
+import mbox_scan
+import near_duplicates
+from email_processor import date_timestamp
+
+FORMAT_VERSION = 1
+ROW_GROUP = 50_000
+VECTOR_CHUNK = 100_000
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def export_snapshot(vector_db, out_dir: str) -> Dict[str, Any]:
+    """Write a snapshot of `vector_db` to `out_dir` (created; must be empty) and return its manifest."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(out_dir, exist_ok=True)
+    if os.listdir(out_dir):
+        raise ValueError(f"{out_dir} is not empty")
+
+    email_schema = pa.schema([
+        ("id", pa.string()), ("document", pa.string()), ("metadata_json", pa.string()),
+        ("representative_id", pa.string()), ("similarity", pa.float64()), ("signature", pa.binary()),
+    ])
+    # readers keep going; ingestion waits until the export is done, so all files describe one state
+    with vector_db._rw_lock.read_lock(), vector_db._conn() as conn:
+        index = vector_db.index
+        positions = [pos for (pos,) in conn.execute(
+            """SELECT v.pos FROM vector_ids v JOIN emails e ON e.id = v.email_id
+               WHERE e.deleted = 0 ORDER BY v.pos""")]
+
+        embeddings = np.lib.format.open_memmap(os.path.join(out_dir, "embeddings.npy"), mode="w+",
+                                               dtype=np.float32, shape=(len(positions), index.d))
+        owners, written = [], 0
+        for start in range(0, len(positions), VECTOR_CHUNK):
+            batch = positions[start:start + VECTOR_CHUNK]
+            block = index.reconstruct_n(batch[0], batch[-1] - batch[0] + 1)
+            embeddings[written:written + len(batch)] = block[np.asarray(batch) - batch[0]]
+            owners.extend(vector_db.id_map[pos] for pos in batch)
+            written += len(batch)
+        embeddings.flush()
+        del embeddings
+        pq.write_table(pa.table({"email_id": pa.array(owners, pa.string())}),
+                       os.path.join(out_dir, "vectors.parquet"), compression="zstd")
+
+        links = {row[0]: row[1:] for row in conn.execute(
+            "SELECT email_id, representative_id, similarity FROM near_duplicates")}
+        signatures = dict(conn.execute("SELECT email_id, signature FROM minhash_signatures"))
+        count = 0
+        with pq.ParquetWriter(os.path.join(out_dir, "emails.parquet"), email_schema,
+                              compression="zstd") as writer:
+            cursor = conn.execute("SELECT id, document, metadata_json FROM emails WHERE deleted = 0 ORDER BY rowid")
+            while True:
+                rows = cursor.fetchmany(ROW_GROUP)
+                if not rows:
+                    break
+                decoded = {}
+                for email_id, document, metadata_json in rows:
+                    document, metadata = doc_store.decode_row(conn, document, metadata_json)
+                    decoded[email_id] = {"id": email_id, "document": document, "metadata": metadata}
+                mbox_scan.hydrate_bodies(conn, decoded)
+                columns = {name: [] for name in email_schema.names}
+                for email_id, row in decoded.items():
+                    rebuildable = row["document"] == doc_store.rebuild_document(row["metadata"])
+                    link = links.get(email_id, (None, None))
+                    columns["id"].append(email_id)
+                    columns["document"].append(None if rebuildable else row["document"])
+                    columns["metadata_json"].append(json.dumps(row["metadata"], ensure_ascii=False))
+                    columns["representative_id"].append(link[0])
+                    columns["similarity"].append(link[1])
+                    columns["signature"].append(signatures.get(email_id))
+                writer.write_table(pa.table(columns, schema=email_schema))
+                count += len(rows)
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "model": vector_db.model_name,
+        "dim": int(index.d),
+        "metric": "inner_product",      # vectors are L2-normalised, so this is cosine similarity
+        "chunking": vector_db.chunking,
+        "emails": count,
+        "vectors": len(positions),
+        "files": {},
+    }
+    for name in ("embeddings.npy", "vectors.parquet", "emails.parquet"):
+        path = os.path.join(out_dir, name)
+        manifest["files"][name] = {"bytes": os.path.getsize(path), "sha256": _sha256(path)}
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(snapshot_dir: str, verify: bool = True) -> Dict[str, Any]:
+    """Load the manifest, checking sizes always and checksums when `verify` is set."""
+    with open(os.path.join(snapshot_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"unsupported snapshot format {manifest.get('format')}")
+    for name, info in manifest["files"].items():
+        path = os.path.join(snapshot_dir, name)
+        if os.path.getsize(path) != info["bytes"]:
+            raise ValueError(f"{name} has the wrong size; the snapshot is incomplete")
+        if verify and _sha256(path) != info["sha256"]:
+            raise ValueError(f"{name} does not match its checksum")
+    return manifest
+
+
+def import_snapshot(vector_db, snapshot_dir: str, verify: bool = True,
+                    batch_size: int = 5000) -> Dict[str, Any]:
+    """
+    Replace the collection's contents with a snapshot. The embeddings are
+    loaded as stored, so the embedding model and chunking must match the
+    collection's. All or nothing: the snapshot's index is written as a new
+    index generation (see index_rebuild) and the emails replace the old ones in
+    the same SQLite transaction that switches to it; a failure before that
+    commit leaves the collection as it was.
+    """
+    import pyarrow.parquet as pq
+
+    manifest = read_manifest(snapshot_dir, verify)
+    if manifest["model"] != vector_db.model_name or manifest["dim"] != vector_db.dim:
+        raise ValueError(f"snapshot was embedded with {manifest['model']} ({manifest['dim']}d), "
+                         f"this collection uses {vector_db.model_name} ({vector_db.dim}d)")
+    if manifest["chunking"] != vector_db.chunking:
+        # chunked vectors map several positions to one email; the collection must split bodies the same way
+        raise ValueError(f"snapshot was exported with chunking={manifest['chunking']}, "
+                         f"this collection uses chunking={vector_db.chunking}")
+    embeddings = np.load(os.path.join(snapshot_dir, "embeddings.npy"), mmap_mode="r")
+    owners = pq.read_table(os.path.join(snapshot_dir, "vectors.parquet")).column("email_id").to_pylist()
+    if embeddings.shape != (manifest["vectors"], manifest["dim"]) or len(owners) != manifest["vectors"]:
+        raise ValueError("embeddings.npy and vectors.parquet disagree with the manifest")
+
+    # a rebuild would also write the next generation; wait for it
+    with vector_db._rebuild_lock, vector_db._rw_lock.write_lock():
+        generation = vector_db._generation + 1
+        index_file, shard_dir = vector_db._index_paths(generation)
+        generation_dir = os.path.dirname(index_file)
+        shutil.rmtree(generation_dir, ignore_errors=True)
+        os.makedirs(generation_dir)
+        try:
+            index = vector_db._new_index(shard_dir=shard_dir)
+            for start in range(0, len(owners), VECTOR_CHUNK):
+                vector_db._add_to_index(index, np.ascontiguousarray(embeddings[start:start + VECTOR_CHUNK]),
+                                        owners[start:start + VECTOR_CHUNK])
+            vector_db._write_index(index, index_file)
+
+            with vector_db._conn() as conn:
+                vector_db._clear_tables(conn)
+                dict_id = vector_db._compression_dict(conn)
+                emails = pq.ParquetFile(os.path.join(snapshot_dir, "emails.parquet"))
+                for batch in emails.iter_batches(batch_size=batch_size):
+                    _import_emails(conn, batch.to_pylist(), dict_id)
+                    if dict_id == 0:
+                        # enough rows now to train the dictionary; later batches use it
+                        dict_id = vector_db._compression_dict(conn)
+                conn.executemany("INSERT INTO vector_ids (pos, email_id) VALUES (?, ?)", enumerate(owners))
+                if owners:
+                    corpus_summarizer.record_batch(conn, f"snapshot:{manifest['created']}", 0, len(owners))
+                vector_db._set_state(conn, "index_generation", str(generation))
+                vector_db._bump_data_version(conn)
+        except BaseException:
+            shutil.rmtree(generation_dir, ignore_errors=True)
+            raise
+        vector_db._switch_generation(generation, index, owners, 0)
+        vector_db._index_epoch += 1
+    vector_db._remove_generations(keep=generation)
+    print(f"Imported {manifest['emails']} emails and {manifest['vectors']} vectors from {snapshot_dir}")
+    return manifest
+
+
+def _import_emails(conn, rows: List[Dict[str, Any]], dict_id: Optional[int]):
+    ids, metadatas, encoded = [], [], []
+    for row in rows:
+        metadata = json.loads(row["metadata_json"])
+        document = row["document"] if row["document"] is not None else doc_store.rebuild_document(metadata)
+        ids.append(row["id"])
+        metadatas.append(metadata)
+        encoded.append((row["id"], *doc_store.encode_row(conn, document, metadata, dict_id),
+                        date_timestamp(metadata.get("date"))))
+    conn.executemany("INSERT INTO emails (id, document, metadata_json, date_ts) VALUES (?, ?, ?, ?)", encoded)
+    analytics.update_aggregates(conn, metadatas)
+    analytics.update_address_index(conn, ids, metadatas)
+    contact_directory.update_contacts(conn, metadatas)
+    email_threads.update_threads(conn, ids, metadatas)
+    conn.executemany(
+        "INSERT INTO near_duplicates (email_id, representative_id, similarity) VALUES (?, ?, ?)",
+        [(row["id"], row["representative_id"], row["similarity"]) for row in rows if row["representative_id"]],
+    )
+    for row in rows:
+        if row["signature"] is not None:
+            near_duplicates.store_signature(conn, row["id"], np.frombuffer(row["signature"], dtype=np.uint32))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a collection snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="write the collection to an empty directory")
+    export.add_argument("directory")
+    load = sub.add_parser("import", help="replace the collection with a snapshot")
+    load.add_argument("directory")
+    load.add_argument("--no-verify", action="store_true", help="skip the sha256 checks (sizes are still checked)")
+    args = parser.parse_args()
+
+    from vector_db_manager import VectorDBManager
+
+    vector_db = VectorDBManager()
+    if args.command == "export":
+        manifest = export_snapshot(vector_db, args.directory)
+        print(f"Exported {manifest['emails']} emails and {manifest['vectors']} vectors to {args.directory}")
+    else:
+        import_snapshot(vector_db, args.directory, verify=not args.no_verify)
+
+
+if __name__ == "__main__":
+    main()
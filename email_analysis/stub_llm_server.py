@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stub LLM server and end-to-end pipeline benchmark.
+
+The server answers /v1/chat/completions (plain and streamed) with the
+deterministic `extractive_answer`, after a configurable delay, so the real
+pooled client (retries, limits, streaming) can be exercised without network
+access or an API key. Point the app at it with LLM_BACKEND=stub.
+
+    python stub_llm_server.py serve [--port 8766] [--latency-ms 300] [--token-ms 15] [--fail-every 0]
+    python stub_llm_server.py bench [--clients 20] [--requests 5] [--backend local]
+
+`bench` runs queries through QueryRouter (embedding, search, context packing
+and the LLM) against the current collection and reports latency percentiles.
+"""
+
+import argparse
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from config import LLM_STUB_URL, LLM_FALLBACK_MODELS
+from llm_backends import extractive_answer
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """Chat completions in the OpenAI wire format; settings live on the server object."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": model, "object": "model"} for model in LLM_FALLBACK_MODELS
+            ]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+
+        with server.lock:
+            server.requests += 1
+            fail = server.fail_every and server.requests % server.fail_every == 0
+        if fail:
+            # lets the client's retry path be load-tested too
+            self._send_json(429, {"error": {"message": "stub rate limit"}}, {"Retry-After": "0.05"})
+            return
+
+        model = request.get("model", LLM_FALLBACK_MODELS[0])
+        text = extractive_answer(request.get("messages", []))[:int(request.get("max_tokens", 1024)) * 4]
+        words = text.split(" ")
+        time.sleep(server.latency_ms / 1000)
+
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                for i, word in enumerate(words):
+                    if i and server.token_ms:
+                        time.sleep(server.token_ms / 1000)
+                    chunk = {"id": "stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": model, "choices": [{"index": 0, "finish_reason": None,
+                                                          "delta": {"content": word if i == 0 else " " + word}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client stopped reading, e.g. a cancelled stream
+            return
+
+        time.sleep(server.token_ms * len(words) / 1000)
+        prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", [])) // 4
+        self._send_json(200, {
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                      "total_tokens": prompt_tokens + len(words)},
+        })
+
+
+def make_server(host: str, port: int, latency_ms: float = 0, token_ms: float = 0,
+                fail_every: int = 0) -> ThreadingHTTPServer:
+    """Build (but don't start) a stub server; port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), StubLLMHandler)
+    server.daemon_threads = True
+    server.latency_ms = latency_ms
+    server.token_ms = token_ms
+    server.fail_every = fail_every
+    server.requests = 0
+    server.lock = threading.Lock()
+    return server
+
+
+def _bench(clients: int, requests: int, backend: str, query: str):
+    """Route `clients` x `requests` queries through the full pipeline and print latencies."""
+    from llm_handler import LLMHandler
+    from query_router import QueryRouter
+    from vector_db_manager import get_shared_manager
+
+    vector_db = get_shared_manager()
+    vector_db.warm_up(background=False)
+    router = QueryRouter(vector_db, LLMHandler(backend=backend))
+    total_ms, ttft_ms = [], []
+
+    def client(i: int):
+        for j in range(requests):
+            started = time.perf_counter()
+            response = router.route(f"{query} {i} {j}", stream=True)
+            for _ in response.get("answer_stream", ()):
+                pass
+            total_ms.append((time.perf_counter() - started) * 1000)
+            if "ttft_ms" in response.get("timings", {}):
+                ttft_ms.append(response["timings"]["ttft_ms"])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - started
+
+    total_ms.sort()
+    ttft_ms.sort()
+    print(f"{len(total_ms)} queries from {clients} clients in {elapsed:.2f}s "
+          f"({len(total_ms) / elapsed:.1f} q/s) via the '{backend}' backend")
+    print(f"end-to-end p50={total_ms[len(total_ms) // 2]:.1f}ms "
+          f"p99={total_ms[max(0, int(len(total_ms) * 0.99) - 1)]:.1f}ms")
+    if ttft_ms:
+        print(f"time to first token p50={ttft_ms[len(ttft_ms) // 2]:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub LLM server and pipeline benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    default_port = int(LLM_STUB_URL.rsplit(":", 1)[-1].split("/")[0])
+    serve = sub.add_parser("serve", help="run the OpenAI-compatible stub server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=default_port)
+    serve.add_argument("--latency-ms", type=float, default=0, help="delay before the first token")
+    serve.add_argument("--token-ms", type=float, default=0, help="delay per generated token")
+    serve.add_argument("--fail-every", type=int, default=0, help="answer every Nth request with 429")
+
+    bench = sub.add_parser("bench", help="benchmark the full query pipeline")
+    bench.add_argument("--clients", type=int, default=20)
+    bench.add_argument("--requests", type=int, default=5)
+    bench.add_argument("--backend", default="local", choices=["local", "stub", "openrouter"])
+    bench.add_argument("--query", default="emails about invoices")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        server = make_server(args.host, args.port, args.latency_ms, args.token_ms, args.fail_every)
+        print(f"Stub LLM server listening on http://{args.host}:{args.port}/v1")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        _bench(args.clients, args.requests, args.backend, args.query)
+
+
+if __name__ == "__main__":
+    main()
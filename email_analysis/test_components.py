@@ -5,9 +5,65 @@ Test script to verify all components work correctly
 
 import os
 import sys
+import shutil
+import tempfile
+from datetime import date
+import doc_store
+import snapshot
 from email_processor import EmailProcessor
 from vector_db_manager import VectorDBManager
 
+def make_emails(n, date_of=lambda i: date(2024, 1, 1 + i % 28)):
+    """`n` synthetic emails with distinct bodies, sent at 10:00 UTC on `date_of(i)`"""
+    processor = EmailProcessor()
+    topics = ["invoice payment overdue", "project deadline meeting", "server outage report",
+              "holiday party planning", "contract renewal terms", "quarterly budget review"]
+    emails = []
+    for i in range(n):
+        email = {
+            "subject": f"{topics[i % len(topics)]} {i}",
+            "from": f"user{i % 17}@company{i % 5}.com",
+            "to": "team@example.com",
+            "date": date_of(i).strftime("%d %b %Y 10:00:00 +0000"),
+            "body": f"Message {i} about {topics[i % len(topics)]} with reference number {i * 7919}.",
+        }
+        email["text_content"] = processor._create_text_content(email)
+        emails.append(email)
+    return emails
+
+def component_test(title):
+    """Run the decorated test in a scratch directory: it gets `open_collection(name, **options)`"""
+    def decorator(test):
+        def run():
+            print(f"\nTesting {title}...")
+            db_path = tempfile.mkdtemp()
+            try:
+                test(lambda name="emails", **options: VectorDBManager(collection_name=name, db_path=db_path,
+                                                                      **options))
+            except Exception as e:
+                print(f"❌ {title} test failed: {e}")
+            finally:
+                shutil.rmtree(db_path, ignore_errors=True)
+        run.__doc__ = test.__doc__
+        return run
+    return decorator
+
+def check(ok, passed, failed=None):
+    print(f"✅ {passed}" if ok else f"❌ {failed or passed}")
+    return ok
+
+def ranking(results):
+    """(id, score) per hit, one list per query"""
+    return [[(r["id"], round(r["score"], 5)) for r in rows] for rows in results]
+
+def same_ranking(a, b):
+    """Same scores in the same order; hits with equal scores may come in any order (the cut-off score excepted)"""
+    if [score for _, score in a] != [score for _, score in b]:
+        return False
+    last = a[-1][1] if a else None
+    return all({i for i, s in a if s == score} == {i for i, s in b if s == score}
+               for _, score in a if score != last)
+
 def test_email_processor():
     """Test email processing functionality"""
     print("Testing Email Processor...")
@@ -80,6 +136,231 @@ def test_integration(emails, vector_db):
     except Exception as e:
         print(f"❌ Integration test failed: {e}")
 
+@component_test("Date-Bounded Search")
+def test_date_bounds(open_collection):
+    """Test that a date-only upper bound includes its whole day"""
+    vector_db = open_collection()
+    vector_db.add_emails(make_emails(3, date_of=lambda i: date(2024, 1, 5 + i)))  # Jan 5, 6 and 7, 10:00 UTC
+
+    for date_to in ("2024-01-07", date(2024, 1, 7)):
+        results = vector_db.search_emails("message", 10, date_from="2024-01-05", date_to=date_to)
+        check(len(results) == 3, f"date_to={date_to!r} includes all of Jan 7",
+              f"date_to={date_to!r} returned {len(results)} of 3 emails")
+
+    results = vector_db.search_emails("message", 10, date_to="2024-01-07T00:00:00")
+    check(len(results) == 2, "A bound with a time is exact",
+          f"date_to with a time returned {len(results)} of 2 emails")
+
+    # near-duplicates have no vector of their own: they are found through their representative's
+    deduplicated = open_collection("deduplicated", deduplicate=True)
+    body = " ".join(f"clause {n} of the supplier agreement renewal" for n in range(8))
+    copies = [dict(make_emails(1)[0], body=body, date=day) for day in
+              ("10 Jan 2024 10:00:00 +0000", "10 Jun 2024 10:00:00 +0000")]
+    deduplicated.add_emails(copies, email_ids=["january", "june"])
+    june = deduplicated.search_emails("supplier agreement", 10, date_from="2024-06-01", date_to="2024-06-30")
+    check([r["id"] for r in june] == ["june"], "A duplicate dated in range is found through its representative",
+          f"June search returned {[r['id'] for r in june]} instead of the June copy")
+    january = deduplicated.search_emails("supplier agreement", 10, date_from="2024-01-01", date_to="2024-01-31",
+                                         collapse_duplicates=False)
+    check([r["id"] for r in january] == ["january"], "Duplicates dated out of range are not listed",
+          f"January search returned {[r['id'] for r in january]}")
+
+@component_test("Near-Duplicate Clusters")
+def test_near_duplicates(open_collection):
+    """Test that near-identical bodies share one vector and that deleting the representative promotes a copy"""
+    vector_db = open_collection(deduplicate=True, partition_by="time")
+    body = " ".join(f"clause {n} of the supplier agreement renewal" for n in range(8))
+    months = {"march": 3, "april": 4, "may": 5}
+    copies = [dict(email, body=body + (f" Regards, {name}" if name != "march" else ""),
+                   date=date(2024, month, 10).strftime("%d %b %Y 10:00:00 +0000"))
+              for email, (name, month) in zip(make_emails(3), months.items())]
+    vector_db.add_emails(copies + make_emails(1), email_ids=list(months) + ["other"])
+
+    results = vector_db.search_emails("supplier agreement", 2)
+    check(vector_db.index.ntotal == 2 and results[0]["id"] == "march" and results[0].get("duplicate_count") == 2,
+          "Copies link to the first one and share its vector",
+          f"{vector_db.index.ntotal} vectors, top result {results[0]['id']} with {results[0].get('duplicate_count')} copies")
+    expanded = [r["id"] for r in vector_db.search_emails("supplier agreement", 3, collapse_duplicates=False)]
+    check(expanded[0] == "march" and sorted(expanded[1:]) == ["april", "may"],
+          "Expanded results list the copies after their representative",
+          f"expanded results: {expanded}")
+
+    vector_db.delete_emails(["march"])
+    results = vector_db.search_emails("supplier agreement", 1)
+    promoted = results[0]["id"] if results else None
+    check(promoted in ("april", "may") and promoted in vector_db.id_map and results[0].get("duplicate_count") == 1,
+          f"Deleting the representative promotes {promoted}", f"after deleting the representative got {promoted}")
+    # the promoted copy's vector still sits in the March shard
+    dated = vector_db.search_emails("supplier agreement", 5, date_from=date(2024, months[promoted], 1),
+                                    date_to=date(2024, months[promoted], 28))
+    check([r["id"] for r in dated] == [promoted], "The promoted copy is found by its own date",
+          f"date-bounded search returned {[r['id'] for r in dated]}")
+
+@component_test("Compressed Storage")
+def test_doc_store(open_collection):
+    """Test that compressed rows decode to the stored text and metadata"""
+    vector_db = open_collection(compress_documents=True)
+    emails = make_emails(600)
+    for email in emails[::2]:
+        email["text_content"] = email["body"]  # not rebuildable from the metadata
+    ids = [str(i) for i in range(len(emails))]
+    vector_db.add_emails(emails, email_ids=ids)
+    vector_db.compact_storage()  # trains the dictionary and re-encodes with it
+
+    with vector_db._conn() as conn:
+        rows = dict((row[0], row[1:]) for row in conn.execute("SELECT id, document, metadata_json FROM emails"))
+        check(all(isinstance(metadata, bytes) and metadata[:1] == doc_store.MAGIC for _, metadata in rows.values()),
+              "Metadata is stored compressed")
+        check(all((rows[ids[i]][0] is None) == (i % 2 == 1) for i in range(len(emails))),
+              "Only documents that can't be rebuilt from the metadata are stored")
+        decoded = [doc_store.decode_row(conn, *rows[email_id]) for email_id in ids]
+        expected = [(email["text_content"], {k: str(v) for k, v in email.items() if k != "text_content"})
+                    for email in emails]
+        check(decoded == expected, "Rows decode to the original text and metadata")
+
+        document, metadata = expected[1]
+        check(doc_store.rebuild_document(metadata) == document, "rebuild_document matches the processor's text")
+        plain = doc_store.encode_row(conn, *expected[0], None)
+        check(isinstance(plain[0], str) and doc_store.decode_row(conn, *plain) == expected[0],
+              "Plain text rows round-trip")
+
+@component_test("Snapshot Export and Import")
+def test_snapshot(open_collection):
+    """Test that a replica imported from a snapshot searches like its source"""
+    source = open_collection()
+    emails = make_emails(40)
+    source.add_emails(emails, email_ids=[str(i) for i in range(len(emails))])
+    source.delete_emails(["3", "17"])
+    snapshot_dir = os.path.join(os.path.dirname(source.db_dir), "snapshot")
+    snapshot.export_snapshot(source, snapshot_dir)
+
+    replica = open_collection("replica")
+    replica.add_emails(make_emails(5))  # replaced by the import
+    snapshot.import_snapshot(replica, snapshot_dir)
+    kept = [email_id for email_id in source.id_map if email_id not in ("3", "17")]
+    check(replica.id_map == kept and replica.index.ntotal == len(kept),
+          "The replica has the source's vectors without the deleted emails",
+          f"replica id_map {replica.id_map[:5]}... ({replica.index.ntotal} vectors), expected {len(kept)}")
+    queries = ["invoice payment overdue", "server outage", "quarterly budget review 29"]
+    check(all(same_ranking(a, b) for a, b in zip(ranking(source.search_emails_batch(queries, 5)),
+                                                 ranking(replica.search_emails_batch(queries, 5)))),
+          "The replica returns the source's search results")
+
+@component_test("Index Repair")
+def test_index_repair(open_collection):
+    """Test that an index file out of step with the committed emails is repaired on load"""
+    def copy_index(vector_db, to_dir):
+        shutil.rmtree(to_dir, ignore_errors=True)
+        os.makedirs(to_dir)
+        if os.path.exists(vector_db.index_file):
+            shutil.copy(vector_db.index_file, to_dir)
+        if os.path.exists(vector_db.shard_dir):
+            shutil.copytree(vector_db.shard_dir, os.path.join(to_dir, "shards"))
+
+    def restore_index(vector_db, from_dir):
+        for name in os.listdir(from_dir):
+            target = os.path.join(vector_db.db_dir, name)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+                shutil.copytree(os.path.join(from_dir, name), target)
+            else:
+                shutil.copy(os.path.join(from_dir, name), target)
+
+    emails = make_emails(30)
+    queries = ["invoice payment overdue", "holiday party planning 27"]
+    for partition_by in ("none", "hash"):
+        vector_db = open_collection(partition_by, partition_by=partition_by)
+        saved = os.path.join(os.path.dirname(vector_db.db_dir), f"{partition_by}-saved")
+        vector_db.add_emails(emails[:10])
+        copy_index(vector_db, saved)
+        vector_db.add_emails(emails[10:])
+        expected = ranking(vector_db.search_emails_batch(queries, 5))
+
+        # the process died after the SQLite commit, before the index was written
+        restore_index(vector_db, saved)
+        reopened = open_collection(partition_by, partition_by=partition_by)
+        check(reopened.index.ntotal == len(reopened.id_map) == 30
+              and all(same_ranking(a, b) for a, b in
+                      zip(expected, ranking(reopened.search_emails_batch(queries, 5)))),
+              f"A lagging {partition_by} index is re-embedded on load",
+              f"{partition_by}: {reopened.index.ntotal} vectors for {len(reopened.id_map)} ids after repair")
+
+        # vectors written past the committed tail belong to no email
+        with reopened._conn() as conn:
+            conn.execute("DELETE FROM vector_ids WHERE pos >= 25")
+        reopened = open_collection(partition_by, partition_by=partition_by)
+        check(reopened.index.ntotal == len(reopened.id_map) == 25,
+              f"Uncommitted {partition_by} vectors are dropped on load",
+              f"{partition_by}: {reopened.index.ntotal} vectors for {len(reopened.id_map)} ids after repair")
+
+@component_test("Partitioned Index")
+def test_partitioned_search(open_collection):
+    """Test that sharded indexes return the same ranking as the flat index"""
+    emails = make_emails(120, date_of=lambda i: date(2024, 1 + i % 6, 1 + i % 28))  # six time shards
+    queries = ["invoice payment overdue", "server outage", "reference number 7919", "budget"]
+    rankings = {}
+    for partition_by in ("none", "hash", "time"):
+        vector_db = open_collection(partition_by, partition_by=partition_by, deduplicate=False)
+        vector_db.add_emails(emails, email_ids=[f"email-{i}" for i in range(len(emails))])
+        rankings[partition_by] = ranking(vector_db.search_emails_batch(queries, 10))
+        scores = [[score for _, score in rows] for rows in rankings[partition_by]]
+        if not all(row == sorted(row, reverse=True) for row in scores):
+            print(f"❌ {partition_by}: merged results are not ordered by score")
+
+    for partition_by in ("hash", "time"):
+        check(all(map(same_ranking, rankings[partition_by], rankings["none"])),
+              f"{partition_by} partitioning matches the flat index",
+              f"{partition_by} partitioning returned a different ranking")
+
+@component_test("Index Rebuild")
+def test_index_rebuild(open_collection):
+    """Test that a rebuild with concurrent deletes and adds keeps search results, and rolls back on failure"""
+    from index_rebuild import IndexRebuild
+
+    vector_db = open_collection(deduplicate=False)
+    emails = make_emails(160)
+    vector_db.add_emails(emails[:120], email_ids=[f"email-{i}" for i in range(120)])
+    vector_db.delete_emails([f"email-{i}" for i in range(0, 120, 4)])
+    queries = ["invoice payment overdue", "server outage", "contract renewal", "budget"]
+    expected = []
+
+    class ChangingRebuild(IndexRebuild):
+        """Deletes and adds emails while the first batch is being copied"""
+        def _copy(self, new, positions, model=None, locked=False):
+            if not expected:
+                vector_db.delete_emails([f"email-{i}" for i in range(1, 120, 4)])
+                vector_db.add_emails(emails[120:], email_ids=[f"email-{i}" for i in range(120, 160)])
+                expected.extend(ranking(vector_db.search_emails_batch(queries, 10)))
+            super()._copy(new, positions, model, locked)
+
+    rebuild = ChangingRebuild(vector_db, batch_size=16)
+    if not check(rebuild.run() and vector_db._generation == 1,
+                 f"Rebuilt: {rebuild.stats.get('vectors_before')} -> {rebuild.stats.get('vectors_after')} vectors",
+                 f"Rebuild did not complete: {rebuild.error}"):
+        return
+
+    rankings = ranking(vector_db.search_emails_batch(queries, 10))
+    check(all(map(same_ranking, rankings, expected)), "Search results are unchanged by the rebuild",
+          "Search results changed after the rebuild")
+
+    found = {r["id"] for r in vector_db.search_emails("message", 200)}
+    deleted = {f"email-{i}" for i in range(120) if i % 4 in (0, 1)}
+    added = {f"email-{i}" for i in range(120, 160)}
+    # the 90 live at the start plus the 40 added; emails deleted meanwhile keep their vectors until the next rebuild
+    check(added <= found and not (deleted & found) and vector_db.index.ntotal == 90 + 40,
+          "Emails added during the rebuild are searchable, deleted ones are not",
+          "Emails added or deleted during the rebuild are out of step")
+
+    print("(the next failure is simulated)")
+    failing = IndexRebuild(vector_db)
+    failing._commit = lambda *args: (_ for _ in ()).throw(RuntimeError("simulated failure"))
+    failing.run()
+    kept = open_collection(deduplicate=False)
+    check(failing.status == "failed" and vector_db._generation == 1 and kept._generation == 1
+          and not os.path.exists(os.path.join(vector_db.db_dir, "gen-2"))
+          and ranking(kept.search_emails_batch(queries, 10)) == rankings,
+          "A failed rebuild leaves the current index in place", "A failed rebuild changed the collection")
+
 def main():
     """Run all tests"""
     print("🧪 Running Component Tests\n")
@@ -92,6 +373,20 @@ def main():
     
     # Test integration
     test_integration(emails, vector_db)
+
+    test_date_bounds()
+
+    test_near_duplicates()
+
+    test_doc_store()
+
+    test_snapshot()
+
+    test_index_repair()
+
+    test_partitioned_search()
+
+    test_index_rebuild()
     
     print("\n🎉 Tests completed!")
     print("\nTo run the full application:")
@@ -1,50 +1,342 @@
 import os
 import json
+import time
 import uuid
+import zlib
+import shutil
+import struct
 import sqlite3
-from typing import List, Dict, Any
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Iterable, Tuple
 import threading
 
-import faiss                         # pip install faiss-cpu  (or faiss-gpu)
-from sentence_transformers import SentenceTransformer
+import numpy as np
 
-from config import VECTOR_DB_PATH, COLLECTION_NAME, EMBEDDING_MODEL
+from config import VECTOR_DB_PATH, COLLECTION_NAME, EMBEDDING_MODEL, EMBEDDING_DIM
+from rwlock import ReadWriteLock
+import analytics
+import corpus_summarizer
+import contact_directory
+import email_threads
+import mail_sync
+import near_duplicates
+import mbox_scan
+import doc_store
+from partitioned_index import PartitionedIndex
+from email_processor import date_timestamp, date_upper_bound, TEXT_SKIPPED_FIELDS
+from config import (CHUNKING_ENABLED, CHUNK_SIZE_WORDS, CHUNK_OVERLAP_WORDS,
+                    MAX_CHUNKS_PER_EMAIL, CHUNK_SCORE_AGGREGATION, THREAD_COLLAPSE_OVERFETCH,
+                    INGEST_BATCH_SIZE, NEAR_DUP_ENABLED, DOC_COMPRESSION,
+                    INDEX_PARTITION_BY, INDEX_SHARDS, INDEX_SEGMENT_VECTORS, INDEX_TIME_BUCKET_MONTHS)
+
+PARTITION_SCHEMES = ("none", "hash", "segment", "time")
+
+# faiss and sentence_transformers (torch) take seconds to import, so both are
+# pulled in on first use instead of when this module is imported.
+_faiss_module = None
+_models = {}
+_models_lock = threading.Lock()
+_shared_manager = None
+_shared_manager_lock = threading.Lock()
+
+
+def _faiss():
+    """Import faiss on first use."""
+    global _faiss_module
+    if _faiss_module is None:
+        import faiss                 # pip install faiss-cpu  (or faiss-gpu)
+        _faiss_module = faiss
+    return _faiss_module
+
+
+def load_embedding_model(name: str = EMBEDDING_MODEL):
+    """Load (once per process) and return the SentenceTransformer called `name`."""
+    with _models_lock:
+        if name not in _models:
+            from sentence_transformers import SentenceTransformer
+            _models[name] = SentenceTransformer(name, device="cpu")
+        return _models[name]
+
+
+def get_shared_manager() -> "VectorDBManager":
+    """Return the process-wide manager so every session shares one model and one index."""
+    global _shared_manager
+    with _shared_manager_lock:
+        if _shared_manager is None:
+            _shared_manager = VectorDBManager()
+            # load the embedding model off the caller's thread so the first page renders quickly
+            _shared_manager.warm_up(background=True)
+        return _shared_manager
 
 
 class VectorDBManager:
     """Manage FAISS vector database for email storage and retrieval."""
 
-    def __init__(self):
+    def __init__(self, chunking: bool = CHUNKING_ENABLED, deduplicate: bool = NEAR_DUP_ENABLED,
+                 compress_documents: bool = DOC_COMPRESSION,
+                 collection_name: str = COLLECTION_NAME, db_path: str = VECTOR_DB_PATH,
+                 partition_by: str = INDEX_PARTITION_BY):
+        if partition_by not in PARTITION_SCHEMES:
+            raise ValueError(f"partition_by must be one of {PARTITION_SCHEMES}, not {partition_by!r}")
         # folders / files
-        self.db_dir        = os.path.join(VECTOR_DB_PATH, COLLECTION_NAME)
+        self.collection_name = collection_name
+        self.db_dir        = os.path.join(db_path, collection_name)
         self.index_file    = os.path.join(self.db_dir, "faiss.index")
+        self.shard_dir     = os.path.join(self.db_dir, "shards")        # partitioned layout, see partitioned_index
         self.meta_file     = os.path.join(self.db_dir, "meta.sqlite")
-        self.id_map_file   = os.path.join(self.db_dir, "id_map.json")  # new: store list of UUIDs by FAISS index
+        self.id_map_file   = os.path.join(self.db_dir, "id_map.json")  # legacy; the map now lives in meta.sqlite
 
-        # embedding model
-        self.embedding_model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
-        self.dim             = self.embedding_model.get_sentence_embedding_dimension()
+        # embedding model (loaded on first encode, see `embedding_model`); a collection
+        # keeps the model it was embedded with until `index_rebuild` re-embeds it
+        self.model_name      = EMBEDDING_MODEL
+        self._embedding_model = None
+        self.dim             = EMBEDDING_DIM
 
         # runtime handles
-        self.index = None           # faiss.IndexFlatIP
-        self._faiss_lock = threading.Lock()  # Lock for thread-safe FAISS writes
-        self.id_map = []           # list of UUID strings, index = FAISS vector index
+        self._index = None          # faiss.IndexFlatIP, loaded on first access
+        self._load_lock = threading.Lock()   # guards lazy model / index loading
+        self._rw_lock = ReadWriteLock()      # concurrent searches, one writer (index + id_map + SQLite)
+        self.id_map = []           # list of UUID strings, index = FAISS vector index (mirrors vector_ids)
+        self.chunking = chunking   # embed subject+body windows instead of one truncated string
+        self.deduplicate = deduplicate  # embed one representative per near-duplicate cluster
+        self.compress_documents = compress_documents  # see doc_store
+        self._tombstones = 0       # emails flagged deleted whose vectors are still indexed
+        self.partition_by = partition_by  # "none" (one flat index) or how vectors are spread over shards
+        self._generation = 0       # index files in use: 0 = db_dir itself, n = db_dir/gen-n (see index_rebuild)
+        self._index_epoch = 0      # bumped when the index is emptied, so a running rebuild knows to give up
+        self._rebuild_lock = threading.Lock()
 
         self._initialize_db()
         self._load_id_map()
 
-    def _initialize_db(self):
-        """Create dir, load or build FAISS index, and set up metadata store."""
-        os.makedirs(self.db_dir, exist_ok=True)
+    @property
+    def embedding_model(self):
+        """SentenceTransformer, loaded on first use."""
+        if self._embedding_model is None:
+            with self._load_lock:
+                if self._embedding_model is None:
+                    model = load_embedding_model(self.model_name)
+                    self.dim = model.get_sentence_embedding_dimension()
+                    self._embedding_model = model
+        return self._embedding_model
+
+    @property
+    def index(self):
+        """FAISS index, read from disk (or created empty) on first use."""
+        if self._index is None:
+            with self._load_lock:
+                if self._index is None:
+                    self._index = self._load_index()
+        return self._index
+
+    def _load_index(self):
+        """
+        Read the index from disk, or build an empty one (cosine using L2‑normalised
+        vectors). A stored index in another layout than `partition_by` is converted.
+        """
+        if PartitionedIndex.exists(self.shard_dir):
+            index = PartitionedIndex.load(self.shard_dir)
+        elif os.path.exists(self.index_file):
+            index = _faiss().read_index(self.index_file)
+        else:
+            index = self._new_index()
+            self._write_index(index)
+        self._repair_index(index)
+        if self._layout(index) != self.partition_by:
+            index = self._convert_index(index)
+        return index
+
+    def _new_index(self, partition_by: Optional[str] = None, dim: Optional[int] = None,
+                   shard_dir: Optional[str] = None):
+        """An empty index in layout `partition_by` (default: the configured one)."""
+        partition_by = partition_by or self.partition_by
+        if partition_by == "none":
+            return _faiss().IndexFlatIP(dim or self.dim)  # inner‑product
+        return PartitionedIndex(shard_dir or self.shard_dir, dim or self.dim, partition_by)
+
+    def _index_paths(self, generation: int) -> Tuple[str, str]:
+        """(flat index file, shard directory) of an index generation."""
+        base = self.db_dir if generation == 0 else os.path.join(self.db_dir, f"gen-{generation}")
+        return os.path.join(base, "faiss.index"), os.path.join(base, "shards")
+
+    def _remove_generations(self, keep: int):
+        """Delete the index files of every generation but `keep` (left behind by a rebuild or a crash)."""
+        for name in os.listdir(self.db_dir):
+            if name.startswith("gen-") and name != f"gen-{keep}":
+                shutil.rmtree(os.path.join(self.db_dir, name), ignore_errors=True)
+        if keep != 0:
+            index_file, shard_dir = self._index_paths(0)
+            if os.path.exists(index_file):
+                os.remove(index_file)
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+    def _switch_generation(self, generation: int, index, id_map: List[str], tombstones: int):
+        """Serve from an index generation whose switch SQLite has committed (write lock held)."""
+        with self._load_lock:
+            self._index = index
+            self.id_map = id_map
+            self.index_file, self.shard_dir = self._index_paths(generation)
+            self._generation = generation
+            self.partition_by = self._layout(index)
+            self._tombstones = tombstones
 
-        # 1) FAISS index (cosine using L2‑normalised vectors)
-        if os.path.exists(self.index_file):
-            self.index = faiss.read_index(self.index_file)
+    @staticmethod
+    def _layout(index) -> str:
+        return index.partition_by if isinstance(index, PartitionedIndex) else "none"
+
+    def _convert_index(self, old):
+        """Copy every vector into a new index in the configured layout; positions don't change."""
+        print(f"Converting vector index from {self._layout(old)} to {self.partition_by} partitioning")
+        index = self._new_index()
+        if isinstance(old, PartitionedIndex) and isinstance(index, PartitionedIndex):
+            # the new files must not overwrite the old version's before the manifest switches
+            index._version = old._version
+        for start in range(0, old.ntotal, 100_000):
+            block = old.reconstruct_n(start, min(100_000, old.ntotal - start))
+            self._add_to_index(index, block, self.id_map[start:start + len(block)])
+        self._write_index(index)
+        # the new layout is complete on disk before the old one goes; at startup the shard manifest wins
+        if isinstance(index, PartitionedIndex):
+            if os.path.exists(self.index_file):
+                os.remove(self.index_file)
+        else:
+            shutil.rmtree(self.shard_dir, ignore_errors=True)
+        return index
+
+    def _partition_keys(self, partition_by: str, start_pos: int, owners: List[str]) -> List[str]:
+        """Shard of each vector appended at `start_pos`.. and owned by `owners` (already committed)."""
+        if partition_by == "hash":
+            return [f"h{zlib.crc32(owner.encode('utf-8')) % INDEX_SHARDS}" for owner in owners]
+        if partition_by == "time":
+            dates = {}
+            unique = list(set(owners))
+            with self._conn() as conn:
+                for start in range(0, len(unique), 500):
+                    batch = unique[start:start + 500]
+                    dates.update(conn.execute(
+                        f"SELECT id, date_ts FROM emails WHERE id IN ({','.join('?' * len(batch))})", batch))
+            return [self._time_key(dates.get(owner)) for owner in owners]
+        return [f"s{pos // INDEX_SEGMENT_VECTORS}" for pos in range(start_pos, start_pos + len(owners))]
+
+    @staticmethod
+    def _time_key(date_ts: Optional[int]) -> str:
+        """Time shard of a date: "tYYYY-MM" of the first month of its INDEX_TIME_BUCKET_MONTHS-month bucket."""
+        if date_ts is None:
+            return "undated"
+        parsed = datetime.fromtimestamp(date_ts, tz=timezone.utc)
+        month = parsed.year * 12 + parsed.month - 1
+        month -= month % INDEX_TIME_BUCKET_MONTHS
+        return f"t{month // 12:04d}-{month % 12 + 1:02d}"
+
+    def _add_to_index(self, index, embs, owners: List[str]):
+        """Append vectors owned by `owners` to `index`, routed to their shards if it is partitioned."""
+        if isinstance(index, PartitionedIndex):
+            index.add(embs, self._partition_keys(index.partition_by, index.ntotal, owners))
         else:
-            self.index = faiss.IndexFlatIP(self.dim)  # inner‑product
-            faiss.write_index(self.index, self.index_file)
+            index.add(embs)
 
-        # 2) Initialize SQLite DB (create tables if needed)
+    def _write_index(self, index=None, index_file: Optional[str] = None):
+        """Write the index to a temp file and rename it, so a crash never leaves a torn index file."""
+        index = index if index is not None else self.index
+        if isinstance(index, PartitionedIndex):
+            index.save()  # changed shards only, switched over by an atomic manifest rename
+            return
+        index_file = index_file or self.index_file
+        tmp = index_file + ".tmp"
+        _faiss().write_index(index, tmp)
+        os.replace(tmp, index_file)
+
+    def _repair_index(self, index):
+        """
+        Bring a freshly read index in line with vector_ids, the committed record.
+        SQLite commits before the index file is written, so after a crash the
+        file can only lag behind: the missing tail is re-embedded from the stored
+        documents. Vectors past the committed tail (written by the older
+        index-first order) belong to no email and are cut off.
+        """
+        committed = len(self.id_map)
+        if index.ntotal > committed:
+            print(f"Repairing vector index: dropping {index.ntotal - committed} uncommitted vectors")
+            if isinstance(index, PartitionedIndex):
+                index.truncate(committed)
+            else:
+                index.remove_ids(_faiss().IDSelectorRange(committed, index.ntotal))
+            self._write_index(index)
+        elif index.ntotal < committed:
+            print(f"Repairing vector index: re-embedding {committed - index.ntotal} missing vectors")
+            missing = self.id_map[index.ntotal:]
+            texts = self._vector_texts(range(index.ntotal, committed), missing)
+            # the embedding_model property takes _load_lock, which the caller already holds
+            embs = load_embedding_model(self.model_name).encode(
+                texts, batch_size=64, show_progress_bar=False, convert_to_numpy=True
+            ).astype("float32")
+            self._add_to_index(index, self._normalize(embs), missing)
+            self._write_index(index)
+
+    def _vector_texts(self, positions: Iterable[int], owners: List[str]) -> List[str]:
+        """The text embedded at each of `positions` (owned by `owners`), rebuilt from the stored emails."""
+        with self._conn() as conn:
+            first_pos = {}
+            for email_id in set(owners):
+                first_pos[email_id] = conn.execute(
+                    "SELECT MIN(pos) FROM vector_ids WHERE email_id = ?", (email_id,)
+                ).fetchone()[0]
+            rows = self._fetch_rows(set(owners), include_deleted=True)
+        texts = []
+        for pos, email_id in zip(positions, owners):
+            row = rows[email_id]
+            chunks = self._chunk_texts(row["metadata"], row["document"])
+            # an email's chunks sit at consecutive positions, in order
+            texts.append(chunks[min(pos - first_pos[email_id], len(chunks) - 1)])
+        return texts
+
+    @property
+    def index_loaded(self) -> bool:
+        return self._index is not None
+
+    def index_memory(self) -> int:
+        """Bytes held by the loaded index's vectors (0 when it isn't resident)."""
+        index = self._index
+        if index is None:
+            return 0
+        if isinstance(index, PartitionedIndex):
+            return index.memory_bytes()
+        return index.ntotal * getattr(index, "code_size", index.d * 4)
+
+    def unload_index(self) -> bool:
+        """
+        Drop the in-memory index; the next search reads it back from disk.
+        Every write already ends with the index file written, so nothing is
+        lost. Waits for running searches and writes. Returns False if it wasn't loaded.
+        """
+        with self._rw_lock.write_lock(), self._load_lock:
+            if self._index is None:
+                return False
+            self._index = None
+            return True
+
+    def warm_up(self, background: bool = True):
+        """Load the embedding model and index ahead of the first query."""
+        def _load():
+            try:
+                _ = self.embedding_model
+                _ = self.index
+            except Exception as e:
+                print(f"Error warming up vector database: {e}")
+
+        if not background:
+            _load()
+            return None
+        thread = threading.Thread(target=_load, name="vector-db-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def _initialize_db(self):
+        """Create dir and set up metadata store; the FAISS index itself loads lazily."""
+        os.makedirs(self.db_dir, exist_ok=True)
+        self._index = None
+
+        # Initialize SQLite DB (create tables if needed)
         with self._conn() as conn:
             conn.execute(
                 """CREATE TABLE IF NOT EXISTS emails (
@@ -53,95 +345,455 @@ class VectorDBManager:
                        metadata_json TEXT
                    )"""
             )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS collection_state (
+                       key   TEXT PRIMARY KEY,
+                       value TEXT
+                   )"""
+            )
+            if self._get_state(conn, "data_version") is None:
+                self._bump_data_version(conn)
+            self._generation = int(self._get_state(conn, "index_generation") or 0)
+            self.index_file, self.shard_dir = self._index_paths(self._generation)
+            self._remove_generations(keep=self._generation)
+            stored_model = self._get_state(conn, "embedding_model")
+            if stored_model is None:
+                self._set_state(conn, "embedding_model", self.model_name)
+            elif stored_model != self.model_name:
+                print(f"Collection is embedded with {stored_model}; rebuild the index to switch to {self.model_name}")
+                self.model_name = stored_model
+            # known before the model loads, so empty indexes and snapshot checks use the right size
+            stored_dim = self._get_state(conn, "embedding_dim")
+            if stored_dim is not None:
+                self.dim = int(stored_dim)
+            elif self.model_name == EMBEDDING_MODEL:
+                self._set_state(conn, "embedding_dim", str(self.dim))
+            # FAISS position -> email id, committed together with the emails it points at
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS vector_ids (
+                       pos      INTEGER PRIMARY KEY,
+                       email_id TEXT NOT NULL
+                   )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_vector_ids_email ON vector_ids (email_id)")
+            # how far each bulk source (file, job) has been durably ingested
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+                       source   TEXT PRIMARY KEY,
+                       position INTEGER NOT NULL,
+                       records  INTEGER NOT NULL DEFAULT 0,
+                       updated  REAL NOT NULL
+                   )"""
+            )
+            self._migrate_id_map(conn)
+            # tombstones: FAISS rows can't be removed cheaply, so deleted emails are only flagged
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(emails)")}
+            if "deleted" not in columns:
+                conn.execute("ALTER TABLE emails ADD COLUMN deleted INTEGER NOT NULL DEFAULT 0")
+            # the date header as epoch seconds (NULL if unparseable), for date-bounded search
+            if "date_ts" not in columns:
+                conn.execute("ALTER TABLE emails ADD COLUMN date_ts INTEGER")
+                self._backfill_dates(conn)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_emails_date_ts ON emails (date_ts)")
+            self._tombstones = conn.execute("SELECT COUNT(*) FROM emails WHERE deleted = 1").fetchone()[0]
+            analytics.ensure_schema(conn)
+            analytics.backfill_exact_indexes(conn)
+            corpus_summarizer.ensure_schema(conn)
+            contact_directory.ensure_schema(conn)
+            contact_directory.backfill_contacts(conn)
+            email_threads.ensure_schema(conn)
+            email_threads.backfill_threads(conn)
+            mail_sync.ensure_schema(conn)
+            near_duplicates.ensure_schema(conn)
+            mbox_scan.ensure_schema(conn)
+            doc_store.ensure_schema(conn)
+
+    @staticmethod
+    def _backfill_dates(conn):
+        """Parse the dates of emails stored before `date_ts` existed."""
+        last_rowid = 0
+        while True:
+            rows = conn.execute("SELECT rowid, metadata_json FROM emails WHERE rowid > ? ORDER BY rowid LIMIT 5000",
+                                (last_rowid,)).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            conn.executemany("UPDATE emails SET date_ts = ? WHERE rowid = ?", [
+                (date_timestamp(doc_store.decode_metadata(conn, value).get("date")), rowid) for rowid, value in rows
+            ])
 
     def _conn(self):
         """Create a new SQLite connection (one per thread/operation)."""
         return sqlite3.connect(self.meta_file, timeout=30)
 
-    def _load_id_map(self):
-        """Load FAISS index to UUID mapping from JSON file."""
-        if os.path.exists(self.id_map_file):
+    @staticmethod
+    def _get_state(conn, key: str):
+        row = conn.execute("SELECT value FROM collection_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _set_state(conn, key: str, value: str):
+        conn.execute(
+            "INSERT INTO collection_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    def _bump_data_version(self, conn):
+        # a random token rather than a counter, so a deleted and recreated database never reuses one
+        self._set_state(conn, "data_version", uuid.uuid4().hex)
+
+    def get_data_version(self) -> str:
+        """Token that changes whenever the collection's contents change (for cache invalidation)."""
+        with self._conn() as conn:
+            return self._get_state(conn, "data_version") or ""
+
+    def _migrate_id_map(self, conn):
+        """Move a legacy id_map.json into vector_ids (once)."""
+        if not os.path.exists(self.id_map_file):
+            return
+        if not conn.execute("SELECT 1 FROM vector_ids LIMIT 1").fetchone():
             with open(self.id_map_file, "r", encoding="utf-8") as f:
-                self.id_map = json.load(f)
-        else:
-            self.id_map = []
+                conn.executemany("INSERT INTO vector_ids (pos, email_id) VALUES (?, ?)", enumerate(json.load(f)))
+            conn.commit()
+        os.remove(self.id_map_file)
 
-    def _save_id_map(self):
-        """Save FAISS index to UUID mapping to JSON file."""
-        with open(self.id_map_file, "w", encoding="utf-8") as f:
-            json.dump(self.id_map, f, ensure_ascii=False, indent=2)
+    def _load_id_map(self):
+        """Load the FAISS index to UUID mapping from SQLite."""
+        with self._conn() as conn:
+            self.id_map = [row[0] for row in conn.execute("SELECT email_id FROM vector_ids ORDER BY pos")]
+
+    def get_checkpoint(self, source: str) -> Optional[Tuple[int, int]]:
+        """(position, records) durably ingested from `source`, or None if it was never started."""
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT position, records FROM ingest_checkpoints WHERE source = ?", (source,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def clear_checkpoint(self, source: str):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM ingest_checkpoints WHERE source = ?", (source,))
 
     @staticmethod
     def _normalize(vecs):
         """L2‑normalise so dot‑product == cosine similarity."""
-        faiss.normalize_L2(vecs)
+        _faiss().normalize_L2(vecs)
         return vecs
 
-    def add_emails(self, emails: List[Dict[str, Any]]) -> bool:
+    def _chunk_texts(self, entry: Dict[str, Any], text: str) -> List[str]:
+        """
+        Split an email into bounded windows for embedding.
+        The first chunk carries the header fields, later ones repeat the subject so
+        every window keeps some context. Entries without a body embed `text` as-is.
+        """
+        body = str(entry.get("body") or "")
+        if not self.chunking or not body.strip():
+            return [text]
+
+        words = body.split()
+        subject = str(entry.get("subject") or "")
+        header = " | ".join(
+            f"{k}: {v}" for k, v in entry.items()
+            # same fields as EmailProcessor._create_text_content, minus the body chunked below
+            if k not in ("text_content", "body") and k not in TEXT_SKIPPED_FIELDS and v is not None
+        )
+        step = max(1, CHUNK_SIZE_WORDS - CHUNK_OVERLAP_WORDS)
+
+        chunks = []
+        for start in range(0, len(words), step):
+            window = " ".join(words[start:start + CHUNK_SIZE_WORDS])
+            if not chunks:
+                chunks.append(f"{header} | body: {window}" if header else window)
+            else:
+                chunks.append(f"subject: {subject} | {window}" if subject else window)
+            if len(chunks) >= MAX_CHUNKS_PER_EMAIL or start + CHUNK_SIZE_WORDS >= len(words):
+                break
+        return chunks
+
+    def add_emails(self, emails: List[Dict[str, Any]], batch_id: Optional[str] = None,
+                   email_ids: Optional[List[str]] = None,
+                   checkpoint: Optional[Tuple[str, int]] = None, embed: bool = True) -> bool:
         """
         Insert new emails.
         Each `email` dict must contain a 'text_content' field; other keys become metadata.
+        With chunking enabled one email may own several vectors; `id_map` then holds
+        the parent id once per chunk.
+        The vectors are recorded under `batch_id` (one upload; a fresh id by default)
+        so corpus summaries can be cached per batch.
+        `email_ids` (parallel to `emails`) pre-assigns ids, e.g. for the sync manifest.
+        `checkpoint` (source, position) is committed in the same transaction as the
+        emails, so a resumed import continues exactly after the last stored batch.
+        With deduplication on, near-duplicates of an embedded email are stored
+        and counted but not embedded; search reaches them through their representative.
+        With `embed=False` only metadata is stored (counts, contacts, threads);
+        `embed_stored` adds the vectors later.
         """
         try:
-            documents, metadatas, ids = [], [], []
-            for entry in emails:
+            documents, metadatas, ids, entries = [], [], [], []
+            for position, entry in enumerate(emails):
                 text = entry.get("text_content", "")
                 if not text:
                     continue
+                email_id = email_ids[position] if email_ids else str(uuid.uuid4())
                 documents.append(text)
                 metadatas.append({k: str(v) for k, v in entry.items() if k != "text_content"})
-                ids.append(str(uuid.uuid4()))
+                ids.append(email_id)
+                entries.append(entry)
 
             if not documents:
+                if checkpoint is not None:
+                    # nothing indexable in this batch, but the source still moved on
+                    with self._conn() as conn:
+                        self._save_checkpoint(conn, checkpoint, 0)
                 return False
 
-            # embeddings
-            embs = self.embedding_model.encode(
-                documents, batch_size=64, show_progress_bar=False, convert_to_numpy=True
-            ).astype("float32")
-            embs = self._normalize(embs)
+            links, chunk_owners, embs = self._prepare_vectors(ids, entries, documents) if embed else ({}, [], None)
 
-            # add to FAISS with thread-safe lock
-            with self._faiss_lock:
-                self.index.add(embs)
-                faiss.write_index(self.index, self.index_file)
+            # encoding above runs unlocked; index, metadata and id_map change under the write lock
+            with self._rw_lock.write_lock():
+                # SQLite commits first: if the process dies before the index file is
+                # written, startup re-embeds the committed tail (see `_repair_index`)
+                with self._conn() as conn:
+                    dict_id = self._compression_dict(conn)
+                    conn.executemany(
+                        "INSERT INTO emails (id, document, metadata_json, date_ts) VALUES (?, ?, ?, ?)",
+                        [
+                            (id_, *doc_store.encode_row(conn, doc, meta, dict_id), date_timestamp(meta.get("date")))
+                            for id_, doc, meta in zip(ids, documents, metadatas)
+                        ],
+                    )
+                    # same transaction: counts and address index never disagree with the stored rows
+                    analytics.update_aggregates(conn, metadatas)
+                    analytics.update_address_index(conn, ids, metadatas)
+                    contact_directory.update_contacts(conn, metadatas)
+                    email_threads.update_threads(conn, ids, metadatas)
+                    if embed:
+                        self._commit_vectors(conn, ids, entries, links, chunk_owners, batch_id)
+                    if checkpoint is not None:
+                        self._save_checkpoint(conn, checkpoint, len(documents))
+                    self._bump_data_version(conn)
+                self._append_vectors(embs, chunk_owners)
 
-            # persist metadata with new DB connection
-            with self._conn() as conn:
-                conn.executemany(
-                    "INSERT INTO emails (id, document, metadata_json) VALUES (?, ?, ?)",
-                    [
-                        (id_, doc, json.dumps(meta, ensure_ascii=False))
-                        for id_, doc, meta in zip(ids, documents, metadatas)
-                    ],
-                )
-
-            # update id_map and save it
-            self.id_map.extend(ids)
-            self._save_id_map()
-
-            print(f"Successfully added {len(documents)} emails to vector database")
+            skipped = f" ({len(links)} near-duplicates not embedded)" if links else ""
+            print(f"Successfully added {len(documents)} emails to vector database{skipped}")
             return True
 
         except Exception as e:
             print(f"Error adding emails to vector database: {e}")
             return False
 
-    def search_emails(self, query: str, n_results: int = 10) -> List[Dict[str, Any]]:
+    def embed_stored(self, email_ids: List[str], entries: List[Dict[str, Any]],
+                     batch_id: Optional[str] = None) -> bool:
+        """Embed emails stored with `embed=False`; `entries` are their full dicts (body included)."""
+        try:
+            if not email_ids:
+                return True
+            documents = [entry.get("text_content", "") for entry in entries]
+            links, chunk_owners, embs = self._prepare_vectors(email_ids, entries, documents)
+            with self._rw_lock.write_lock():
+                with self._conn() as conn:
+                    self._commit_vectors(conn, email_ids, entries, links, chunk_owners, batch_id)
+                    self._bump_data_version(conn)
+                self._append_vectors(embs, chunk_owners)
+            print(f"Embedded {len(email_ids) - len(links)} stored emails")
+            return True
+        except Exception as e:
+            print(f"Error embedding stored emails: {e}")
+            return False
+
+    def _prepare_vectors(self, ids: List[str], entries: List[Dict[str, Any]], documents: List[str]):
+        """Near-duplicate links, chunk owners and normalised embeddings for a batch (no lock held)."""
+        links = {}
+        if self.deduplicate and ids:
+            with self._conn() as conn:
+                links = near_duplicates.find_representatives(conn, ids, entries)
+        chunk_texts, chunk_owners = [], []
+        for email_id, entry, text in zip(ids, entries, documents):
+            if email_id in links:
+                continue
+            for chunk in self._chunk_texts(entry, text):
+                chunk_texts.append(chunk)
+                chunk_owners.append(email_id)
+
+        embs = None
+        if chunk_texts:
+            embs = self.embedding_model.encode(
+                chunk_texts, batch_size=64, show_progress_bar=False, convert_to_numpy=True
+            ).astype("float32")
+            embs = self._normalize(embs)
+        return links, chunk_owners, embs
+
+    def _commit_vectors(self, conn, ids: List[str], entries: List[Dict[str, Any]],
+                        links: Dict[str, Tuple[str, float]], chunk_owners: List[str],
+                        batch_id: Optional[str]):
+        """Record the batch's vector ids and duplicate links (write lock held, caller's transaction)."""
+        start_pos = self.index.ntotal
+        if self.deduplicate:
+            near_duplicates.link_duplicates(conn, ids, entries, links)
+        if chunk_owners:
+            corpus_summarizer.record_batch(conn, batch_id or uuid.uuid4().hex,
+                                           start_pos, start_pos + len(chunk_owners))
+        conn.executemany("INSERT INTO vector_ids (pos, email_id) VALUES (?, ?)",
+                         enumerate(chunk_owners, start=start_pos))
+
+    def _append_vectors(self, embs, chunk_owners: List[str]):
+        """Add committed vectors to the index and write it (write lock held)."""
+        if embs is not None:
+            self._add_to_index(self.index, embs, chunk_owners)
+            self.id_map.extend(chunk_owners)
+            self._write_index()
+
+    def _compression_dict(self, conn) -> Optional[int]:
+        """Dictionary id to compress new rows with (None: compression off), trained once enough rows exist."""
+        if not self.compress_documents:
+            return None
+        dict_id = doc_store.current_dict_id(conn)
+        return dict_id or doc_store.train_dictionary(conn)
+
+    def compact_storage(self) -> Dict[str, int]:
+        """
+        Re-encode rows stored as plain text or with an older dictionary, then
+        VACUUM so the file actually shrinks. Returns sizes before and after.
+        """
+        before = os.path.getsize(self.meta_file)
+        with self._rw_lock.write_lock():
+            with self._conn() as conn:
+                dict_id = doc_store.train_dictionary(conn) or doc_store.current_dict_id(conn)
+                prefix = doc_store.MAGIC + struct.pack("<I", dict_id)
+                last_rowid = 0
+                while True:
+                    rows = conn.execute(
+                        """SELECT rowid, document, metadata_json FROM emails
+                           WHERE rowid > ? AND (typeof(metadata_json) != 'blob' OR substr(metadata_json, 1, 5) != ?)
+                           ORDER BY rowid LIMIT 1000""",
+                        (last_rowid, prefix),
+                    ).fetchall()
+                    if not rows:
+                        break
+                    last_rowid = rows[-1][0]
+                    updates = []
+                    for rowid, document, metadata_json in rows:
+                        document, metadata = doc_store.decode_row(conn, document, metadata_json)
+                        updates.append((*doc_store.encode_row(conn, document, metadata, dict_id), rowid))
+                    conn.executemany("UPDATE emails SET document = ?, metadata_json = ? WHERE rowid = ?", updates)
+                conn.execute("DELETE FROM compression_dicts WHERE dict_id != ?", (dict_id,))
+            conn = self._conn()
+            conn.execute("VACUUM")
+            conn.close()
+        return {"bytes_before": before, "bytes_after": os.path.getsize(self.meta_file)}
+
+    @staticmethod
+    def _save_checkpoint(conn, checkpoint: Tuple[str, int], records: int):
+        source, position = checkpoint
+        conn.execute(
+            """INSERT INTO ingest_checkpoints (source, position, records, updated) VALUES (?, ?, ?, ?)
+               ON CONFLICT (source) DO UPDATE SET position = excluded.position,
+                   records = records + excluded.records, updated = excluded.updated""",
+            (source, position, records, time.time()),
+        )
+
+    def ingest_stream(self, records: Iterable[Tuple[int, Dict[str, Any]]], source: str,
+                      batch_size: int = INGEST_BATCH_SIZE) -> int:
+        """
+        Add a long stream of (position, email) pairs, checkpointing after every batch.
+        Positions (row number, byte offset, ...) must increase; after an interruption,
+        calling again with the same `source` skips everything up to the last committed
+        position, e.g. `vector_db.ingest_stream(processor.iter_records(path, "mbox"), path)`.
+        Returns the number of emails added by this call.
+        """
+        done = self.get_checkpoint(source)
+        resume_after = done[0] if done else -1
+        added, batch, position = 0, [], None
+        for position, entry in records:
+            if position <= resume_after:
+                continue
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                if not self.add_emails(batch, batch_id=source, checkpoint=(source, position)):
+                    raise RuntimeError(f"failed to add emails up to position {position} of {source}")
+                added += len(batch)
+                batch = []
+        if batch:
+            if not self.add_emails(batch, batch_id=source, checkpoint=(source, position)):
+                raise RuntimeError(f"failed to add emails up to position {position} of {source}")
+            added += len(batch)
+        return added
+
+    def encode_queries(self, queries: List[str]):
+        """Embed `queries` in one batch and L2-normalise them."""
+        q_vecs = self.embedding_model.encode(
+            queries, batch_size=64, show_progress_bar=False, convert_to_numpy=True
+        ).astype("float32")
+        return self._normalize(q_vecs)
+
+    def search_emails(self, query: str, n_results: int = 10,
+                      aggregation: str = CHUNK_SCORE_AGGREGATION,
+                      collapse_threads: bool = False,
+                      collapse_duplicates: bool = True,
+                      date_from=None, date_to=None) -> List[Dict[str, Any]]:
+        """
+        Return the `n_results` best emails for `query`.
+        Chunk hits are folded into their parent email with `aggregation`
+        ("max" keeps the best chunk, "sum" rewards emails matching in several places).
+        With `collapse_threads` each conversation is returned once, as its best match.
+        A near-duplicate cluster is returned as its representative (with
+        `duplicate_count`) unless `collapse_duplicates` is off.
+        `date_from` / `date_to` (datetime, date, date string or epoch seconds, both
+        inclusive; a date without a time covers its whole UTC day) keep only emails
+        dated in that range; undated emails are left out.
+        """
+        return self.search_emails_batch([query], n_results, aggregation, collapse_threads,
+                                        collapse_duplicates, date_from, date_to)[0]
+
+    def search_emails_batch(self, queries: List[str], n_results: int = 10,
+                            aggregation: str = CHUNK_SCORE_AGGREGATION,
+                            collapse_threads: bool = False,
+                            collapse_duplicates: bool = True,
+                            date_from=None, date_to=None) -> List[List[Dict[str, Any]]]:
+        """Run several queries with one encode and one FAISS search; one result list per query."""
         try:
             if self.index.ntotal == 0:
                 print("No emails in vector database")
-                return []
+                return [[] for _ in queries]
+
+            q_vecs = self.encode_queries(queries)
+            return self.search_by_vectors(q_vecs, n_results, aggregation, collapse_threads,
+                                          collapse_duplicates, date_from, date_to)
+
+        except Exception as e:
+            print(f"[search_emails] Error: {e}")
+            return [[] for _ in queries]
 
-            q_vec = self.embedding_model.encode([query], convert_to_numpy=True).astype("float32")
-            q_vec = self._normalize(q_vec)
+    def search_by_vectors(self, q_vecs, n_results: int = 10,
+                          aggregation: str = CHUNK_SCORE_AGGREGATION,
+                          collapse_threads: bool = False,
+                          collapse_duplicates: bool = True,
+                          date_from=None, date_to=None) -> List[List[Dict[str, Any]]]:
+        """Search with already normalised query vectors (shape: n_queries x dim)."""
+        if self.index.ntotal == 0:
+            return [[] for _ in range(len(q_vecs))]
 
-            distances, indices = self.index.search(q_vec, n_results)
-            distances, indices = distances[0], indices[0]
+        # collapsing drops replies of threads already listed, so look further down the ranking
+        wanted_emails = n_results * THREAD_COLLAPSE_OVERFETCH if collapse_threads else n_results
+        k = wanted_emails * MAX_CHUNKS_PER_EMAIL if self.chunking else wanted_emails
+        # tombstoned emails still have vectors; search deeper so they don't shrink the result list
+        k = min(k + self._tombstones, k * 4)
+        per_query = []
+        dated = date_from is not None or date_to is not None
+        if dated:
+            date_from = date_timestamp(date_from) if date_from is not None else -2 ** 62
+            date_to = date_upper_bound(date_to) if date_to is not None else 2 ** 62
+        with self._rw_lock.read_lock():
+            if not dated:
+                distances, indices = self.index.search(q_vecs, min(k, self.index.ntotal))
+            else:
+                distances, indices = self._search_dated(q_vecs, k, date_from, date_to)
 
-            results = []
-            with self._conn() as conn:
-                for idx, score in zip(indices, distances):
+            # fold chunk hits into parent emails
+            for row_distances, row_indices in zip(distances, indices):
+                scores, hits = {}, {}
+                for idx, score in zip(row_indices, row_distances):
                     if idx == -1:
                         continue
 
@@ -150,51 +802,246 @@ class VectorDBManager:
                         continue
 
                     email_id = self.id_map[idx]
-                    row = conn.execute(
-                        "SELECT id, document, metadata_json FROM emails WHERE id = ?",
-                        (email_id,),
-                    ).fetchone()
-                    if row:
-                        results.append({
-                            "id": row[0],
-                            "document": row[1],
-                            "metadata": json.loads(row[2]) if row[2] else {},
-                            "score": float(score),
-                        })
+                    if email_id not in scores:
+                        scores[email_id] = float(score)
+                    elif aggregation == "sum":
+                        scores[email_id] += float(score)
                     else:
+                        scores[email_id] = max(scores[email_id], float(score))
+                    hits[email_id] = hits.get(email_id, 0) + 1
+                per_query.append((scores, hits))
+
+        # one metadata lookup for every email any query needs
+        wanted = {email_id for scores, _ in per_query for email_id in scores}
+        rows = self._fetch_rows(wanted)
+        with self._conn() as conn:
+            # only representatives have vectors, so every hit is one; their clusters come from one query
+            clusters = near_duplicates.duplicates_of(conn, rows)
+            if dated:
+                shown, clusters = self._clusters_in_range(conn, rows, clusters, date_from, date_to)
+            else:
+                shown = {email_id: email_id for email_id in rows}
+            threads = email_threads.thread_ids_for(conn, set(shown.values())) if collapse_threads else {}
+        extra = set(shown.values()) - set(rows)
+        if not collapse_duplicates:
+            extra.update(d for dups in clusters.values() for d in dups)
+        if extra:
+            rows.update(self._fetch_rows(extra))
+
+        results = []
+        for scores, hits in per_query:
+            ranked = sorted(scores, key=scores.get, reverse=True)
+            query_results = []
+            for email_id in ranked:
+                if email_id not in rows:
+                    if not self._tombstones:
                         print(f"No email found for id {email_id}")
+                    continue
+                shown_id = shown.get(email_id)
+                if shown_id is None:
+                    continue  # a representative whose cluster has nothing in the date range
+                result = dict(rows[shown_id], score=scores[email_id])
+                if self.chunking:
+                    result["chunk_hits"] = hits[email_id]
+                if shown_id in clusters:
+                    result["duplicate_count"] = len(clusters[shown_id])
+                query_results.append(result)
+                if len(query_results) >= n_results and not collapse_threads:
+                    break
+            if collapse_threads:
+                query_results = email_threads.collapse_by_thread(query_results, threads)[:n_results]
+            if not collapse_duplicates:
+                query_results = self._expand_duplicates(query_results, clusters, rows)[:n_results]
+            results.append(query_results)
+        return results
 
-            return results
+    def _search_dated(self, q_vecs, k: int, date_from: int, date_to: int):
+        """
+        FAISS search restricted to vectors of emails dated in [date_from, date_to]
+        (read lock held). A representative's vectors also count when one of its
+        near-duplicates is dated in range. A partitioned index only opens the
+        shards holding such vectors; the exact set is applied by an id selector.
+        """
+        faiss = _faiss()
+        with self._conn() as conn:
+            positions = np.fromiter((pos for (pos,) in conn.execute(
+                """SELECT v.pos FROM vector_ids v JOIN emails e ON e.id = v.email_id
+                   WHERE e.deleted = 0 AND (e.date_ts BETWEEN ?1 AND ?2 OR EXISTS (
+                       SELECT 1 FROM near_duplicates d JOIN emails de ON de.id = d.email_id
+                       WHERE d.representative_id = e.id AND de.deleted = 0 AND de.date_ts BETWEEN ?1 AND ?2))""",
+                (date_from, date_to),
+            )), dtype=np.int64)
+        if len(positions) == 0:
+            return np.zeros((len(q_vecs), 0), dtype=np.float32), np.zeros((len(q_vecs), 0), dtype=np.int64)
+        selector = faiss.IDSelectorBatch(positions)
+        params = faiss.SearchParameters(sel=selector)
+        k = min(k, len(positions))
+        if isinstance(self.index, PartitionedIndex):
+            return self.index.search(q_vecs, k, keys=self.index.keys_of(positions), params=params)
+        return self.index.search(q_vecs, k, params=params)
+
+    @staticmethod
+    def _clusters_in_range(conn, representatives, clusters: Dict[str, List[str]],
+                           date_from: int, date_to: int) -> Tuple[Dict[str, str], Dict[str, List[str]]]:
+        """
+        Keep only the cluster members dated in range. A representative dated
+        outside the range is shown as its closest in-range duplicate. Returns
+        (representative -> id to show, id shown -> its in-range duplicates).
+        """
+        members = list(set(representatives) | {d for dups in clusters.values() for d in dups})
+        dated = set()
+        for start in range(0, len(members), 500):
+            batch = members[start:start + 500]
+            dated.update(email_id for (email_id,) in conn.execute(
+                f"""SELECT id FROM emails WHERE id IN ({",".join("?" * len(batch))})
+                    AND deleted = 0 AND date_ts BETWEEN ? AND ?""",
+                [*batch, date_from, date_to],
+            ))
+        shown, in_range = {}, {}
+        for rep in representatives:
+            dups = [d for d in clusters.get(rep, ()) if d in dated]
+            if rep not in dated:
+                if not dups:
+                    continue
+                rep_shown, dups = dups[0], dups[1:]
+            else:
+                rep_shown = rep
+            shown[rep] = rep_shown
+            if dups:
+                in_range[rep_shown] = dups
+        return shown, in_range
+
+    @staticmethod
+    def _expand_duplicates(results: List[Dict[str, Any]], clusters: Dict[str, List[str]],
+                           rows: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """List each representative's near-duplicates right after it, with its score."""
+        expanded = []
+        for result in results:
+            expanded.append(result)
+            for email_id in clusters.get(result["id"], ()):
+                if email_id in rows:
+                    expanded.append(dict(rows[email_id], score=result["score"], duplicate_of=result["id"]))
+        return expanded
+
+    def get_thread(self, email_or_thread_id: str) -> List[Dict[str, Any]]:
+        """Every email of the conversation containing `email_or_thread_id` (an email or thread id), oldest first."""
+        with self._conn() as conn:
+            rows = {}
+            for email_id, document, metadata_json in email_threads.get_thread_rows(conn, email_or_thread_id):
+                document, metadata = doc_store.decode_row(conn, document, metadata_json)
+                rows[email_id] = {"id": email_id, "document": document, "metadata": metadata}
+            mbox_scan.hydrate_bodies(conn, rows)
+        return list(rows.values())
 
+    def _fetch_rows(self, email_ids, include_deleted: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Load id/document/metadata for `email_ids`, keyed by id."""
+        email_ids = list(email_ids)
+        rows = {}
+        live_only = "" if include_deleted else " AND deleted = 0"
+        with self._conn() as conn:
+            # stay well under SQLite's bound-parameter limit
+            for start in range(0, len(email_ids), 500):
+                batch = email_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for row in conn.execute(
+                    f"SELECT id, document, metadata_json FROM emails WHERE id IN ({placeholders}){live_only}",
+                    batch,
+                ):
+                    # decompressed here, i.e. only for the rows a caller asked for
+                    document, metadata = doc_store.decode_row(conn, row[1], row[2])
+                    rows[row[0]] = {"id": row[0], "document": document, "metadata": metadata}
+            # emails imported header-only keep their bodies in the mbox until shown
+            mbox_scan.hydrate_bodies(conn, rows)
+        return rows
+
+    def delete_emails(self, email_ids: List[str]) -> bool:
+        """
+        Tombstone `email_ids`: they drop out of search, lookups, counts and threads
+        at once; their vectors stay in FAISS until the index is rebuilt.
+        """
+        try:
+            email_ids = list(email_ids)
+            with self._rw_lock.write_lock():
+                with self._conn() as conn:
+                    live = []
+                    for start in range(0, len(email_ids), 500):
+                        batch = email_ids[start:start + 500]
+                        placeholders = ",".join("?" * len(batch))
+                        live.extend(conn.execute(
+                            f"SELECT id, metadata_json FROM emails WHERE id IN ({placeholders}) AND deleted = 0",
+                            batch,
+                        ).fetchall())
+                    if not live:
+                        return True
+                    ids = [row[0] for row in live]
+                    metadatas = [doc_store.decode_metadata(conn, row[1]) for row in live]
+
+                    conn.executemany("UPDATE emails SET deleted = 1 WHERE id = ?", [(i,) for i in ids])
+                    # same transaction: every derived index forgets the emails together with the flag
+                    analytics.update_aggregates(conn, metadatas, sign=-1)
+                    analytics.remove_from_address_index(conn, ids)
+                    contact_directory.remove_contacts(conn, metadatas)
+                    email_threads.remove_from_threads(conn, ids)
+                    # a deleted representative's vectors now stand for its closest duplicate
+                    promoted = near_duplicates.remove_duplicates(conn, ids)
+                    moved = []
+                    for old, new in promoted.items():
+                        conn.execute("UPDATE vector_ids SET email_id = ? WHERE email_id = ?", (new, old))
+                        moved.extend((pos, new) for (pos,) in conn.execute(
+                            "SELECT pos FROM vector_ids WHERE email_id = ?", (new,)))
+                    self._bump_data_version(conn)
+                for pos, new in moved:
+                    self.id_map[pos] = new
+                self._tombstones += len(ids)
+            print(f"Deleted {len(ids)} emails from vector database")
+            return True
         except Exception as e:
-            print(f"[search_emails] Error: {e}")
-            return []
+            print(f"Error deleting emails from vector database: {e}")
+            return False
 
     def get_collection_info(self) -> Dict[str, Any]:
         """Return basic info about the FAISS index."""
         try:
+            # counted from SQLite so rendering the sidebar never forces faiss to load
+            with self._conn() as conn:
+                count = conn.execute("SELECT COUNT(*) FROM emails WHERE deleted = 0").fetchone()[0]
             return {
-                "name": COLLECTION_NAME,
-                "count": self.index.ntotal,
+                "name": self.collection_name,
+                "count": count,
+                "vectors": len(self.id_map),
                 "path": self.db_dir,
             }
         except Exception as e:
             print(f"Error getting collection info: {e}")
             return {}
 
+    @staticmethod
+    def _clear_tables(conn):
+        """Delete every email and everything derived from them (caller's transaction)."""
+        conn.execute("DELETE FROM emails")
+        conn.execute("DELETE FROM vector_ids")
+        conn.execute("DELETE FROM ingest_checkpoints")
+        analytics.clear_exact_indexes(conn)
+        corpus_summarizer.clear_batches(conn)
+        contact_directory.clear_contacts(conn)
+        email_threads.clear_threads(conn)
+        mail_sync.clear_manifest(conn)
+        near_duplicates.clear_duplicates(conn)
+        mbox_scan.clear_messages(conn)
+
     def clear_collection(self) -> bool:
         """Remove all vectors and metadata but keep the on‑disk structure."""
         try:
-            with self._faiss_lock:
-                self.index.reset()
-                faiss.write_index(self.index, self.index_file)
+            with self._rw_lock.write_lock():
+                with self._conn() as conn:
+                    self._clear_tables(conn)
+                    self._bump_data_version(conn)
+                self._tombstones = 0
 
-            with self._conn() as conn:
-                conn.execute("DELETE FROM emails")
-
-            # Clear id_map and save
-            self.id_map = []
-            self._save_id_map()
+                self.index.reset()
+                self.id_map = []
+                self._index_epoch += 1
+                self._write_index()
 
             return True
         except Exception as e:
@@ -204,15 +1051,20 @@ class VectorDBManager:
     def delete_database(self) -> bool:
         """Delete every index/metadata file and start fresh."""
         try:
-            if os.path.exists(self.index_file):
-                os.remove(self.index_file)
-            if os.path.exists(self.meta_file):
-                os.remove(self.meta_file)
-            if os.path.exists(self.id_map_file):
-                os.remove(self.id_map_file)
+            with self._rw_lock.write_lock():
+                if os.path.exists(self.index_file):
+                    os.remove(self.index_file)
+                shutil.rmtree(self.shard_dir, ignore_errors=True)
+                if os.path.exists(self.meta_file):
+                    os.remove(self.meta_file)
+                if os.path.exists(self.id_map_file):
+                    os.remove(self.id_map_file)
 
-            self._initialize_db()
-            self.id_map = []
+                # a fresh collection is embedded with the configured model
+                self.model_name, self._embedding_model, self.dim = EMBEDDING_MODEL, None, EMBEDDING_DIM
+                self._initialize_db()
+                self.id_map = []
+                self._index_epoch += 1
             return True
         except Exception as e:
             print(f"Error deleting database: {e}")